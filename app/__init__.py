@@ -28,6 +28,16 @@ def create_app(config_class=DevelopmentConfig):
     from app.routes.management import bp as mgmt_bp
     app.register_blueprint(mgmt_bp, url_prefix='/manage')
 
+    # CLI
+    from app.services.integration_log_service import prune_integration_logs_command
+    app.cli.add_command(prune_integration_logs_command)
+    from app.services.report_job_service import prune_report_jobs_command
+    app.cli.add_command(prune_report_jobs_command)
+    from app.services.analytics_store import rebuild_analytics_command
+    app.cli.add_command(rebuild_analytics_command)
+    from app.services.vat_summary_service import rebuild_vat_summary_command
+    app.cli.add_command(rebuild_vat_summary_command)
+
     # User loader
     from app.models.user import User
     @login_manager.user_loader
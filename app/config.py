@@ -5,9 +5,55 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Large invoices (thousands of lines) are posted as one form
+    MAX_FORM_MEMORY_SIZE = 32 * 1024 * 1024
+    MAX_FORM_PARTS = 200000
+
     # Redis for Background Jobs
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
+    # PDF rendering: warm worker processes, bounded queue (503 when full)
+    PDF_RENDER_POOL = os.environ.get('PDF_RENDER_POOL', '1') == '1'
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 0)) or None  # None = CPU count
+    PDF_RENDER_QUEUE_LIMIT = int(os.environ.get('PDF_RENDER_QUEUE_LIMIT', 16))
+    PDF_RENDER_TIMEOUT = int(os.environ.get('PDF_RENDER_TIMEOUT', 30))
+
+    # Submission to the e-invoicing platform: 'rq' (Redis workers, see worker.py)
+    # or 'inprocess' (jobs run in the web process; tests and local development)
+    SUBMISSION_QUEUE = os.environ.get('SUBMISSION_QUEUE', 'rq')
+    SUBMISSION_WORKERS = int(os.environ.get('SUBMISSION_WORKERS', 4))
+    SUBMISSION_MAX_ATTEMPTS = 5
+    SUBMISSION_BACKOFF_BASE = 10    # seconds before the first retry, doubled each time
+    SUBMISSION_BACKOFF_MAX = 600
+    SUBMISSION_JOB_TIMEOUT = 120
+    # 'single': one job per invoice; 'batch': multi-invoice PDP deposits
+    SUBMISSION_MODE = os.environ.get('SUBMISSION_MODE', 'single')
+    SUBMISSION_BATCH_SIZE = 500
+    SUBMISSION_BATCH_WINDOW = 30        # seconds to wait for a batch to fill
+    PDP_DEPOSIT_MAX_BYTES = 50 * 1024 * 1024
+    PDP_DEPOSIT_MAX_DOCUMENTS = 1000
+
+    # IntegrationLog retention (see IntegrationLogService.prune / flask prune-integration-logs)
+    INTEGRATION_LOG_RETENTION_DAYS = int(os.environ.get('INTEGRATION_LOG_RETENTION_DAYS', 400))
+    INTEGRATION_LOG_PRUNE_BATCH = 5000
+
+    # Background report exports: same backends as SUBMISSION_QUEUE, 'reports' queue
+    REPORT_QUEUE = os.environ.get('REPORT_QUEUE', SUBMISSION_QUEUE)
+    REPORT_JOB_TIMEOUT = 3600
+    REPORT_RESULT_TTL = int(os.environ.get('REPORT_RESULT_TTL', 24 * 3600))  # seconds a result stays downloadable
+
+    # Parquet snapshot of finalised invoice lines (AnalyticsStore; needs pyarrow)
+    ANALYTICS_STORE = os.environ.get('ANALYTICS_STORE', '1') == '1'
+
+    # Platform APIs (asyncio clients in integration_clients)
+    PDP_BASE_URL = os.environ.get('PDP_BASE_URL')
+    PDP_API_TOKEN = os.environ.get('PDP_API_TOKEN')
+    FACEB2B_BASE_URL = os.environ.get('FACEB2B_BASE_URL')
+    FACEB2B_API_TOKEN = os.environ.get('FACEB2B_API_TOKEN')
+    PLATFORM_CONCURRENCY = int(os.environ.get('PLATFORM_CONCURRENCY', 32))
+    PLATFORM_TIMEOUT = 30
+    PLATFORM_MAX_RETRIES = 3
+
     # Uploads
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'storage')
 
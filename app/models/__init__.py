@@ -3,4 +3,8 @@ from .company import Company         # REMOVE UserCompany from here
 from .customer import Customer, CustomerAddress
 from .product import Product
 from .invoice import Invoice, InvoiceLine
+from .invoice_sequence import InvoiceSequence
 from .integration_log import IntegrationLog
+from .submission_ledger import SubmissionLedgerEntry
+from .report_job import ReportJob
+from .vat_summary import InvoiceVatTotal, VatPeriodSummary
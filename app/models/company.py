@@ -49,6 +49,9 @@ class Company(db.Model):
     # Additional fields
     industry = db.Column(db.String(100))
 
+    # Bumped on every invoice write; dashboard caches in any process compare it
+    stats_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
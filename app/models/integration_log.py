@@ -3,12 +3,22 @@ from datetime import datetime
 
 class IntegrationLog(db.Model):
     __tablename__ = 'integration_logs'
+    __table_args__ = (
+        # Status history of an invoice, and monitoring by outcome over time
+        db.Index('ix_integration_logs_invoice_created', 'invoice_id', 'created_at'),
+        db.Index('ix_integration_logs_status_created', 'status_code', 'created_at'),
+        # Retention: oldest rows first
+        db.Index('ix_integration_logs_created_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'))
     direction = db.Column(db.String(20)) # OUTBOUND, INBOUND
     payload_type = db.Column(db.String(20))
-    payload_snippet = db.Column(db.Text)
+    payload_snippet = db.Column(db.String(500))     # start of the payload only
+    payload_hash = db.Column(db.String(64), index=True)  # full payload in the blob store
+    payload_size = db.Column(db.Integer)
     status_code = db.Column(db.String(50))
     error_code = db.Column(db.String(50))
+    external_id = db.Column(db.String(100))     # ID returned by the platform
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
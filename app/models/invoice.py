@@ -10,6 +10,12 @@ class InvoiceStatus(enum.Enum):
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # Keyset pagination of the dashboard (newest first, per company)
+        db.Index('ix_invoices_company_created_id', 'company_id', 'created_at', 'id'),
+        # Keyset reads of the invoice report (date order, per company)
+        db.Index('ix_invoices_company_date_id', 'company_id', 'invoice_date', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -73,7 +79,10 @@ class Invoice(db.Model):
     original_invoice = db.relationship('Invoice', remote_side=[id], backref='credit_notes')
 
     # Relationships
-    lines = db.relationship('InvoiceLine', backref='invoice', cascade='all, delete-orphan')
+    # Ordered so every reader (PDF, XML tree and streaming modes) sees the same sequence
+    lines = db.relationship('InvoiceLine', backref='invoice', cascade='all, delete-orphan', order_by='InvoiceLine.id')
+    # Maintained by VatSummaryService on every write of the lines or the status
+    vat_totals = db.relationship('InvoiceVatTotal', cascade='all, delete-orphan', order_by='InvoiceVatTotal.vat_rate')
 
 
 class InvoiceLine(db.Model):
@@ -82,6 +91,9 @@ class InvoiceLine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
 
+    # Catalogue item the line was picked from (free-text lines have none)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=True)
+
     description = db.Column(db.String(255), nullable=False)
     hsn_sac_code = db.Column(db.String(20))
 
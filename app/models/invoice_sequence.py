@@ -0,0 +1,19 @@
+from app.extensions import db
+from datetime import datetime
+
+class InvoiceSequence(db.Model):
+    """Next free number per (company, fiscal year, document type)."""
+    __tablename__ = 'invoice_sequences'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'fiscal_year', 'document_type', name='uq_invoice_sequence_scope'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    fiscal_year = db.Column(db.Integer, nullable=False)
+    document_type = db.Column(db.String(30), nullable=False)  # INVOICE / CREDIT_NOTE
+
+    next_value = db.Column(db.Integer, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -3,6 +3,10 @@ from datetime import datetime
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Name lookups for lines saved before product_id existed
+        db.Index('ix_products_company_name', 'company_id', 'name'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
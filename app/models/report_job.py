@@ -0,0 +1,24 @@
+from app.extensions import db
+from datetime import datetime
+
+class ReportJob(db.Model):
+    """One background export of the invoice report, shared by identical requests."""
+    __tablename__ = 'report_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # sha256 of (company, format, columns, filters): identical requests share the job
+    request_key = db.Column(db.String(64), nullable=False, unique=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    format = db.Column(db.String(10), nullable=False)      # xlsx / csv
+    params = db.Column(db.Text, nullable=False)            # JSON: columns and filters
+
+    status = db.Column(db.String(20), nullable=False, default='QUEUED')  # QUEUED, RUNNING, FINISHED, FAILED
+    rows_total = db.Column(db.Integer)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    file_path = db.Column(db.String(255))                  # relative to UPLOAD_FOLDER
+    error = db.Column(db.String(255))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
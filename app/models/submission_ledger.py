@@ -0,0 +1,21 @@
+from app.extensions import db
+from datetime import datetime
+
+class SubmissionLedgerEntry(db.Model):
+    """One transmission of one version of a document on one channel."""
+    __tablename__ = 'submission_ledger'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # sha256 of (invoice id, document hash, channel); also sent as Idempotency-Key
+    idempotency_key = db.Column(db.String(64), nullable=False, unique=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
+    document_hash = db.Column(db.String(64), nullable=False)
+    channel = db.Column(db.String(20), nullable=False)  # PDP / FACEB2B
+
+    status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, ACCEPTED, REJECTED
+    external_id = db.Column(db.String(100))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_at = db.Column(db.DateTime)     # set while a worker is sending
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,37 @@
+from app.extensions import db
+from datetime import datetime
+
+class InvoiceVatTotal(db.Model):
+    """VAT breakdown of one invoice (BT-116 / BT-117 per rate), stored at write time."""
+    __tablename__ = 'invoice_vat_totals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
+    vat_rate = db.Column(db.Numeric(5, 2), nullable=False)
+    taxable_amount = db.Column(db.Numeric(12, 2), nullable=False)
+    tax_amount = db.Column(db.Numeric(12, 2), nullable=False)
+
+    # Period summary row this breakdown was added to (None for drafts)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    period = db.Column(db.String(7))                    # YYYY-MM
+    document_type = db.Column(db.String(30))
+
+
+class VatPeriodSummary(db.Model):
+    """Taxable base and VAT per (company, month, rate, document type), finalised invoices only."""
+    __tablename__ = 'vat_period_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'period', 'vat_rate', 'document_type', name='uq_vat_period_summary_scope'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    period = db.Column(db.String(7), nullable=False)    # YYYY-MM of the tax point (or invoice) date
+    vat_rate = db.Column(db.Numeric(5, 2), nullable=False)
+    document_type = db.Column(db.String(30), nullable=False)  # INVOICE / CREDIT_NOTE
+
+    taxable_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    tax_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,89 +1,69 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, Response, stream_with_context, abort
 from flask_login import login_required
 from datetime import date
-import io
+import itertools
 import re
-import pandas as pd
-from io import BytesIO
 from flask import send_file
 # Ensure Customer model is imported
 from app.models import Customer
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 
 from app.models.invoice import Invoice, InvoiceLine, InvoiceStatus
 from app.models.customer import Customer
 from app.models.product import Product
 from app.models.company import Company
 from app.extensions import db
-from flask_login import login_required, current_user
+from app.services.invoice_query_service import InvoiceQueryService
+from app.services.dashboard_stats import DashboardStatsService
+from app.services.numbering_service import InvoiceNumberingService
+from app.services.line_item_service import LineItemService
+from app.services.totals_engine import TotalsEngine
+from app.services.vat_summary_service import VatSummaryService
+from app.services.pdf_service import PdfService
+from app.services.facturx_service import FacturXService
+from app.services.france_xml_generator import FranceXMLGenerator, PROFILES
+from app.services.submission_queue import SubmissionService
+from app.services.xml_batch_service import generator_for, generator_for_company
+from app.services.xml_core import InvoiceDataError
+from app.services.bulk_export_service import BulkPdfExportService
+from app.services.report_export_service import InvoiceReportService
+from app.services.report_job_service import ReportJobService, FORMATS as REPORT_FORMATS
+from app.models.report_job import ReportJob
+from app.services.analytics_store import AnalyticsStore, GROUPS as ANALYTICS_GROUPS
+from app.services.pdf_render_pool import get_render_pool, RenderQueueFull, RenderTimeout
 
 bp = Blueprint('invoices', __name__, url_prefix='/invoices')
 
 
 # ---------- Helpers ----------
 
-def _unique_invoice_number(requested: str) -> str:
+def _unique_invoice_number(requested: str, company=None, on_date=None) -> str:
     base = (requested or "").strip()
+    auto_mode = (getattr(company, 'numbering_mode', None) or 'AUTO') == 'AUTO'
+    if company and (not base or (auto_mode and InvoiceNumberingService.is_auto_number(base, company))):
+        return InvoiceNumberingService.allocate(company, 'INVOICE', on_date)
     if not base:
-        count = Invoice.query.filter(
-            or_(Invoice.fr_document_type == 'INVOICE', Invoice.fr_document_type == None)
-        ).count()
-        return f"INV-{date.today().year}-{1001 + count}"
-
-    if not Invoice.query.filter_by(invoice_number=base).first():
-        return base
-
-    m = re.match(r"^(?P<prefix>.+?)-(?P<year>\d{4})-(?P<num>\d+)$", base)
-    if m:
-        prefix = m.group("prefix")
-        year = m.group("year")
-        num = int(m.group("num"))
-        while True:
-            num += 1
-            candidate = f"{prefix}-{year}-{num}"
-            if not Invoice.query.filter_by(invoice_number=candidate).first():
-                return candidate
-
-    suffix = 1
-    while True:
-        candidate = f"{base}-COPY-{suffix}"
-        if not Invoice.query.filter_by(invoice_number=candidate).first():
-            return candidate
-        suffix += 1
-
-
-def _unique_cn_number(requested: str) -> str:
-    base = (requested or "").strip()
-    if not base or base == "Auto or Manual":
-        count = Invoice.query.filter_by(fr_document_type='CREDIT_NOTE').count()
-        return f"CN-{date.today().year}-{1001 + count}"
+        return InvoiceNumberingService.peek(company, 'INVOICE', on_date)
+    return InvoiceNumberingService.free_variant(base)
 
-    if not Invoice.query.filter_by(invoice_number=base).first():
-        return base
 
-    suffix = 1
-    while True:
-        candidate = f"{base}-{suffix}"
-        if not Invoice.query.filter_by(invoice_number=candidate).first():
-            return candidate
-        suffix += 1
+def _unique_cn_number(requested: str, company=None, on_date=None) -> str:
+    base = (requested or "").strip()
+    if base == "Auto or Manual":
+        base = ""
+    auto_mode = (getattr(company, 'numbering_mode', None) or 'AUTO') == 'AUTO'
+    if company and (not base or (auto_mode and InvoiceNumberingService.is_auto_number(base, company, 'CREDIT_NOTE'))):
+        return InvoiceNumberingService.allocate(company, 'CREDIT_NOTE', on_date)
+    if not base:
+        return InvoiceNumberingService.peek(company, 'CREDIT_NOTE', on_date)
+    return InvoiceNumberingService.free_variant(base, separator='-')
 
 
 def _unique_invoice_number_excluding(requested: str, exclude_id: int) -> str:
     base = (requested or "").strip()
     if not base:
         return f"INV-{date.today().year}-TMP"
-
-    exists = Invoice.query.filter(Invoice.invoice_number == base, Invoice.id != exclude_id).first()
-    if not exists:
-        return base
-
-    suffix = 1
-    while True:
-        candidate = f"{base}-COPY-{suffix}"
-        if not Invoice.query.filter(Invoice.invoice_number == candidate, Invoice.id != exclude_id).first():
-            return candidate
-        suffix += 1
+    return InvoiceNumberingService.free_variant(base, exclude_id=exclude_id)
 
 
 def _get_company_addresses(company):
@@ -110,8 +90,53 @@ def _get_company_addresses(company):
 @bp.route('/')
 @login_required
 def index():
-    invoices = Invoice.query.order_by(Invoice.created_at.desc()).all()
-    return render_template('invoices/index.html', invoices=invoices)
+    company = Company.query.first()
+    company_id = company.id if company else None
+
+    status_filter = request.args.get('status', 'all')
+    type_filter = request.args.get('type', 'all')
+    cursor = request.args.get('cursor')
+
+    invoices, next_cursor = InvoiceQueryService.list_page(
+        company_id=company_id,
+        status=status_filter if status_filter != 'all' else None,
+        doc_type=type_filter if type_filter != 'all' else None,
+        cursor=cursor,
+        limit=request.args.get('limit', type=int)
+    )
+
+    return render_template(
+        'invoices/index.html',
+        invoices=invoices,
+        summary=DashboardStatsService.get_summary(company_id),
+        status_filter=status_filter,
+        type_filter=type_filter,
+        cursor=cursor,
+        next_cursor=next_cursor,
+        # The list only holds this company's invoices: same format for all
+        has_facturx=generator_for_company(company) is FranceXMLGenerator
+    )
+
+
+@bp.route('/api/list')
+@login_required
+def list_invoices_api():
+    """
+    Keyset-paginated invoice listing.
+    Query params: status, type (INVOICE / CREDIT_NOTE), cursor, limit.
+    """
+    company = Company.query.first()
+    invoices, next_cursor = InvoiceQueryService.list_page(
+        company_id=company.id if company else None,
+        status=request.args.get('status'),
+        doc_type=request.args.get('type'),
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', type=int)
+    )
+    return jsonify({
+        'items': [InvoiceQueryService.serialize_row(inv) for inv in invoices],
+        'next_cursor': next_cursor
+    })
 
 
 # ---------- Create INVOICE ----------
@@ -140,18 +165,14 @@ def create():
             flash('Invalid customer.', 'danger')
             return redirect(url_for('invoices.create'))
 
-        requested_number = request.form.get('invoice_number')
-        invoice_number = _unique_invoice_number(requested_number)
-
         invoice_date = date.fromisoformat(request.form['invoice_date']) if request.form.get('invoice_date') else date.today()
+
+        requested_number = request.form.get('invoice_number')
+        invoice_number = _unique_invoice_number(requested_number, company, invoice_date)
         due_date = date.fromisoformat(request.form['due_date']) if request.form.get('due_date') else None
         tp_date_str = request.form.get('tax_point_date')
         tax_point_date = date.fromisoformat(tp_date_str) if tp_date_str else None
 
-        total_net = float(request.form.get('computed_subtotal', 0) or 0)
-        total_tax = float(request.form.get('computed_tax', 0) or 0)
-        total_gross = float(request.form.get('computed_total', 0) or 0)
-
         new_inv = Invoice(
             invoice_number=invoice_number,
             invoice_date=invoice_date,
@@ -177,47 +198,34 @@ def create():
             fr_transaction_category=request.form.get('fr_transaction_category', 'DOMESTIC'),
             fr_operation_nature=request.form.get('fr_operation_nature', 'GOODS'),
             fr_payment_means=request.form.get('fr_payment_means', ''),
-            fr_payment_terms_text=request.form.get('fr_payment_terms_text', ''),
-            total_net=total_net,
-            total_tax=total_tax,
-            total_gross=total_gross
+            fr_payment_terms_text=request.form.get('fr_payment_terms_text', '')
         )
 
+        # Totals are recomputed server-side; the form's computed_* fields are display only
+        lines = LineItemService.parse_form(request.form, new_inv.company_id)
+        try:
+            totals = TotalsEngine.apply(new_inv, lines)
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'{e}. Please correct the line items.', 'danger')
+            return redirect(url_for('invoices.create'))
+        VatSummaryService.record(new_inv, totals['vat_breakdown'])
+
         db.session.add(new_inv)
         db.session.flush()
 
-        for i in range(200):
-            desc = request.form.get(f"lines[{i}][desc]")
-            prod_id_raw = request.form.get(f"lines[{i}][product_id]")
-            has_line = (desc and desc.strip()) or prod_id_raw
-            if not has_line:
-                continue
-
-            qty = float(request.form.get(f"lines[{i}][qty]", 1) or 1)
-            rate = float(request.form.get(f"lines[{i}][rate]", 0) or 0)
-            tax_pct = float(request.form.get(f"lines[{i}][tax]", 0) or 0)
-            line_net = qty * rate
-            vat_amount = line_net * (tax_pct / 100)
-            line_total = line_net + vat_amount
-
-            item = InvoiceLine(
-                invoice_id=new_inv.id,
-                description=desc or '',
-                hsn_sac_code=request.form.get(f"lines[{i}][hsn]", ''),
-                quantity=qty,
-                unit_price=rate,
-                vat_rate=tax_pct,
-                vat_amount=vat_amount,
-                line_total=line_total
-            )
-            db.session.add(item)
+        LineItemService.bulk_insert(new_inv.id, lines)
 
         db.session.commit()
+        DashboardStatsService.invalidate(new_inv.company_id)
+        if new_inv.status != InvoiceStatus.DRAFT:
+            PdfService.prewarm(new_inv.id)
+            SubmissionService.enqueue(new_inv.id)
+            AnalyticsStore.sync(new_inv.id, new_inv.company_id)
         flash('Invoice saved successfully!', 'success')
         return redirect(url_for('invoices.index'))
 
-    count = Invoice.query.filter_by(fr_document_type='INVOICE').count()
-    next_inv = f"INV-{date.today().year}-{1001 + count}"
+    next_inv = InvoiceNumberingService.peek(company, 'INVOICE')
 
     return render_template(
         'invoices/create.html',
@@ -261,17 +269,23 @@ def create_credit_note():
 
         customer_id = int(cust_id_raw)
 
-        requested_number = request.form.get('invoice_number')
-        cn_number = _unique_cn_number(requested_number)
-
         invoice_date = date.fromisoformat(request.form['invoice_date']) if request.form.get('invoice_date') else date.today()
 
+        requested_number = request.form.get('invoice_number')
+        cn_number = _unique_cn_number(requested_number, company, invoice_date)
+
         tp_date_str = request.form.get('tax_point_date')
         tax_point_date = date.fromisoformat(tp_date_str) if tp_date_str else None
 
-        total_net = float(request.form.get('computed_subtotal', 0) or 0)
-        total_tax = float(request.form.get('computed_tax', 0) or 0)
-        total_gross = float(request.form.get('computed_total', 0) or 0)
+        # The invoice it corrects ("Against Invoice"); e-invoice formats reference it
+        source_id = request.form.get('source_invoice_id', '')
+        original = None
+        if request.form.get('cn_mode', 'invoice') == 'invoice' and source_id.isdigit():
+            original = Invoice.query.filter(
+                Invoice.id == int(source_id),
+                Invoice.company_id == (company.id if company else None),
+                Invoice.fr_document_type != 'CREDIT_NOTE'
+            ).first()
 
         new_cn = Invoice(
             invoice_number=cn_number,
@@ -298,50 +312,37 @@ def create_credit_note():
             terms_conditions=request.form.get('terms', ''),
 
             fr_document_type='CREDIT_NOTE',
+            original_invoice_id=original.id if original else None,
             fr_transaction_category=request.form.get('fr_transaction_category', 'DOMESTIC'),
             fr_operation_nature=request.form.get('fr_operation_nature', 'GOODS'),
             fr_payment_means=request.form.get('fr_payment_means', ''),
-            fr_payment_terms_text=request.form.get('fr_payment_terms_text', ''),
-
-            total_net=total_net,
-            total_tax=total_tax,
-            total_gross=total_gross
+            fr_payment_terms_text=request.form.get('fr_payment_terms_text', '')
         )
 
+        lines = LineItemService.parse_form(request.form, new_cn.company_id)
+        try:
+            totals = TotalsEngine.apply(new_cn, lines)
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'{e}. Please correct the line items.', 'danger')
+            return redirect(url_for('invoices.create_credit_note'))
+        VatSummaryService.record(new_cn, totals['vat_breakdown'])
+
         db.session.add(new_cn)
         db.session.flush()
 
-        for i in range(200):
-            desc = request.form.get(f"lines[{i}][desc]")
-            prod_id_raw = request.form.get(f"lines[{i}][product_id]")
-            has_line = (desc and desc.strip()) or prod_id_raw
-            if not has_line: continue
-
-            qty = float(request.form.get(f"lines[{i}][qty]", 1) or 1)
-            rate = float(request.form.get(f"lines[{i}][rate]", 0) or 0)
-            tax_pct = float(request.form.get(f"lines[{i}][tax]", 0) or 0)
-
-            line_net = qty * rate
-            vat_amount = line_net * (tax_pct / 100)
-            line_total = line_net + vat_amount
-
-            item = InvoiceLine(
-                invoice_id=new_cn.id,
-                description=desc or '',
-                hsn_sac_code=request.form.get(f"lines[{i}][hsn]", ''),
-                quantity=qty,
-                unit_price=rate,
-                vat_rate=tax_pct,
-                vat_amount=vat_amount,
-                line_total=line_total
-            )
-            db.session.add(item)
+        LineItemService.bulk_insert(new_cn.id, lines)
 
         db.session.commit()
+        DashboardStatsService.invalidate(new_cn.company_id)
+        if new_cn.status != InvoiceStatus.DRAFT:
+            PdfService.prewarm(new_cn.id)
+            SubmissionService.enqueue(new_cn.id)
+            AnalyticsStore.sync(new_cn.id, new_cn.company_id)
         flash('Credit Note created successfully!', 'success')
         return redirect(url_for('invoices.index'))
 
-    next_cn = _unique_cn_number(None)
+    next_cn = InvoiceNumberingService.peek(company, 'CREDIT_NOTE')
 
     return render_template(
         'invoices/create_credit_note.html',
@@ -367,15 +368,21 @@ def get_invoice_details_api(id):
     Returns invoice details JSON to auto-populate the Credit Note form.
     """
     inv = Invoice.query.get_or_404(id)
+    lines = inv.lines
+
+    # Lines saved before product_id existed: resolve them by name in one IN query
+    unlinked = {line.description for line in lines if not line.product_id and line.description}
+    product_ids_by_name = {}
+    if unlinked:
+        matches = db.session.query(Product.name, func.min(Product.id)).filter(
+            Product.company_id == inv.company_id,
+            Product.name.in_(unlinked)
+        ).group_by(Product.name)
+        product_ids_by_name = dict(matches)
 
     lines_data = []
-    for line in inv.lines:
-        prod_id = None
-        # FIX: Find product by name instead of accessing invalid line.product_id
-        if line.description:
-            p = Product.query.filter_by(name=line.description).first()
-            if p:
-                prod_id = p.id
+    for line in lines:
+        prod_id = line.product_id or product_ids_by_name.get(line.description)
 
         lines_data.append({
             'product_id': prod_id,
@@ -420,6 +427,7 @@ def edit(id):
     customers = Customer.query.all()
     products = Product.query.all()
     supp_bill_addr, supp_ship_addr = _get_company_addresses(company)
+    was_draft = invoice.status == InvoiceStatus.DRAFT
 
     # --- CREDIT NOTE EDIT LOGIC ---
     if invoice.fr_document_type == 'CREDIT_NOTE':
@@ -449,38 +457,25 @@ def edit(id):
             invoice.fr_payment_means = request.form.get('fr_payment_means', '')
             invoice.fr_payment_terms_text = request.form.get('fr_payment_terms_text', '')
 
-            invoice.total_net = float(request.form.get('computed_subtotal', 0) or 0)
-            invoice.total_tax = float(request.form.get('computed_tax', 0) or 0)
-            invoice.total_gross = float(request.form.get('computed_total', 0) or 0)
-
-            InvoiceLine.query.filter_by(invoice_id=invoice.id).delete()
-            for i in range(200):
-                desc = request.form.get(f"lines[{i}][desc]")
-                prod_id_raw = request.form.get(f"lines[{i}][product_id]")
-                has_line = (desc and desc.strip()) or prod_id_raw
-                if not has_line: continue
-
-                qty = float(request.form.get(f"lines[{i}][qty]", 1) or 1)
-                rate = float(request.form.get(f"lines[{i}][rate]", 0) or 0)
-                tax_pct = float(request.form.get(f"lines[{i}][tax]", 0) or 0)
-
-                line_net = qty * rate
-                vat_amount = line_net * (tax_pct / 100)
-                line_total = line_net + vat_amount
-
-                item = InvoiceLine(
-                    invoice_id=invoice.id,
-                    description=desc or '',
-                    hsn_sac_code=request.form.get(f"lines[{i}][hsn]", ''),
-                    quantity=qty,
-                    unit_price=rate,
-                    vat_rate=tax_pct,
-                    vat_amount=vat_amount,
-                    line_total=line_total
-                )
-                db.session.add(item)
+            lines = LineItemService.parse_form(request.form, invoice.company_id)
+            try:
+                totals = TotalsEngine.apply(invoice, lines)
+            except ValueError as e:
+                db.session.rollback()
+                flash(f'{e}. Please correct the line items.', 'danger')
+                return redirect(url_for('invoices.edit', id=id))
+            VatSummaryService.record(invoice, totals['vat_breakdown'])
+
+            LineItemService.sync_lines(invoice.id, lines)
 
             db.session.commit()
+            DashboardStatsService.invalidate(invoice.company_id)
+            PdfService.invalidate(invoice.id)
+            if was_draft and invoice.status != InvoiceStatus.DRAFT:
+                PdfService.prewarm(invoice.id)
+                SubmissionService.enqueue(invoice.id)
+            if not was_draft or invoice.status != InvoiceStatus.DRAFT:
+                AnalyticsStore.sync(invoice.id, invoice.company_id, replace=not was_draft)
             flash('Credit Note updated.', 'success')
             return redirect(url_for('invoices.index'))
 
@@ -498,13 +493,82 @@ def edit(id):
             is_edit=True
         )
 
-    # ... (Standard Invoice Edit Logic omitted for brevity but should be kept) ...
-    # Standard invoice edit logic is identical to create.txt, you can keep it as is.
+    # --- STANDARD INVOICE EDIT LOGIC ---
     if request.method == 'POST':
-        # ... existing invoice edit code ...
-        pass # Placeholder for existing code
+        save_type = request.form.get('save_type', 'draft')
+        invoice.status = InvoiceStatus.DRAFT if save_type == 'draft' else InvoiceStatus.SENT
+
+        cust_id_raw = request.form.get('customer_id')
+        if not cust_id_raw:
+            flash('Please select a customer before saving.', 'warning')
+            return redirect(url_for('invoices.edit', id=invoice.id))
 
-    return render_template('invoices/create.html', customers=customers, products=products, company=company, today=date.today().isoformat(), next_inv_number=invoice.invoice_number, invoice=invoice, is_edit=True)
+        try:
+            invoice.customer_id = int(cust_id_raw)
+        except ValueError:
+            flash('Invalid customer.', 'danger')
+            return redirect(url_for('invoices.edit', id=invoice.id))
+
+        requested_number = request.form.get('invoice_number')
+        if requested_number and requested_number != invoice.invoice_number:
+            invoice.invoice_number = _unique_invoice_number_excluding(requested_number, invoice.id)
+
+        invoice.invoice_date = date.fromisoformat(request.form['invoice_date']) if request.form.get('invoice_date') else date.today()
+        invoice.due_date = date.fromisoformat(request.form['due_date']) if request.form.get('due_date') else None
+        tp_date_str = request.form.get('tax_point_date')
+        invoice.tax_point_date = date.fromisoformat(tp_date_str) if tp_date_str else None
+
+        invoice.purchase_order_number = request.form.get('purchase_order_number', '')
+        invoice.branch_name = request.form.get('branch_name', 'Head Office')
+        invoice.customer_vat = request.form.get('customer_vat', '')
+        invoice.place_of_supply = request.form.get('place_of_supply', '')
+        invoice.kind_attention = request.form.get('kind_attention', '')
+        invoice.bill_from_address = request.form.get('bill_from', '')
+        invoice.ship_from_address = request.form.get('ship_from', '')
+        invoice.bill_to_address = request.form.get('bill_to', '')
+        invoice.ship_to_address = request.form.get('ship_to', '')
+        invoice.customer_notes = request.form.get('notes', '')
+        invoice.terms_conditions = request.form.get('terms', '')
+        invoice.bank_details_snapshot = request.form.get('bank_details', '')
+
+        invoice.fr_transaction_category = request.form.get('fr_transaction_category', 'DOMESTIC')
+        invoice.fr_operation_nature = request.form.get('fr_operation_nature', 'GOODS')
+        invoice.fr_payment_means = request.form.get('fr_payment_means', '')
+        invoice.fr_payment_terms_text = request.form.get('fr_payment_terms_text', '')
+
+        lines = LineItemService.parse_form(request.form, invoice.company_id)
+        try:
+            totals = TotalsEngine.apply(invoice, lines)
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'{e}. Please correct the line items.', 'danger')
+            return redirect(url_for('invoices.edit', id=id))
+        VatSummaryService.record(invoice, totals['vat_breakdown'])
+        LineItemService.sync_lines(invoice.id, lines)
+
+        db.session.commit()
+        DashboardStatsService.invalidate(invoice.company_id)
+        PdfService.invalidate(invoice.id)
+        if was_draft and invoice.status != InvoiceStatus.DRAFT:
+            PdfService.prewarm(invoice.id)
+            SubmissionService.enqueue(invoice.id)
+        if not was_draft or invoice.status != InvoiceStatus.DRAFT:
+            AnalyticsStore.sync(invoice.id, invoice.company_id, replace=not was_draft)
+        flash('Invoice updated.', 'success')
+        return redirect(url_for('invoices.index'))
+
+    return render_template(
+        'invoices/create.html',
+        customers=customers,
+        products=products,
+        company=company,
+        supplier_bill_default=invoice.bill_from_address or supp_bill_addr,
+        supplier_ship_default=invoice.ship_from_address or supp_ship_addr,
+        today=invoice.invoice_date.isoformat() if invoice.invoice_date else date.today().isoformat(),
+        next_inv_number=invoice.invoice_number,
+        invoice=invoice,
+        is_edit=True
+    )
 
 # ... (Existing view/print/pdf/delete routes remain the same) ...
 
@@ -513,55 +577,157 @@ def edit(id):
 @bp.route('/view/<int:id>')
 @login_required
 def view(id):
-    invoices = Invoice.query.order_by(Invoice.created_at.desc()).all()
     invoice = Invoice.query.get_or_404(id)
     company = Company.query.first()
     customer = None
     if getattr(invoice, "customer_id", None):
         customer = Customer.query.get(invoice.customer_id)
 
+    # The sidebar list is fetched by the page from invoices.sidebar_api
     return render_template(
         'invoices/view.html',
-        invoices=invoices,
         invoice=invoice,
         company=company,
-        customer=customer
+        customer=customer,
+        has_facturx=generator_for(invoice) is FranceXMLGenerator
     )
 
 @bp.route('/print/<int:id>')
 @login_required
 def print_invoice(id):
-    invoices = Invoice.query.order_by(Invoice.created_at.desc()).all()
     invoice = Invoice.query.get_or_404(id)
     company = Company.query.first()
-    return render_template('invoices/view.html', invoices=invoices, invoice=invoice, company=company, auto_print=True)
+    return render_template('invoices/view.html', invoice=invoice, company=company, auto_print=True,
+                           has_facturx=generator_for(invoice) is FranceXMLGenerator)
+
+@bp.route('/api/sidebar')
+@login_required
+def sidebar_api():
+    """
+    Windowed slice of the invoice list for the view page sidebar.
+    Query params: around=<invoice id>, or cursor + direction (older / newer).
+    """
+    company = Company.query.first()
+    rows, newer_cursor, older_cursor = InvoiceQueryService.sidebar_window(
+        company_id=company.id if company else None,
+        around_id=request.args.get('around', type=int),
+        cursor=request.args.get('cursor'),
+        direction=request.args.get('direction', 'older'),
+        size=request.args.get('size', type=int)
+    )
+    return jsonify({
+        'items': [InvoiceQueryService.serialize_sidebar_row(r) for r in rows],
+        'newer_cursor': newer_cursor,
+        'older_cursor': older_cursor
+    })
 
 @bp.route('/pdf/<int:id>')
 @login_required
 def pdf(id):
     invoice = Invoice.query.get_or_404(id)
     company = Company.query.first()
-    html = render_template('invoices/partials/invoice_render.html', invoice=invoice, company=company, pdf_mode=True)
-    pdf_bytes = None
+
+    # The ETag is the content hash of everything the PDF is rendered from
+    digest = PdfService.fingerprint(invoice, company)
+    if request.if_none_match.contains(digest):
+        response = current_app.response_class(status=304)
+        response.set_etag(digest)
+        return response
+
     try:
-        from weasyprint import HTML
-        pdf_bytes = HTML(string=html).write_pdf()
-    except Exception:
-        try:
-            import pdfkit
-            pdf_bytes = pdfkit.from_string(html, False)
-        except Exception:
-            pdf_bytes = None
-
-    if pdf_bytes:
-        return send_file(
-            io.BytesIO(pdf_bytes),
+        path, digest = PdfService.get_or_render(invoice, company, digest)
+    except (RenderQueueFull, RenderTimeout) as e:
+        # Back-pressure: let the client retry instead of tying up this worker
+        response = jsonify({'error': 'PDF rendering is busy, please retry shortly.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    if path:
+        response = send_file(
+            path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f"{invoice.invoice_number}.pdf"
+            download_name=f"{invoice.invoice_number}.pdf",
+            etag=digest,
+            max_age=0
         )
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     return render_template('invoices/partials/invoice_render.html', invoice=invoice, company=company, pdf_mode=True)
 
+@bp.route('/facturx/<int:id>')
+@login_required
+def facturx(id):
+    """Factur-X hybrid: the PDF as PDF/A-3 with the CII XML embedded (?profile=BASIC|EN16931|EXTENDED)."""
+    invoice = Invoice.query.get_or_404(id)
+    if generator_for(invoice) is not FranceXMLGenerator:
+        # Factur-X is the French format: a FacturaE company has no such document
+        return jsonify({'error': 'Factur-X is only available for Factur-X companies.'}), 404
+    company = Company.query.first()
+    profile = request.args.get('profile')
+    if profile and profile not in PROFILES:
+        return jsonify({'error': f"Unknown profile {profile}"}), 400
+
+    try:
+        path, digest = FacturXService.get_or_build(invoice, company, profile)
+    except (RenderQueueFull, RenderTimeout) as e:
+        response = jsonify({'error': 'PDF rendering is busy, please retry shortly.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    if not path:
+        return jsonify({'error': 'Factur-X output needs WeasyPrint on the server.'}), 501
+    response = send_file(
+        path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"{invoice.invoice_number}-facturx.pdf",
+        etag=digest,
+        max_age=0
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/xml/<int:id>')
+@login_required
+def xml(id):
+    """E-invoice XML in the company's format (Factur-X or FacturaE), streamed line by line."""
+    invoice = Invoice.query.get_or_404(id)
+    chunks = generator_for(invoice).iter_invoice_xml(invoice)
+    try:
+        # The head holds both parties: missing data fails here, before the response starts
+        head = next(chunks)
+    except InvoiceDataError as e:
+        flash(f'{e}. Please complete the company or customer details.', 'danger')
+        return redirect(url_for('invoices.view', id=id))
+    response = Response(
+        stream_with_context(itertools.chain((head,), chunks)),
+        mimetype='application/xml'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{invoice.invoice_number}.xml"'
+    return response
+
+@bp.route('/export/pdfs', methods=['GET', 'POST'])
+@login_required
+def export_pdfs():
+    """ZIP of the PDFs matching the report filters, streamed while it is rendered."""
+    company = Company.query.first()
+    query = InvoiceQueryService.report_query(company.id if company else None, request.values)
+
+    response = Response(
+        stream_with_context(BulkPdfExportService.stream_zip(query, company)),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="invoices-{date.today().isoformat()}.zip"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/pdf-metrics')
+@login_required
+def pdf_metrics_api():
+    """Queue depth and render times of this process's PDF pool."""
+    return jsonify(get_render_pool(current_app).metrics())
+
 @bp.route('/get_customer_addresses/<int:id>')
 @login_required
 def get_customer_addresses(id):
@@ -671,8 +837,11 @@ def delete(id):
         flash('Only draft invoices can be deleted.', 'warning')
         return redirect(url_for('invoices.index'))
     InvoiceLine.query.filter_by(invoice_id=invoice.id).delete()
+    company_id = invoice.company_id
     db.session.delete(invoice)
     db.session.commit()
+    DashboardStatsService.invalidate(company_id)
+    PdfService.invalidate(id)
     flash('Draft deleted successfully.', 'success')
     return redirect(url_for('invoices.index'))
 
@@ -696,88 +865,106 @@ def record_payment(invoice_id=None):
 @bp.route('/report', methods=['GET', 'POST'])
 @login_required
 def invoice_report():
-    # 1. Get the User's Company
-    company = Company.query.filter_by(user_id=current_user.id).first()
+    company = Company.query.first()
     if not company:
         flash("Please set up your company profile first.", "warning")
-        return redirect(url_for('main.index'))
+        return redirect(url_for('invoices.index'))
 
-    # 2. Get Customers for the Dropdown (linked to this company)
-    customers = Customer.query.filter_by(company_id=company.id).all()
+    customers = Customer.query.filter_by(company_id=company.id).order_by(Customer.name).all()
 
     results = []
+    total = 0
     selected_columns = []
 
     if request.method == 'POST':
-        filter_type = request.form.get('filter_type')
         action = request.form.get('action')
+        selected_columns = InvoiceReportService.columns(request.form.getlist('columns'))
+
+        # Large exports: built by a worker, polled and downloaded from the job page
+        if request.form.get('background') and action in ('export', 'export_csv'):
+            try:
+                job = ReportJobService.submit(company.id, 'csv' if action == 'export_csv' else 'xlsx', request.form)
+            except Exception:
+                current_app.logger.exception("Could not queue the invoice report")
+                flash("The report could not be queued, please try again later.", "danger")
+                return redirect(url_for('invoices.invoice_report'))
+            return redirect(url_for('invoices.report_job', job_id=job.id))
+
+        # Exports stream rows from one projected query; nothing is held per row
+        if action == 'export_csv':
+            response = Response(
+                stream_with_context(InvoiceReportService.iter_csv(company.id, request.form, selected_columns)),
+                mimetype='text/csv; charset=utf-8'
+            )
+            response.headers['Content-Disposition'] = 'attachment; filename="invoice_report.csv"'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
 
-        # 3. FIX: Filter Invoices by COMPANY ID, not user_id
-        query = Invoice.query.filter_by(company_id=company.id)
-
-        # Apply Date Filters
-        if filter_type == 'period':
-            start_date = request.form.get('start_date')
-            end_date = request.form.get('end_date')
-            if start_date:
-                query = query.filter(Invoice.invoice_date >= start_date)
-            if end_date:
-                query = query.filter(Invoice.invoice_date <= end_date)
-
-        # Apply Customer Filter
-        elif filter_type == 'customer':
-            cust_id = request.form.get('customer_id')
-            if cust_id:
-                query = query.filter(Invoice.customer_id == cust_id)
-
-        invoices = query.all()
-
-        # Get Columns
-        selected_columns = request.form.getlist('columns')
-        if not selected_columns:
-            selected_columns = ['invoice_number', 'invoice_date', 'total_gross']
-
-        # Process Data
-        data_list = []
-        for inv in invoices:
-            row = {}
-            for col in selected_columns:
-                val = getattr(inv, col, '')
-
-                # Format Dates
-                if col == 'invoice_date' and val:
-                    val = val.strftime('%Y-%m-%d')
-                # Format Enums
-                if col == 'status' and hasattr(val, 'value'):
-                    val = val.value
-
-                # Handle Customer Name manually
-                if col == 'customer_name':
-                    if inv.customer:
-                        val = inv.customer.name
-                    else:
-                        val = "Unknown"
-
-                row[col] = val
-            data_list.append(row)
-
-        results = data_list
-
-        # Export Logic
         if action == 'export':
-            df = pd.DataFrame(data_list)
-            df.columns = [c.replace('_', ' ').title() for c in df.columns]
-
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Invoices')
-
-            output.seek(0)
             return send_file(
-                output,
+                InvoiceReportService.write_xlsx(company.id, request.form, selected_columns),
                 download_name="invoice_report.xlsx",
                 as_attachment=True,
                 mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
-    return render_template('reports/invoice_report.html', customers=customers, results=results, selected_columns=selected_columns)
+        results, total = InvoiceReportService.preview(company.id, request.form, selected_columns)
+
+    return render_template(
+        'reports/invoice_report.html',
+        customers=customers,
+        results=results,
+        total=total,
+        selected_columns=selected_columns
+    )
+
+def _company_report_job(job_id):
+    company = Company.query.first()
+    job = db.session.get(ReportJob, job_id)
+    if job is None or company is None or job.company_id != company.id:
+        abort(404)
+    return job
+
+@bp.route('/report/jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    job = _company_report_job(job_id)
+    return render_template('reports/report_job.html', job=job, state=ReportJobService.status(job))
+
+@bp.route('/report/jobs/<int:job_id>/status')
+@login_required
+def report_job_status(job_id):
+    return jsonify(ReportJobService.status(_company_report_job(job_id)))
+
+@bp.route('/report/jobs/<int:job_id>/download')
+@login_required
+def report_job_download(job_id):
+    job = _company_report_job(job_id)
+    state = ReportJobService.status(job)
+    if state['status'] == 'EXPIRED':
+        abort(410)
+    if not state['ready']:
+        abort(404)
+    return send_file(
+        ReportJobService.result_path(job),
+        download_name=f"invoice_report.{job.format}",
+        as_attachment=True,
+        mimetype=REPORT_FORMATS[job.format]
+    )
+
+@bp.route('/api/analytics/revenue')
+@login_required
+def analytics_revenue_api():
+    """Revenue totals from the analytics store: ?by=month,customer,vat_rate,document_type&start=&end="""
+    company = Company.query.first()
+    by = [name for name in request.args.get('by', 'month').split(',') if name]
+    if not company or any(name not in ANALYTICS_GROUPS for name in by):
+        return jsonify({'error': f"by must be among {', '.join(ANALYTICS_GROUPS)}"}), 400
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    if not AnalyticsStore.available():
+        return jsonify({'error': 'Analytics store unavailable (pyarrow not installed)'}), 501
+    return jsonify({'by': by, 'rows': AnalyticsStore.revenue(company.id, by, start, end)})
@@ -0,0 +1,392 @@
+import fcntl
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.extensions import db
+from app.models.invoice import Invoice, InvoiceLine, InvoiceStatus
+from app.models.customer import Customer
+
+STORE_DIRNAME = 'analytics'
+FILE_ROWS = 250_000        # rows per part file written by rebuild()
+COMPACT_PARTS = 32         # a month partition with more part files is merged into one
+READ_BATCH = 5000
+
+# Group-by names accepted by revenue() -> store columns
+GROUPS = {
+    'month': ['month'],
+    'customer': ['customer_id', 'customer_name'],
+    'vat_rate': ['vat_rate'],
+    'document_type': ['document_type'],
+}
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('invoice_id', pa.int64()),
+        ('invoice_date', pa.date32()),
+        ('document_type', pa.string()),
+        ('customer_id', pa.int64()),
+        ('customer_name', pa.string()),
+        ('vat_rate', pa.float64()),
+        ('net_cents', pa.int64()),
+        ('tax_cents', pa.int64()),
+    ])
+
+
+def _cents(value):
+    if value is None:
+        return 0
+    return int((Decimal(str(value)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+class _Rows:
+    """Column buffers of one (company, month) partition."""
+
+    def __init__(self):
+        self.columns = {name: [] for name in _schema().names}
+
+    def add(self, invoice_id, invoice_date, doc_type, customer_id, customer_name, vat_rate, line_total, vat_amount):
+        # Credit notes are stored negative so sums give net revenue
+        sign = -1 if doc_type == 'CREDIT_NOTE' else 1
+        tax = _cents(vat_amount)
+        c = self.columns
+        c['invoice_id'].append(invoice_id)
+        c['invoice_date'].append(invoice_date)
+        c['document_type'].append(doc_type or 'INVOICE')
+        c['customer_id'].append(customer_id)
+        c['customer_name'].append(customer_name)
+        c['vat_rate'].append(float(vat_rate or 0))
+        c['net_cents'].append(sign * (_cents(line_total) - tax))
+        c['tax_cents'].append(sign * tax)
+
+    def __len__(self):
+        return len(self.columns['invoice_id'])
+
+    def table(self):
+        import pyarrow as pa
+        return pa.table(self.columns, schema=_schema())
+
+
+class AnalyticsStore:
+    """
+    Columnar snapshot of finalised invoice lines for reporting, as Parquet
+    files partitioned by company and month:
+        <UPLOAD_FOLDER>/analytics/company=<id>/month=<YYYY-MM>/part-<uuid>.parquet
+    One row per line with its invoice date, document type, customer, VAT
+    rate and net / tax amounts in cents (negative for credit notes).
+
+    Invoice write paths call sync() after commit: a newly finalised invoice
+    appends one small part file per month; an edited one is first removed
+    from the files whose invoice_id range holds it. Partitions are merged
+    once they have COMPACT_PARTS files. rebuild() recreates the store from
+    the invoice tables in one streamed pass per company. Every write to a
+    company's files holds its lock (_locked).
+
+    Aggregations read only the needed columns and months with pyarrow and
+    group in Arrow, without touching the OLTP tables. Needs pyarrow; without
+    it (or with ANALYTICS_STORE off) sync() does nothing and available() is False.
+    """
+
+    @staticmethod
+    def available():
+        if not current_app.config.get('ANALYTICS_STORE', True):
+            return False
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def root():
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], STORE_DIRNAME)
+
+    @staticmethod
+    def company_dir(company_id):
+        return os.path.join(AnalyticsStore.root(), f"company={company_id}")
+
+    @staticmethod
+    @contextmanager
+    def _locked(company_id):
+        """Serialises every write (append, remove, compact, rebuild) to one company's files."""
+        directory = AnalyticsStore.company_dir(company_id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ---------- Writing ----------
+
+    @staticmethod
+    def _lines_query():
+        return (
+            db.session.query(
+                Invoice.company_id,
+                InvoiceLine.invoice_id,
+                Invoice.invoice_date,
+                Invoice.fr_document_type,
+                Invoice.customer_id,
+                Customer.name,
+                InvoiceLine.vat_rate,
+                InvoiceLine.line_total,
+                InvoiceLine.vat_amount
+            )
+            .join(Invoice, Invoice.id == InvoiceLine.invoice_id)
+            .outerjoin(Customer, Customer.id == Invoice.customer_id)
+            .filter(Invoice.status != InvoiceStatus.DRAFT)
+        )
+
+    @staticmethod
+    def _write_part(directory, table):
+        import pyarrow.parquet as pq
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        path = os.path.join(directory, name)
+        tmp_path = os.path.join(directory, f".{name}.tmp")  # dot files are skipped by readers
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def _parts(directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(directory)
+            for name in names if name.endswith('.parquet')
+        )
+
+    @staticmethod
+    def _append(company_id, invoice_ids):
+        partitions = {}
+        for _, invoice_id, invoice_date, *rest in (
+            AnalyticsStore._lines_query()
+            .filter(Invoice.company_id == company_id, Invoice.id.in_(invoice_ids))
+            .order_by(InvoiceLine.id)
+        ):
+            partitions.setdefault(invoice_date.strftime('%Y-%m'), _Rows()).add(invoice_id, invoice_date, *rest)
+
+        for month, rows in partitions.items():
+            directory = os.path.join(AnalyticsStore.company_dir(company_id), f"month={month}")
+            AnalyticsStore._write_part(directory, rows.table())
+            if len(AnalyticsStore._parts(directory)) > COMPACT_PARTS:
+                AnalyticsStore._compact(directory)
+        return sum(len(rows) for rows in partitions.values())
+
+    @staticmethod
+    def _remove(company_id, invoice_ids):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        wanted = sorted(set(invoice_ids))
+        value_set = pa.array(wanted, type=pa.int64())
+        for path in AnalyticsStore._parts(AnalyticsStore.company_dir(company_id)):
+            # Footer statistics tell which files can hold these invoices
+            metadata = pq.ParquetFile(path).metadata
+            column = metadata.schema.names.index('invoice_id')
+            candidate = False
+            for i in range(metadata.num_row_groups):
+                stats = metadata.row_group(i).column(column).statistics
+                if stats is None or not stats.has_min_max or any(stats.min <= n <= stats.max for n in wanted):
+                    candidate = True
+                    break
+            if not candidate:
+                continue
+
+            table = pq.read_table(path, schema=_schema())
+            kept = table.filter(pc.invert(pc.is_in(table['invoice_id'], value_set=value_set)))
+            if kept.num_rows == table.num_rows:
+                continue
+            if kept.num_rows:
+                AnalyticsStore._write_part(os.path.dirname(path), kept)
+            os.remove(path)
+
+    @staticmethod
+    def _compact(directory):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parts = AnalyticsStore._parts(directory)
+        if len(parts) < 2:
+            return
+        merged = pa.concat_tables([pq.read_table(path, schema=_schema()) for path in parts])
+        AnalyticsStore._write_part(directory, merged)
+        for path in parts:
+            os.remove(path)
+
+    @staticmethod
+    def append(company_id, invoice_ids):
+        """Adds the lines of the given finalised invoices. Returns the number of rows written."""
+        with AnalyticsStore._locked(company_id):
+            return AnalyticsStore._append(company_id, invoice_ids)
+
+    @staticmethod
+    def remove(company_id, invoice_ids):
+        """Drops the rows of the given invoices from the company's files."""
+        with AnalyticsStore._locked(company_id):
+            AnalyticsStore._remove(company_id, invoice_ids)
+
+    @staticmethod
+    def compact(company_id, month):
+        """Merges the part files of one month into one."""
+        with AnalyticsStore._locked(company_id):
+            AnalyticsStore._compact(os.path.join(AnalyticsStore.company_dir(company_id), f"month={month}"))
+
+    @staticmethod
+    def sync(invoice_id, company_id, replace=False):
+        """
+        Called after an invoice write is committed. `replace` when the invoice
+        may already be in the store (it was finalised before this edit).
+        The removal and the append (which reads the committed lines) happen
+        under one company lock, so concurrent edits of an invoice leave one
+        copy of its rows. Never fails the caller's request.
+        """
+        try:
+            if not AnalyticsStore.available():
+                return None
+            with AnalyticsStore._locked(company_id):
+                if replace:
+                    AnalyticsStore._remove(company_id, [invoice_id])
+                return AnalyticsStore._append(company_id, [invoice_id])
+        except Exception:
+            current_app.logger.exception("Could not update the analytics store for invoice %s", invoice_id)
+            return None
+
+    @staticmethod
+    def rebuild(company_id=None):
+        """
+        Recreates the store (or one company's files) from the invoice tables,
+        company by company: one query streamed in date order, written
+        FILE_ROWS rows per file, then swapped in. The company lock is held from
+        the read to the swap, so no sync() of that company can slip in between
+        and be lost; they wait for it. Returns the row count.
+        """
+        if company_id:
+            companies = {company_id}
+        else:
+            # Every company with invoices or with files to clear
+            root = AnalyticsStore.root()
+            companies = {cid for (cid,) in db.session.query(Invoice.company_id).distinct() if cid is not None}
+            if os.path.isdir(root):
+                companies |= {int(name.split('=', 1)[1]) for name in os.listdir(root) if name.startswith('company=')}
+        return sum(AnalyticsStore._rebuild_company(cid) for cid in sorted(companies))
+
+    @staticmethod
+    def _rebuild_company(company_id):
+        staging = os.path.join(AnalyticsStore.root(), f".rebuild-{uuid.uuid4().hex}")
+        query = (
+            AnalyticsStore._lines_query()
+            .filter(Invoice.company_id == company_id)
+            .order_by(Invoice.invoice_date, InvoiceLine.id)
+        )
+        total, month, rows = 0, None, _Rows()
+
+        def flush():
+            if month and len(rows):
+                AnalyticsStore._write_part(os.path.join(staging, f"month={month}"), rows.table())
+
+        with AnalyticsStore._locked(company_id):
+            try:
+                for _, invoice_id, invoice_date, *rest in query.yield_per(READ_BATCH):
+                    line_month = invoice_date.strftime('%Y-%m')
+                    if line_month != month or len(rows) >= FILE_ROWS:
+                        flush()
+                        month, rows = line_month, _Rows()
+                    rows.add(invoice_id, invoice_date, *rest)
+                    total += 1
+                flush()
+                AnalyticsStore._swap(company_id, staging)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        return total
+
+    @staticmethod
+    def _swap(company_id, rebuilt_dir):
+        """Replaces the company's month directories with the rebuilt ones (lock held)."""
+        directory = AnalyticsStore.company_dir(company_id)
+        for name in os.listdir(directory):
+            if name.startswith('month='):
+                shutil.rmtree(os.path.join(directory, name))
+        if os.path.isdir(rebuilt_dir):
+            for name in os.listdir(rebuilt_dir):
+                os.replace(os.path.join(rebuilt_dir, name), os.path.join(directory, name))
+
+    # ---------- Reading ----------
+
+    @staticmethod
+    def table(company_id, start=None, end=None, columns=None):
+        """
+        Arrow table of the company's lines with invoice_date in [start, end]
+        (dates or ISO strings), plus the 'month' column. Only the months in
+        range and the requested columns are read.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        directory = AnalyticsStore.company_dir(company_id)
+        schema = _schema().append(pa.field('month', pa.string()))
+        if not AnalyticsStore._parts(directory):
+            return schema.empty_table().select(columns) if columns else schema.empty_table()
+
+        dataset = ds.dataset(
+            directory, format='parquet', schema=schema,
+            partitioning=ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+        )
+        expression = None
+        for bound, op in ((start, 'ge'), (end, 'le')):
+            if not bound:
+                continue
+            bound = date.fromisoformat(bound) if isinstance(bound, str) else bound
+            month = ds.field('month') >= bound.strftime('%Y-%m') if op == 'ge' else ds.field('month') <= bound.strftime('%Y-%m')
+            day = ds.field('invoice_date') >= bound if op == 'ge' else ds.field('invoice_date') <= bound
+            clause = month & day
+            expression = clause if expression is None else expression & clause
+        return dataset.to_table(columns=columns, filter=expression)
+
+    @staticmethod
+    def revenue(company_id, by=('month',), start=None, end=None):
+        """
+        Net, tax and gross totals grouped by any of GROUPS (month, customer,
+        vat_rate, document_type), as a list of dicts sorted by the groups.
+        """
+        keys = [column for name in by for column in GROUPS[name]]
+        table = AnalyticsStore.table(company_id, start, end, keys + ['net_cents', 'tax_cents'])
+        grouped = table.group_by(keys).aggregate([('net_cents', 'sum'), ('tax_cents', 'sum'), ('net_cents', 'count')])
+        grouped = grouped.sort_by([(k, 'ascending') for k in keys]) if keys else grouped
+
+        result = []
+        for row in grouped.to_pylist():
+            net, tax = row['net_cents_sum'] or 0, row['tax_cents_sum'] or 0
+            entry = {k: row[k] for k in keys}
+            entry.update({
+                'lines': row['net_cents_count'],
+                'net': _from_cents(net),
+                'tax': _from_cents(tax),
+                'gross': _from_cents(net + tax),
+            })
+            result.append(entry)
+        return result
+
+
+def _from_cents(n):
+    return float(Decimal(int(n)).scaleb(-2))
+
+
+@click.command('rebuild-analytics')
+@click.option('--company', 'company_id', type=int, default=None, help='Only this company (default: all).')
+@with_appcontext
+def rebuild_analytics_command(company_id):
+    """Recreate the Parquet analytics store from the invoice tables."""
+    click.echo(f"Wrote {AnalyticsStore.rebuild(company_id)} invoice lines.")
@@ -0,0 +1,138 @@
+import time
+import zipfile
+from collections import deque
+from flask import current_app, request
+from sqlalchemy.orm import selectinload, joinedload
+from werkzeug.utils import secure_filename
+from app.models.invoice import Invoice
+from app.services.pdf_service import PdfService
+from app.services.pdf_render_pool import get_render_pool, RenderQueueFull, RenderTimeout
+
+EXPORT_BATCH = 200
+COPY_CHUNK = 1024 * 1024
+
+
+class _ZipSink:
+    """
+    Write-only file object for zipfile. It has no seek(), so zipfile streams
+    entries with data descriptors; the bytes are handed out with drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BulkPdfExportService:
+    """
+    Streams a ZIP of invoice PDFs.
+
+    Invoices are read in id order, EXPORT_BATCH at a time. Cached PDFs are
+    copied straight from disk; the rest are rendered on the PDF worker pool,
+    keeping a small window of jobs in flight so workers stay busy while
+    earlier entries are written. Memory is bounded by that window, not by the
+    number of invoices.
+    """
+
+    @staticmethod
+    def _batches(query, batch_size):
+        last_id = 0
+        while True:
+            rows = query.options(
+                selectinload(Invoice.lines),
+                joinedload(Invoice.customer)
+            ).filter(Invoice.id > last_id).order_by(Invoice.id).limit(batch_size).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    @staticmethod
+    def entry_name(invoice):
+        # Numbers can sanitise to the same name ('A/1', 'A 1'): the id keeps entries distinct
+        number = secure_filename(invoice.invoice_number or '')
+        return f"{number}-{invoice.id}" if number else f"invoice-{invoice.id}"
+
+    @staticmethod
+    def stream_zip(query, company, batch_size=EXPORT_BATCH):
+        """Generator of ZIP bytes for every invoice in `query`."""
+        app = current_app._get_current_object()
+        pool = get_render_pool(app) if app.config.get('PDF_RENDER_POOL') else None
+        window = pool.workers * 2 if pool else 0
+
+        sink = _ZipSink()
+        archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        # (entry name, invoice id, digest, cached path, future, html)
+        pending = deque()
+
+        def write_oldest():
+            name, invoice_id, digest, path, future, html = pending.popleft()
+            if path:
+                with open(path, 'rb') as src, archive.open(f"{name}.pdf", 'w', force_zip64=True) as dest:
+                    while True:
+                        chunk = src.read(COPY_CHUNK)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                return
+
+            try:
+                pdf = pool.result(future) if future else PdfService.html_to_pdf_inline(html)
+            except RenderTimeout:
+                pdf = None
+            if pdf:
+                PdfService.store(invoice_id, digest, pdf)
+                archive.writestr(f"{name}.pdf", pdf)
+            else:
+                # Same fallback as the single download: the printable HTML
+                archive.writestr(f"{name}.html", html)
+
+        for rows in BulkPdfExportService._batches(query, batch_size):
+            for invoice in rows:
+                digest = PdfService.fingerprint(invoice, company)
+                name = BulkPdfExportService.entry_name(invoice)
+                path = PdfService.get_cached(invoice.id, digest)
+                if path:
+                    pending.append((name, invoice.id, digest, path, None, None))
+                else:
+                    html = PdfService.render_html(invoice, company)
+                    future = None
+                    while pool:
+                        try:
+                            future = pool.submit(html, base_url=request.url_root)
+                            break
+                        except RenderQueueFull:
+                            # Pool shared with other requests: make room or wait
+                            if pending:
+                                write_oldest()
+                                yield sink.drain()
+                            else:
+                                time.sleep(0.2)
+                    pending.append((name, invoice.id, digest, None, future, html))
+
+                while len(pending) > window:
+                    write_oldest()
+                    yield sink.drain()
+
+        while pending:
+            write_oldest()
+            yield sink.drain()
+
+        archive.close()
+        yield sink.drain()
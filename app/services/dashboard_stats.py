@@ -0,0 +1,94 @@
+import threading
+from sqlalchemy import func, update
+from app.extensions import db
+from app.models.company import Company
+from app.models.invoice import Invoice
+
+# company_id -> (stats_version, summary), per process
+_cache = {}
+_lock = threading.Lock()
+
+
+class DashboardStatsService:
+    """
+    Per-company KPI aggregates for the invoice dashboard.
+    Computed with a single GROUP BY (status, document type) and cached in each
+    process together with the company's stats_version. Invoice write paths
+    call invalidate(), which bumps that version in the database, so every
+    worker process sees the change on its next read (one primary-key lookup)
+    instead of serving stale figures.
+    """
+
+    @staticmethod
+    def compute(company_id):
+        query = db.session.query(
+            Invoice.status,
+            Invoice.fr_document_type,
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_gross), 0)
+        )
+        if company_id:
+            query = query.filter(Invoice.company_id == company_id)
+        rows = query.group_by(Invoice.status, Invoice.fr_document_type).all()
+
+        summary = {
+            'total': 0,
+            'drafts': 0,
+            'sent': 0,
+            'net_revenue': 0.0,
+            'by_status': {},
+            'by_type': {},
+        }
+        for status, doc_type, count, gross in rows:
+            status_key = status.value if status else 'UNKNOWN'
+            type_key = doc_type or 'INVOICE'
+            gross = float(gross or 0)
+
+            summary['total'] += count
+            for bucket, key in (('by_status', status_key), ('by_type', type_key)):
+                entry = summary[bucket].setdefault(key, {'count': 0, 'total_gross': 0.0})
+                entry['count'] += count
+                entry['total_gross'] += gross
+
+            if type_key == 'CREDIT_NOTE':
+                summary['net_revenue'] -= gross
+            else:
+                summary['net_revenue'] += gross
+
+        summary['drafts'] = summary['by_status'].get('DRAFT', {}).get('count', 0)
+        summary['sent'] = summary['by_status'].get('SENT', {}).get('count', 0)
+        return summary
+
+    @staticmethod
+    def version(company_id):
+        query = db.session.query(func.coalesce(func.sum(Company.stats_version), 0))
+        if company_id:
+            query = query.filter(Company.id == company_id)
+        return query.scalar()
+
+    @staticmethod
+    def get_summary(company_id):
+        version = DashboardStatsService.version(company_id)
+        with _lock:
+            cached = _cache.get(company_id)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        summary = DashboardStatsService.compute(company_id)
+        with _lock:
+            _cache[company_id] = (version, summary)
+        return summary
+
+    @staticmethod
+    def invalidate(company_id=None):
+        """
+        Marks the aggregates of one company (or all if company_id is None) as
+        stale in every process. Called after the invoice write is committed;
+        commits the version bump.
+        """
+        # updated_at kept as is: this is not an edit of the company
+        stmt = update(Company).values(stats_version=Company.stats_version + 1, updated_at=Company.updated_at)
+        if company_id is not None:
+            stmt = stmt.where(Company.id == company_id)
+        db.session.execute(stmt.execution_options(synchronize_session=False))
+        db.session.commit()
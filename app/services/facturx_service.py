@@ -0,0 +1,127 @@
+import hashlib
+from app.services.france_xml_generator import FranceXMLGenerator, DEFAULT_PROFILE
+from app.services.pdf_service import PdfService
+
+FACTURX_FILENAME = 'factur-x.xml'
+CACHE_DIRNAME = 'facturx_cache'
+
+# Factur-X profile -> fx:ConformanceLevel of the XMP metadata
+CONFORMANCE_LEVELS = {'BASIC': 'BASIC', 'EN16931': 'EN 16931', 'EXTENDED': 'EXTENDED'}
+
+# Factur-X properties and their PDF/A extension schema, added to the XMP
+# metadata WeasyPrint writes for PDF/A (which already has pdfaid, dc, pdf, xmp)
+_FX_DESCRIPTION = """<rdf:Description rdf:about="" xmlns:fx="urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#">
+<fx:DocumentType>INVOICE</fx:DocumentType>
+<fx:DocumentFileName>{filename}</fx:DocumentFileName>
+<fx:Version>1.0</fx:Version>
+<fx:ConformanceLevel>{conformance}</fx:ConformanceLevel>
+</rdf:Description>
+<rdf:Description rdf:about=""
+ xmlns:pdfaExtension="http://www.aiim.org/pdfa/ns/extension/"
+ xmlns:pdfaSchema="http://www.aiim.org/pdfa/ns/schema#"
+ xmlns:pdfaProperty="http://www.aiim.org/pdfa/ns/property#">
+<pdfaExtension:schemas><rdf:Bag><rdf:li rdf:parseType="Resource">
+<pdfaSchema:schema>Factur-X PDFA Extension Schema</pdfaSchema:schema>
+<pdfaSchema:namespaceURI>urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#</pdfaSchema:namespaceURI>
+<pdfaSchema:prefix>fx</pdfaSchema:prefix>
+<pdfaSchema:property><rdf:Seq>{properties}</rdf:Seq></pdfaSchema:property>
+</rdf:li></rdf:Bag></pdfaExtension:schemas>
+</rdf:Description>
+"""
+_FX_PROPERTY = (
+    '<rdf:li rdf:parseType="Resource"><pdfaProperty:name>{0}</pdfaProperty:name>'
+    '<pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category>'
+    '<pdfaProperty:description>{1}</pdfaProperty:description></rdf:li>'
+)
+_FX_PROPERTIES = (
+    ('DocumentFileName', 'The name of the embedded XML document'),
+    ('DocumentType', 'The type of the hybrid document in capital letters, e.g. INVOICE or ORDER'),
+    ('Version', 'The actual version of the standard applying to the embedded XML document'),
+    ('ConformanceLevel', 'The conformance level of the embedded XML document'),
+)
+
+
+def facturx_xmp(profile=DEFAULT_PROFILE, filename=FACTURX_FILENAME):
+    """The rdf:Description elements Factur-X adds to the XMP metadata."""
+    return _FX_DESCRIPTION.format(
+        filename=filename,
+        conformance=CONFORMANCE_LEVELS[profile],
+        properties=''.join(_FX_PROPERTY.format(name, text) for name, text in _FX_PROPERTIES)
+    ).encode('utf-8')
+
+
+def embed_facturx(pdf, xml, profile=DEFAULT_PROFILE, filename=FACTURX_FILENAME):
+    """
+    WeasyPrint finisher (render worker side), for a pdf/a-3b render: attaches
+    the XML to the pydyf document as its PDF/A-3 associated file and adds
+    the Factur-X properties to the XMP metadata. Everything stays in memory.
+    """
+    import pydyf
+
+    embedded = pydyf.Stream([xml], extra={
+        'Type': '/EmbeddedFile',
+        'Subtype': '/text#2Fxml',
+        'Params': pydyf.Dictionary({'Size': len(xml)}),
+    })
+    pdf.add_object(embedded)
+    filespec = pydyf.Dictionary({
+        'Type': '/Filespec',
+        'F': pydyf.String(filename),
+        'UF': pydyf.String(filename),
+        'Desc': pydyf.String('Factur-X invoice'),
+        'AFRelationship': '/Data',
+        'EF': pydyf.Dictionary({'F': embedded.reference, 'UF': embedded.reference}),
+    })
+    pdf.add_object(filespec)
+
+    names = pdf.catalog.setdefault('Names', pydyf.Dictionary())
+    names['EmbeddedFiles'] = pydyf.Dictionary({'Names': pydyf.Array([pydyf.String(filename), filespec.reference])})
+    pdf.catalog['AF'] = pydyf.Array([filespec.reference])
+
+    metadata = pdf.objects[int(pdf.catalog['Metadata'].split()[0])]
+    packet = b''.join(metadata.stream)
+    metadata.stream = [packet.replace(b'</rdf:RDF>', facturx_xmp(profile, filename) + b'</rdf:RDF>', 1)]
+
+
+class FacturXService:
+    """
+    Factur-X hybrid invoices: the invoice PDF as PDF/A-3 with its CII XML
+    (FranceXMLGenerator) embedded as factur-x.xml.
+
+    The XML is generated here and handed to the PDF render pool with the
+    HTML, so the worker renders the PDF once and embeds the XML in the same
+    pass, without temp files. Results are cached like plain PDFs, under
+        <UPLOAD_FOLDER>/facturx_cache/<invoice_id>/<sha256>.pdf
+    keyed by the PDF fingerprint, the XML bytes and the profile.
+    """
+
+    @staticmethod
+    def fingerprint(invoice, company, xml, profile=DEFAULT_PROFILE):
+        digest = hashlib.sha256()
+        digest.update(PdfService.fingerprint(invoice, company).encode('ascii'))
+        digest.update(hashlib.sha256(xml).digest())
+        digest.update(profile.encode('ascii'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def render(invoice, company, xml, profile=DEFAULT_PROFILE):
+        """Hybrid PDF bytes, or None without WeasyPrint. May raise RenderQueueFull / RenderTimeout."""
+        return PdfService.html_to_pdf(
+            PdfService.render_html(invoice, company),
+            facturx={'xml': xml, 'profile': profile}
+        )
+
+    @staticmethod
+    def get_or_build(invoice, company, profile=None):
+        """Returns (path to the cached Factur-X PDF or None, digest)."""
+        profile = profile or DEFAULT_PROFILE
+        xml = FranceXMLGenerator.build_invoice_xml(invoice, profile=profile).encode('utf-8')
+        digest = FacturXService.fingerprint(invoice, company, xml, profile)
+        path = PdfService.get_cached(invoice.id, digest, CACHE_DIRNAME)
+        if path:
+            return path, digest
+
+        pdf_bytes = FacturXService.render(invoice, company, xml, profile)
+        if not pdf_bytes:
+            return None, digest
+        return PdfService.store(invoice.id, digest, pdf_bytes, CACHE_DIRNAME), digest
@@ -1,31 +1,70 @@
 from xml.etree.ElementTree import Element, SubElement, tostring
 from app.models.invoice import Invoice
+from app.services.xml_core import XmlDocumentGenerator, Slot, start_tag
+from app.services.totals_engine import to_decimal
 from datetime import datetime
 
-class FranceXMLGenerator:
+NAMESPACES = {
+    'xmlns:rsm': 'urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100',
+    'xmlns:ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100',
+    'xmlns:udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100',
+    'xmlns:qdt': 'urn:un:unece:uncefact:data:standard:QualifiedDataType:100'
+}
+
+# GuidelineSpecifiedDocumentContextParameter/ID per Factur-X profile
+PROFILES = {
+    'BASIC': "urn:cen.eu:en16931:2017#compliant#urn:factur-x.eu:1p0:basic",
+    'EN16931': "urn:cen.eu:en16931:2017",
+    'EXTENDED': "urn:cen.eu:en16931:2017#conformant#urn:factur-x.eu:1p0:extended",
+}
+DEFAULT_PROFILE = 'EN16931'
+
+# Map codes: 30=Transfer, 58=Direct Debit, 48=Card, 10=Cash, 20=Cheque
+PAYMENT_MEANS_CODES = {'TRANSFER': '30', 'DIRECT_DEBIT': '58', 'CARD': '48', 'CASH': '10', 'CHEQUE': '20'}
+
+
+def _legal_text(c):
+    legal_text = f"{c.name}"
+    if c.legal_form: legal_text += f", {c.legal_form}"
+    if c.share_capital: legal_text += f" au capital de {c.share_capital}"
+    if c.rcs_city: legal_text += f", RCS {c.rcs_city}"
+    if c.siret: legal_text += f", SIRET {c.siret}"
+    return legal_text
+
+
+def _buyer_name(invoice):
+    # We fetch customer via invoice.customer if accessible
+    # For this snippet, using basic Placeholders or direct access if lazy loading works
+    return invoice.customer_name if hasattr(invoice, 'customer_name') else "Customer"
+
+
+class FranceXMLGenerator(XmlDocumentGenerator):
     """
     Generates Factur-X / UBL style XML for France (EN16931).
     Maps new mandatory fields (Legal Form, Capital, RCS, PO, Tax Point).
+
+    build_invoice_tree() builds the document as ElementTree elements. The
+    string outputs (build_invoice_xml, iter_invoice_xml, write_invoice_xml,
+    see XmlDocumentGenerator) do not: the invariant skeleton (root,
+    namespaces, document context per profile, constant elements) is compiled
+    once at import into text fragments, and each invoice only fills the
+    variable slots. They produce exactly tostring(build_invoice_tree(invoice)).
     """
 
+    # ---------- Sections ----------
+
     @staticmethod
-    def build_invoice_xml(invoice: Invoice) -> str:
-        # Root Element
-        root = Element('rsm:CrossIndustryInvoice', {
-            'xmlns:rsm': 'urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100',
-            'xmlns:ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100',
-            'xmlns:udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100',
-            'xmlns:qdt': 'urn:un:unece:uncefact:data:standard:QualifiedDataType:100'
-        })
-
-        # 1. ExchangedDocumentContext (Standard Profile)
-        context = SubElement(root, 'rsm:ExchangedDocumentContext')
+    def _document_context(profile=DEFAULT_PROFILE):
+        # 1. ExchangedDocumentContext (BASIC / EN16931 / EXTENDED profile)
+        context = Element('rsm:ExchangedDocumentContext')
         guideline = SubElement(context, 'ram:GuidelineSpecifiedDocumentContextParameter')
-        # "Basic" profile for broad compatibility (urn:cen.eu:en16931:2017#compliant#urn:factur-x.eu:1p0:basic)
-        SubElement(guideline, 'ram:ID').text = "urn:cen.eu:en16931:2017"
+        SubElement(guideline, 'ram:ID').text = PROFILES[profile]
+        return context
 
+    @staticmethod
+    def _document_header(invoice):
         # 2. ExchangedDocument (Header)
-        header = SubElement(root, 'rsm:ExchangedDocument')
+        header = Element('rsm:ExchangedDocument')
         SubElement(header, 'ram:ID').text = invoice.invoice_number
         # Type Code: 380 (Invoice), 381 (Credit Note)
         type_code = "381" if invoice.fr_document_type == "CREDIT_NOTE" else "380"
@@ -38,52 +77,48 @@ class FranceXMLGenerator:
         # Included Note (Legal Footer Fallback)
         # We place the legal string (Form, Capital, RCS) here to ensure it is readable in the data
         if invoice.company:
-            c = invoice.company
-            legal_text = f"{c.name}"
-            if c.legal_form: legal_text += f", {c.legal_form}"
-            if c.share_capital: legal_text += f" au capital de {c.share_capital}"
-            if c.rcs_city: legal_text += f", RCS {c.rcs_city}"
-            if c.siret: legal_text += f", SIRET {c.siret}"
-
             note = SubElement(header, 'ram:IncludedNote')
-            SubElement(note, 'ram:Content').text = legal_text
+            SubElement(note, 'ram:Content').text = _legal_text(invoice.company)
             SubElement(note, 'ram:SubjectCode').text = "ADU" # General Note
+        return header
 
-        # 3. SupplyChainTradeTransaction
-        trade = SubElement(root, 'rsm:SupplyChainTradeTransaction')
+    @staticmethod
+    def _line_item(line):
+        # --- A. IncludedSupplyChainTradeLineItem (one per line) ---
+        line_item = Element('ram:IncludedSupplyChainTradeLineItem')
 
-        # --- A. IncludedSupplyChainTradeLineItem (Lines) ---
-        for line in invoice.lines:
-            line_item = SubElement(trade, 'ram:IncludedSupplyChainTradeLineItem')
-
-            # AssociatedDocumentLineDocument (Line ID)
-            line_doc = SubElement(line_item, 'ram:AssociatedDocumentLineDocument')
-            SubElement(line_doc, 'ram:LineID').text = str(line.id)
-
-            # SpecifiedTradeProduct (Product Name/Code)
-            prod = SubElement(line_item, 'ram:SpecifiedTradeProduct')
-            if line.hsn_sac_code:
-                SubElement(prod, 'ram:GlobalID', schemeID='0001').text = line.hsn_sac_code
-            SubElement(prod, 'ram:Name').text = line.description
-
-            # SpecifiedLineTradeAgreement (Price)
-            line_agree = SubElement(line_item, 'ram:SpecifiedLineTradeAgreement')
-            net_price = SubElement(line_agree, 'ram:NetPriceProductTradePrice')
-            SubElement(net_price, 'ram:ChargeAmount').text = str(line.unit_price)
-
-            # SpecifiedLineTradeDelivery (Qty)
-            line_deliv = SubElement(line_item, 'ram:SpecifiedLineTradeDelivery')
-            SubElement(line_deliv, 'ram:BilledQuantity', unitCode='C62').text = str(line.quantity)
-
-            # SpecifiedLineTradeSettlement (Tax)
-            line_settle = SubElement(line_item, 'ram:SpecifiedLineTradeSettlement')
-            line_tax = SubElement(line_settle, 'ram:ApplicableTradeTax')
-            SubElement(line_tax, 'ram:TypeCode').text = "VAT"
-            SubElement(line_tax, 'ram:CategoryCode').text = "S" # S=Standard, Z=Zero, E=Exempt (simplified)
-            SubElement(line_tax, 'ram:RateApplicablePercent').text = str(line.vat_rate)
+        # AssociatedDocumentLineDocument (Line ID)
+        line_doc = SubElement(line_item, 'ram:AssociatedDocumentLineDocument')
+        SubElement(line_doc, 'ram:LineID').text = str(line.id)
+
+        # SpecifiedTradeProduct (Product Name/Code)
+        prod = SubElement(line_item, 'ram:SpecifiedTradeProduct')
+        if line.hsn_sac_code:
+            SubElement(prod, 'ram:GlobalID', schemeID='0001').text = line.hsn_sac_code
+        SubElement(prod, 'ram:Name').text = line.description
+
+        # SpecifiedLineTradeAgreement (Price)
+        line_agree = SubElement(line_item, 'ram:SpecifiedLineTradeAgreement')
+        net_price = SubElement(line_agree, 'ram:NetPriceProductTradePrice')
+        SubElement(net_price, 'ram:ChargeAmount').text = str(line.unit_price)
+
+        # SpecifiedLineTradeDelivery (Qty)
+        line_deliv = SubElement(line_item, 'ram:SpecifiedLineTradeDelivery')
+        SubElement(line_deliv, 'ram:BilledQuantity', unitCode='C62').text = str(line.quantity)
+
+        # SpecifiedLineTradeSettlement (Tax)
+        line_settle = SubElement(line_item, 'ram:SpecifiedLineTradeSettlement')
+        line_tax = SubElement(line_settle, 'ram:ApplicableTradeTax')
+        SubElement(line_tax, 'ram:TypeCode').text = "VAT"
+        SubElement(line_tax, 'ram:CategoryCode').text = "S" # S=Standard, Z=Zero, E=Exempt (simplified)
+        SubElement(line_tax, 'ram:RateApplicablePercent').text = str(line.vat_rate)
+        return line_item
 
+    @staticmethod
+    def _header_trade_sections(invoice):
+        """Agreement, delivery and settlement: everything after the lines."""
         # --- B. ApplicableHeaderTradeAgreement (Seller/Buyer/PO) ---
-        agreement = SubElement(trade, 'ram:ApplicableHeaderTradeAgreement')
+        agreement = Element('ram:ApplicableHeaderTradeAgreement')
 
         # PO Number (Buyer Reference) - MANDATORY if exists
         if invoice.purchase_order_number:
@@ -113,9 +148,7 @@ class FranceXMLGenerator:
 
         # Buyer
         buyer = SubElement(agreement, 'ram:BuyerTradeParty')
-        # We fetch customer via invoice.customer if accessible
-        # For this snippet, using basic Placeholders or direct access if lazy loading works
-        SubElement(buyer, 'ram:Name').text = invoice.customer_name if hasattr(invoice, 'customer_name') else "Customer"
+        SubElement(buyer, 'ram:Name').text = _buyer_name(invoice)
         if invoice.customer_vat:
             b_tax = SubElement(buyer, 'ram:SpecifiedTaxRegistration')
             SubElement(b_tax, 'ram:ID', schemeID='VA').text = invoice.customer_vat
@@ -126,23 +159,31 @@ class FranceXMLGenerator:
             SubElement(ord_ref, 'ram:IssuerAssignedID').text = invoice.purchase_order_number
 
         # --- C. ApplicableHeaderTradeDelivery (Date of Supply) ---
-        delivery = SubElement(trade, 'ram:ApplicableHeaderTradeDelivery')
+        delivery = Element('ram:ApplicableHeaderTradeDelivery')
 
         # Tax Point Date / Date of Supply
         # Used if different from IssueDate, but good practice to include always for "Livraison"
         event_date = invoice.tax_point_date or invoice.invoice_date
         chain_event = SubElement(delivery, 'ram:ActualDeliverySupplyChainEvent')
-        SubElement(chain_event, 'ram:OccurrenceDateTime').SubElement('udt:DateTimeString', format='102').text = event_date.strftime('%Y%m%d')
+        occurrence = SubElement(chain_event, 'ram:OccurrenceDateTime')
+        SubElement(occurrence, 'udt:DateTimeString', format='102').text = event_date.strftime('%Y%m%d')
 
         # --- D. ApplicableHeaderTradeSettlement (Payment/Totals) ---
-        settlement = SubElement(trade, 'ram:ApplicableHeaderTradeSettlement')
+        settlement = Element('ram:ApplicableHeaderTradeSettlement')
 
         # Payment Means
         if invoice.fr_payment_means:
             pay_means = SubElement(settlement, 'ram:SpecifiedTradeSettlementPaymentMeans')
-            # Map codes: 30=Transfer, 58=Direct Debit, 48=Card, 10=Cash, 20=Cheque
-            code_map = {'TRANSFER': '30', 'DIRECT_DEBIT': '58', 'CARD': '48', 'CASH': '10', 'CHEQUE': '20'}
-            SubElement(pay_means, 'ram:TypeCode').text = code_map.get(invoice.fr_payment_means, '30')
+            SubElement(pay_means, 'ram:TypeCode').text = PAYMENT_MEANS_CODES.get(invoice.fr_payment_means, '30')
+
+        # VAT breakdown, one per rate (BG-23)
+        for bucket in FranceXMLGenerator.vat_breakdown(invoice):
+            header_tax = SubElement(settlement, 'ram:ApplicableTradeTax')
+            SubElement(header_tax, 'ram:CalculatedAmount').text = str(to_decimal(bucket['tax_amount']))
+            SubElement(header_tax, 'ram:TypeCode').text = "VAT"
+            SubElement(header_tax, 'ram:BasisAmount').text = str(to_decimal(bucket['taxable_amount']))
+            SubElement(header_tax, 'ram:CategoryCode').text = "S"  # same simplification as the lines
+            SubElement(header_tax, 'ram:RateApplicablePercent').text = str(to_decimal(bucket['vat_rate']))
 
         # Totals
         totals = SubElement(settlement, 'ram:SpecifiedTradeSettlementHeaderMonetarySummation')
@@ -152,4 +193,152 @@ class FranceXMLGenerator:
         SubElement(totals, 'ram:GrandTotalAmount', currencyID='EUR').text = str(invoice.total_gross)
         SubElement(totals, 'ram:DuePayableAmount', currencyID='EUR').text = str(invoice.total_gross)
 
-        return tostring(root, encoding='unicode')
+        return [agreement, delivery, settlement]
+
+    # ---------- Tree mode ----------
+
+    @staticmethod
+    def build_invoice_tree(invoice: Invoice, profile=DEFAULT_PROFILE) -> Element:
+        # Root Element
+        root = Element('rsm:CrossIndustryInvoice', NAMESPACES)
+        root.append(FranceXMLGenerator._document_context(profile))
+        root.append(FranceXMLGenerator._document_header(invoice))
+
+        # 3. SupplyChainTradeTransaction
+        trade = SubElement(root, 'rsm:SupplyChainTradeTransaction')
+        for line in invoice.lines:
+            trade.append(FranceXMLGenerator._line_item(line))
+        trade.extend(FranceXMLGenerator._header_trade_sections(invoice))
+        return root
+
+    # ---------- Template mode (fills the compiled skeleton) ----------
+
+    @staticmethod
+    def _head(invoice, profile=DEFAULT_PROFILE):
+        parts = [
+            _SKELETONS[profile],
+            '<rsm:ExchangedDocument>',
+            _ID(invoice.invoice_number),
+            _TYPE_CREDIT_NOTE if invoice.fr_document_type == "CREDIT_NOTE" else _TYPE_INVOICE,
+            '<ram:IssueDateTime>', _DATE_102(invoice.invoice_date.strftime('%Y%m%d')), '</ram:IssueDateTime>',
+        ]
+        if invoice.company:
+            parts += ['<ram:IncludedNote>', _CONTENT(_legal_text(invoice.company)), _SUBJECT_ADU, '</ram:IncludedNote>']
+        parts.append('</rsm:ExchangedDocument><rsm:SupplyChainTradeTransaction>')
+        return ''.join(parts)
+
+    @staticmethod
+    def _fill_line(invoice, line, profile=DEFAULT_PROFILE):
+        return ''.join((
+            _LINE_OPEN, _LINE_ID(str(line.id)), _PRODUCT_OPEN,
+            _GLOBAL_ID(line.hsn_sac_code) if line.hsn_sac_code else '',
+            _NAME(line.description), _PRICE_OPEN, _CHARGE_AMOUNT(str(line.unit_price)), _QUANTITY_OPEN,
+            _BILLED_QUANTITY(str(line.quantity)), _LINE_TAX_OPEN, _RATE_PERCENT(str(line.vat_rate)), _LINE_CLOSE
+        ))
+
+    @staticmethod
+    def _tail(invoice, profile=DEFAULT_PROFILE):
+        """Header trade sections and the closing tags."""
+        company = invoice.company
+        po = invoice.purchase_order_number
+        parts = ['<ram:ApplicableHeaderTradeAgreement>']
+        if po:
+            parts.append(_BUYER_REFERENCE(po))
+
+        if company:
+            parts += ['<ram:SellerTradeParty>', _NAME(company.name)]
+            if company.siren:
+                parts += ['<ram:SpecifiedLegalOrganization>', _SIREN_ID(company.siren), '</ram:SpecifiedLegalOrganization>']
+            parts.append(_SELLER_ADDRESS)
+            if company.vat_number:
+                parts += ['<ram:SpecifiedTaxRegistration>', _VAT_ID(company.vat_number), '</ram:SpecifiedTaxRegistration>']
+            parts.append('</ram:SellerTradeParty>')
+        else:
+            parts.append(_SELLER_EMPTY)
+
+        parts += ['<ram:BuyerTradeParty>', _NAME(_buyer_name(invoice))]
+        if invoice.customer_vat:
+            parts += ['<ram:SpecifiedTaxRegistration>', _VAT_ID(invoice.customer_vat), '</ram:SpecifiedTaxRegistration>']
+        parts.append('</ram:BuyerTradeParty>')
+        if po:
+            parts += ['<ram:BuyerOrderReferencedDocument>', _ISSUER_ASSIGNED_ID(po), '</ram:BuyerOrderReferencedDocument>']
+        parts.append('</ram:ApplicableHeaderTradeAgreement>')
+
+        event_date = invoice.tax_point_date or invoice.invoice_date
+        parts += [_DELIVERY_OPEN, _DATE_102(event_date.strftime('%Y%m%d')), _DELIVERY_CLOSE]
+
+        parts.append('<ram:ApplicableHeaderTradeSettlement>')
+        if invoice.fr_payment_means:
+            parts += ['<ram:SpecifiedTradeSettlementPaymentMeans>',
+                      _TYPE_CODE(PAYMENT_MEANS_CODES.get(invoice.fr_payment_means, '30')),
+                      '</ram:SpecifiedTradeSettlementPaymentMeans>']
+        for bucket in FranceXMLGenerator.vat_breakdown(invoice):
+            parts += [
+                '<ram:ApplicableTradeTax>', _CALCULATED_AMOUNT(str(to_decimal(bucket['tax_amount']))), _TYPE_VAT,
+                _BASIS_AMOUNT(str(to_decimal(bucket['taxable_amount']))), _CATEGORY_STANDARD,
+                _RATE_PERCENT(str(to_decimal(bucket['vat_rate']))), '</ram:ApplicableTradeTax>'
+            ]
+        net, tax, gross = str(invoice.total_net), str(invoice.total_tax), str(invoice.total_gross)
+        parts += [
+            '<ram:SpecifiedTradeSettlementHeaderMonetarySummation>',
+            _LINE_TOTAL(net), _TAX_BASIS(net), _TAX_TOTAL(tax), _GRAND_TOTAL(gross), _DUE_PAYABLE(gross),
+            '</ram:SpecifiedTradeSettlementHeaderMonetarySummation></ram:ApplicableHeaderTradeSettlement>',
+            '</rsm:SupplyChainTradeTransaction></rsm:CrossIndustryInvoice>'
+        ]
+        return ''.join(parts)
+
+
+# ---------- Compiled once at import ----------
+
+def _compile_skeleton(profile):
+    """Root start tag with namespaces + the document context of `profile`."""
+    return (start_tag('rsm:CrossIndustryInvoice', NAMESPACES)
+            + tostring(FranceXMLGenerator._document_context(profile), encoding='unicode'))
+
+
+_SKELETONS = {profile: _compile_skeleton(profile) for profile in PROFILES}
+
+_ID = Slot('ram:ID')
+_NAME = Slot('ram:Name')
+_CONTENT = Slot('ram:Content')
+_TYPE_CODE = Slot('ram:TypeCode')
+_DATE_102 = Slot('udt:DateTimeString', format='102')
+_LINE_ID = Slot('ram:LineID')
+_GLOBAL_ID = Slot('ram:GlobalID', schemeID='0001')
+_CHARGE_AMOUNT = Slot('ram:ChargeAmount')
+_BILLED_QUANTITY = Slot('ram:BilledQuantity', unitCode='C62')
+_RATE_PERCENT = Slot('ram:RateApplicablePercent')
+_BUYER_REFERENCE = Slot('ram:BuyerReference')
+_SIREN_ID = Slot('ram:ID', schemeID='0002')
+_VAT_ID = Slot('ram:ID', schemeID='VA')
+_ISSUER_ASSIGNED_ID = Slot('ram:IssuerAssignedID')
+_LINE_TOTAL = Slot('ram:LineTotalAmount')
+_TAX_BASIS = Slot('ram:TaxBasisTotalAmount')
+_TAX_TOTAL = Slot('ram:TaxTotalAmount', currencyID='EUR')
+_GRAND_TOTAL = Slot('ram:GrandTotalAmount', currencyID='EUR')
+_DUE_PAYABLE = Slot('ram:DuePayableAmount', currencyID='EUR')
+_CALCULATED_AMOUNT = Slot('ram:CalculatedAmount')
+_BASIS_AMOUNT = Slot('ram:BasisAmount')
+
+_TYPE_INVOICE = _TYPE_CODE("380")
+_TYPE_CREDIT_NOTE = _TYPE_CODE("381")
+_SUBJECT_ADU = Slot('ram:SubjectCode')("ADU")
+_TYPE_VAT = _TYPE_CODE("VAT")
+_CATEGORY_STANDARD = Slot('ram:CategoryCode')("S")
+_SELLER_EMPTY = Slot('ram:SellerTradeParty').empty
+_SELLER_ADDRESS = ''.join((
+    '<ram:PostalTradeAddress>', Slot('ram:PostcodeCode')("75000"), Slot('ram:LineOne')("Address Line"),
+    Slot('ram:CountryID')("FR"), '</ram:PostalTradeAddress>'
+))
+
+_LINE_OPEN = '<ram:IncludedSupplyChainTradeLineItem><ram:AssociatedDocumentLineDocument>'
+_PRODUCT_OPEN = '</ram:AssociatedDocumentLineDocument><ram:SpecifiedTradeProduct>'
+_PRICE_OPEN = '</ram:SpecifiedTradeProduct><ram:SpecifiedLineTradeAgreement><ram:NetPriceProductTradePrice>'
+_QUANTITY_OPEN = '</ram:NetPriceProductTradePrice></ram:SpecifiedLineTradeAgreement><ram:SpecifiedLineTradeDelivery>'
+_LINE_TAX_OPEN = ('</ram:SpecifiedLineTradeDelivery><ram:SpecifiedLineTradeSettlement><ram:ApplicableTradeTax>'
+                  + _TYPE_VAT + _CATEGORY_STANDARD)
+_LINE_CLOSE = '</ram:ApplicableTradeTax></ram:SpecifiedLineTradeSettlement></ram:IncludedSupplyChainTradeLineItem>'
+_DELIVERY_OPEN = ('<ram:ApplicableHeaderTradeDelivery><ram:ActualDeliverySupplyChainEvent>'
+                  '<ram:OccurrenceDateTime>')
+_DELIVERY_CLOSE = ('</ram:OccurrenceDateTime></ram:ActualDeliverySupplyChainEvent>'
+                   '</ram:ApplicableHeaderTradeDelivery>')
@@ -1,9 +1,47 @@
+import atexit
+import hashlib
+import io
+import os
 import random
+import threading
 import time
+import zipfile
+from flask import current_app
 
 class FrancePDPClient:
-    """Stub for French Public Billing Portal"""
-    def send_invoice(self, invoice_data_xml):
+    """
+    French PDP / Chorus Pro client used by the submission workers. Without a
+    base_url it simulates the platform (stub); with one, requests go through
+    AsyncFrancePDPClient, opened once per process (run_shared).
+    """
+    channel = 'PDP'
+
+    # Deposit limits: a single document over MAX_DEPOSIT_BYTES still goes alone
+    MAX_DEPOSIT_BYTES = 50 * 1024 * 1024
+    MAX_DEPOSIT_DOCUMENTS = 1000
+
+    def __init__(self, base_url=None, token=None, timeout=30, max_retries=3):
+        self.base_url = base_url
+        self.token = token
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    @classmethod
+    def from_config(cls, config):
+        client = cls(config.get('PDP_BASE_URL'), config.get('PDP_API_TOKEN'),
+                     config.get('PLATFORM_TIMEOUT', 30), config.get('PLATFORM_MAX_RETRIES', 3))
+        client.MAX_DEPOSIT_BYTES = config.get('PDP_DEPOSIT_MAX_BYTES', cls.MAX_DEPOSIT_BYTES)
+        client.MAX_DEPOSIT_DOCUMENTS = config.get('PDP_DEPOSIT_MAX_DOCUMENTS', cls.MAX_DEPOSIT_DOCUMENTS)
+        return client
+
+    def remote(self, concurrency=1):
+        return AsyncFrancePDPClient(self.base_url, self.token, concurrency=concurrency,
+                                    timeout=self.timeout, max_retries=self.max_retries)
+
+    def send_invoice(self, invoice_data_xml, idempotency_key=None):
+        if self.base_url:
+            return run_shared(self.remote(), lambda client: client.send_invoice(invoice_data_xml, idempotency_key))
+
         # SIMULATION:
         print(f"Connecting to Chorus Pro / PDP...")
         time.sleep(1) # Simulate network latency
@@ -13,9 +51,66 @@ class FrancePDPClient:
             "message": "Deposited successfully"
         }
 
+    def send_batch(self, documents, idempotency_keys=None):
+        """
+        Batch mode: (reference, xml bytes) pairs packed into as few deposits as
+        the limits allow. Returns {reference: result} with the same result
+        dicts as send_invoice(), plus 'retryable' on failures.
+        With idempotency_keys ({reference: key}) each deposit carries a key
+        derived from its documents' keys.
+        """
+        deposits = list(pack_deposits(documents, self.MAX_DEPOSIT_BYTES, self.MAX_DEPOSIT_DOCUMENTS))
+        if self.base_url:
+            return run_shared(self.remote(concurrency=4), lambda client: self._send_remote(client, deposits, idempotency_keys))
+
+        results = {}
+        for deposit in deposits:
+            # SIMULATION: every document acknowledged
+            current_app.logger.info("Simulated PDP deposit of %s invoices", len(deposit))
+            acknowledgements = [
+                {'reference': reference, 'status': 'ACCEPTED', 'id': f"FR-PDP-{random.randint(10000, 99999)}"}
+                for reference, _ in deposit
+            ]
+            results.update(deposit_results([r for r, _ in deposit], {'acknowledgements': acknowledgements}))
+        return results
+
+    @staticmethod
+    async def _send_remote(client, deposits, idempotency_keys=None):
+        import asyncio
+        results = {}
+        sends = (client.send_deposit(deposit, deposit_key(deposit, idempotency_keys)) for deposit in deposits)
+        for acks in await asyncio.gather(*sends):
+            results.update(acks)
+        return results
+
 class SpainFaceB2BClient:
-    """Stub for Spanish FACeB2B"""
-    def send_invoice(self, invoice_data_xml):
+    """
+    Spanish FACeB2B client used by the submission workers: a stub without a
+    base_url, AsyncSpainFaceB2BClient (opened once per process) with one.
+    """
+    channel = 'FACEB2B'
+
+    def __init__(self, base_url=None, token=None, timeout=30, max_retries=3, concurrency=32):
+        self.base_url = base_url
+        self.token = token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('FACEB2B_BASE_URL'), config.get('FACEB2B_API_TOKEN'),
+                   config.get('PLATFORM_TIMEOUT', 30), config.get('PLATFORM_MAX_RETRIES', 3),
+                   config.get('PLATFORM_CONCURRENCY', 32))
+
+    def remote(self, concurrency=1):
+        return AsyncSpainFaceB2BClient(self.base_url, self.token, concurrency=concurrency,
+                                       timeout=self.timeout, max_retries=self.max_retries)
+
+    def send_invoice(self, invoice_data_xml, idempotency_key=None):
+        if self.base_url:
+            return run_shared(self.remote(), lambda client: client.send_invoice(invoice_data_xml, idempotency_key))
+
         # SIMULATION
         print(f"Connecting to FACeB2B...")
         time.sleep(1)
@@ -24,3 +119,372 @@ class SpainFaceB2BClient:
             "external_id": f"ES-FACE-{random.randint(10000,99999)}",
             "message": "Registered in FACe"
         }
+
+    def send_batch(self, documents, idempotency_keys=None):
+        """
+        Batch mode: FACeB2B has no multi-invoice deposit, so the (reference,
+        xml bytes) pairs are submitted one by one, `concurrency` at a time
+        through AsyncSpainFaceB2BClient.send_many. Returns {reference: result}.
+        """
+        if self.base_url:
+            return run_shared(self.remote(concurrency=self.concurrency),
+                              lambda client: client.collect_many(documents, idempotency_keys))
+
+        # SIMULATION: the whole batch registered in one go
+        current_app.logger.info("Simulated FACeB2B registration of %s invoices", len(documents))
+        return {reference: {
+            "success": True,
+            "external_id": f"ES-FACE-{random.randint(10000, 99999)}",
+            "message": "Registered in FACe"
+        } for reference, _ in documents}
+
+
+def run_remote(client, call):
+    """Blocking helper: opens `client` (an AsyncPlatformClient), awaits call(client), closes it."""
+    import asyncio
+
+    async def _run():
+        async with client:
+            return await call(client)
+
+    return asyncio.run(_run())
+
+
+# ---------- Shared clients (one set per worker process) ----------
+
+_shared_lock = threading.Lock()
+_shared_loop = None         # (pid, event loop running on a daemon thread)
+_shared_clients = {}
+
+
+def _client_loop():
+    global _shared_loop
+    import asyncio
+    if _shared_loop is None or _shared_loop[0] != os.getpid():
+        # First use, or first use after a fork: the parent's thread is gone
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='platform-clients', daemon=True).start()
+        _shared_loop = (os.getpid(), loop)
+        _shared_clients.clear()
+    return _shared_loop[1]
+
+
+def run_shared(client, call):
+    """
+    Blocking helper for the workers: awaits call() on this process's opened
+    client with the same settings as `client` (which is only used as the
+    template the first time). The clients, their aiohttp sessions and
+    keep-alive connections live on one event loop thread per process, so
+    consecutive sends reuse the same connections.
+    """
+    import asyncio
+    key = (type(client), client.base_url, client.token, client.concurrency, client.timeout, client.max_retries)
+    with _shared_lock:
+        loop = _client_loop()
+        shared = _shared_clients.get(key)
+        if shared is None:
+            asyncio.run_coroutine_threadsafe(client.__aenter__(), loop).result()
+            shared = _shared_clients[key] = client
+    return asyncio.run_coroutine_threadsafe(call(shared), loop).result()
+
+
+@atexit.register
+def close_shared_clients():
+    """Closes this process's shared clients (at exit, or to drop their connections)."""
+    import asyncio
+    with _shared_lock:
+        if _shared_loop is None or _shared_loop[0] != os.getpid():
+            return
+        loop = _shared_loop[1]
+        clients = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in clients:
+        asyncio.run_coroutine_threadsafe(client.__aexit__(None, None, None), loop).result(timeout=5)
+
+
+# ---------- Multi-invoice deposits ----------
+
+def pack_deposits(documents, max_bytes, max_documents):
+    """Groups (reference, xml bytes) pairs into lists within both limits, in order."""
+    deposit, size = [], 0
+    for reference, xml in documents:
+        if deposit and (size + len(xml) > max_bytes or len(deposit) >= max_documents):
+            yield deposit
+            deposit, size = [], 0
+        deposit.append((reference, xml))
+        size += len(xml)
+    if deposit:
+        yield deposit
+
+
+def deposit_key(documents, idempotency_keys):
+    """Idempotency key of a deposit: hash of its documents' keys, in order."""
+    if not idempotency_keys:
+        return None
+    digest = hashlib.sha256()
+    for reference, _ in documents:
+        digest.update(idempotency_keys[reference].encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_deposit_archive(documents):
+    """ZIP of one <reference>.xml entry per document, built in memory."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for reference, xml in documents:
+            archive.writestr(f"{reference}.xml", xml)
+    return buffer.getvalue()
+
+
+def deposit_results(references, payload, failure=None):
+    """
+    Per-reference results of a deposit from its acknowledgements:
+    {"acknowledgements": [{"reference", "status", "id", "code", "message"}]}.
+    ACCEPTED succeeds, REJECTED is final, anything else (or no
+    acknowledgement) can be retried. `failure` applies to every reference
+    when the deposit itself failed.
+    """
+    if failure is not None and not failure.get('success'):
+        return {reference: dict(failure) for reference in references}
+
+    acks = {str(ack.get('reference')): ack for ack in (payload or {}).get('acknowledgements', [])}
+    results = {}
+    for reference in references:
+        ack = acks.get(str(reference))
+        if ack is None:
+            results[reference] = {'success': False, 'retryable': True, 'error_code': 'NO_ACK',
+                                  'message': 'Missing from the deposit acknowledgement'}
+        elif ack.get('status') == 'ACCEPTED':
+            results[reference] = {'success': True, 'external_id': ack.get('id'),
+                                  'message': ack.get('message') or 'Deposited successfully'}
+        else:
+            results[reference] = {'success': False, 'retryable': ack.get('status') != 'REJECTED',
+                                  'error_code': str(ack.get('code') or ack.get('status')),
+                                  'message': ack.get('message') or ack.get('status')}
+    return results
+
+
+# ---------- asyncio transport (real platforms) ----------
+
+class RateLimitGate:
+    """
+    Shared pause for every request to one platform, driven by its rate-limit
+    headers: RateLimit-Remaining/-Reset, X-RateLimit-Remaining/-Reset and
+    Retry-After. Reset values are seconds from now, or an epoch timestamp.
+    """
+
+    def __init__(self):
+        self.blocked_until = 0.0
+
+    @staticmethod
+    def _seconds(value, now_epoch):
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            return None
+        # Large values are epoch timestamps rather than deltas
+        return seconds - now_epoch if seconds > 10 ** 9 else seconds
+
+    def update(self, headers, status):
+        now_epoch = time.time()
+        delay = None
+        if status in (429, 503) and headers.get('Retry-After'):
+            delay = self._seconds(headers.get('Retry-After'), now_epoch)
+        remaining = headers.get('RateLimit-Remaining', headers.get('X-RateLimit-Remaining'))
+        if delay is None and remaining is not None and remaining.strip() == '0':
+            delay = self._seconds(headers.get('RateLimit-Reset', headers.get('X-RateLimit-Reset')), now_epoch)
+        if delay and delay > 0:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+    async def wait(self):
+        import asyncio
+        while True:
+            pause = self.blocked_until - time.monotonic()
+            if pause <= 0:
+                return
+            await asyncio.sleep(pause)
+
+
+class AsyncPlatformClient:
+    """
+    asyncio client for an e-invoicing platform API.
+
+    One aiohttp session per client keeps a pool of keep-alive connections;
+    at most `concurrency` requests are in flight. Every request waits on the
+    platform's RateLimitGate, and 429/503/5xx or connection errors are
+    retried (Retry-After, else exponential backoff) up to `max_retries`.
+
+        async with AsyncFrancePDPClient.from_config(app.config) as client:
+            async for key, result in client.send_many(items):
+                ...
+
+    send_deposit() posts many documents as one ZIP deposit (see
+    FrancePDPClient.send_batch).
+    """
+
+    name = 'platform'
+    config_prefix = None
+    submit_path = '/invoices'
+    deposit_path = '/deposits'
+
+    def __init__(self, base_url, token=None, concurrency=32, timeout=30, max_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.gate = RateLimitGate()
+        self._session = None
+        self._slots = None
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        options = {
+            'base_url': config[f'{cls.config_prefix}_BASE_URL'],
+            'token': config.get(f'{cls.config_prefix}_API_TOKEN'),
+            'concurrency': config.get('PLATFORM_CONCURRENCY', 32),
+            'timeout': config.get('PLATFORM_TIMEOUT', 30),
+            'max_retries': config.get('PLATFORM_MAX_RETRIES', 3),
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    async def __aenter__(self):
+        import asyncio
+        import aiohttp
+        headers = {'Content-Type': 'application/xml', 'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=headers
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def _result(status, body):
+        data = body if isinstance(body, dict) else {}
+        if 200 <= status < 300:
+            return {
+                'success': True,
+                'external_id': data.get('id') or data.get('external_id'),
+                'message': data.get('message') or 'Deposited successfully',
+                'status': status,
+            }
+        return {
+            'success': False,
+            'retryable': status == 429 or status >= 500,
+            'error_code': str(data.get('code') or status),
+            'message': data.get('message') or f"HTTP {status}",
+            'status': status,
+        }
+
+    async def _post(self, path, body, interpret, headers=None):
+        """POST with rate limiting and retries; interpret(status, json) -> result dict."""
+        import asyncio
+        import aiohttp
+        url = f"{self.base_url}{path}"
+
+        async with self._slots:
+            attempt = 0
+            while True:
+                await self.gate.wait()
+                try:
+                    async with self._session.post(url, data=body, headers=headers) as resp:
+                        delay = self.gate.update(resp.headers, resp.status)
+                        try:
+                            payload = await resp.json(content_type=None)
+                        except ValueError:
+                            payload = None
+                        result = interpret(resp.status, payload)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    delay = None
+                    result = {'success': False, 'retryable': True, 'error_code': type(e).__name__,
+                              'message': str(e) or type(e).__name__, 'status': None}
+
+                if result['success'] or not result['retryable'] or attempt >= self.max_retries:
+                    return result
+                attempt += 1
+                if not delay:
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+
+    async def send_invoice(self, invoice_data_xml, idempotency_key=None):
+        """One submission (with retries). Returns the same dict as the sync clients."""
+        body = invoice_data_xml.encode('utf-8') if isinstance(invoice_data_xml, str) else invoice_data_xml
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        return await self._post(self.submit_path, body, self._result, headers)
+
+    async def send_deposit(self, documents, idempotency_key=None):
+        """
+        One multi-invoice deposit of (reference, xml bytes) pairs.
+        Returns {reference: result}; a failed deposit fails every reference.
+        """
+        references = [reference for reference, _ in documents]
+
+        def interpret(status, payload):
+            result = self._result(status, payload)
+            result['payload'] = payload
+            return result
+
+        headers = {'Content-Type': 'application/zip'}
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        result = await self._post(self.deposit_path, build_deposit_archive(documents), interpret, headers)
+        payload = result.pop('payload', None)
+        return deposit_results(references, payload, result)
+
+    async def send_many(self, items, idempotency_keys=None):
+        """
+        Submits (key, xml) pairs concurrently; yields (key, result) as each
+        completes. Only `concurrency` tasks exist at a time, so `items` can be
+        a lazy generator of any length. idempotency_keys: {key: Idempotency-Key}.
+        """
+        import asyncio
+        idempotency_keys = idempotency_keys or {}
+
+        async def _one(key, xml):
+            return key, await self.send_invoice(xml, idempotency_keys.get(key))
+
+        pending = set()
+        for key, xml in items:
+            pending.add(asyncio.ensure_future(_one(key, xml)))
+            if len(pending) >= self.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    async def collect_many(self, items, idempotency_keys=None):
+        """send_many() gathered into {key: result}."""
+        results = {}
+        async for key, result in self.send_many(items, idempotency_keys):
+            results[key] = result
+        return results
+
+    @classmethod
+    def run_many(cls, config, items, idempotency_keys=None, **overrides):
+        """Blocking helper for workers: submit all items, return {key: result}."""
+        return run_remote(cls.from_config(config, **overrides),
+                          lambda client: client.collect_many(items, idempotency_keys))
+
+
+class AsyncFrancePDPClient(AsyncPlatformClient):
+    """French PDP (Plateforme de Dématérialisation Partenaire) API."""
+    name = 'PDP'
+    config_prefix = 'PDP'
+
+
+class AsyncSpainFaceB2BClient(AsyncPlatformClient):
+    """Spanish FACeB2B API."""
+    name = 'FACeB2B'
+    config_prefix = 'FACEB2B'
@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.extensions import db
+from app.models.integration_log import IntegrationLog
+
+PAYLOAD_DIRNAME = 'integration_payloads'
+SNIPPET_LENGTH = 500
+# prune() leaves blobs written this recently: their row may not be committed yet
+PAYLOAD_GRACE_SECONDS = 3600
+
+
+class IntegrationLogService:
+    """
+    Writes and prunes IntegrationLog rows.
+
+    A row keeps only the first SNIPPET_LENGTH characters of its payload; the
+    full payload is gzipped into a content-addressed store:
+        <UPLOAD_FOLDER>/integration_payloads/<sha256[:2]>/<sha256>.gz
+    Identical payloads (retries, replays) share one blob, rewritten by every
+    store_payload() so that its mtime tells prune() it is in use. prune()
+    deletes old rows in batches, then the blobs no remaining row refers to and
+    nobody wrote in the last PAYLOAD_GRACE_SECONDS.
+    """
+
+    # ---------- Payload store ----------
+
+    @staticmethod
+    def payload_path(digest):
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], PAYLOAD_DIRNAME, digest[:2], f"{digest}.gz")
+
+    @staticmethod
+    def store_payload(payload):
+        """Saves the payload (one blob per content). Returns (sha256, size in bytes)."""
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        digest = hashlib.sha256(data).hexdigest()
+        path = IntegrationLogService.payload_path(digest)
+        # Always (re)written, even if it exists: prune() may be removing it
+        # right now, before the row that will refer to it is committed
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=6))
+        os.replace(tmp_path, path)
+        return digest, len(data)
+
+    @staticmethod
+    def load_payload(log):
+        """Full payload bytes of a log row, or None if it was not stored / was pruned."""
+        if not log.payload_hash:
+            return None
+        try:
+            with open(IntegrationLogService.payload_path(log.payload_hash), 'rb') as f:
+                return gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    # ---------- Rows ----------
+
+    @staticmethod
+    def entry(invoice_id, payload_type, payload, status_code, direction='OUTBOUND', error_code=None, external_id=None):
+        """A new (unsaved) IntegrationLog with its payload offloaded."""
+        digest = size = None
+        snippet = payload or ''
+        if payload:
+            if isinstance(payload, bytes):
+                snippet = payload[:SNIPPET_LENGTH * 4].decode('utf-8', 'ignore')
+            try:
+                digest, size = IntegrationLogService.store_payload(payload)
+            except OSError:
+                # The row (status, external id) matters more than the full payload
+                current_app.logger.exception("Could not store payload of invoice %s", invoice_id)
+        return IntegrationLog(
+            invoice_id=invoice_id,
+            direction=direction,
+            payload_type=payload_type,
+            payload_snippet=snippet[:SNIPPET_LENGTH],
+            payload_hash=digest,
+            payload_size=size,
+            status_code=status_code,
+            error_code=error_code,
+            external_id=external_id
+        )
+
+    # ---------- Retention ----------
+
+    @staticmethod
+    def prune(retention_days=None, batch_size=None):
+        """
+        Deletes rows older than the retention period, batch_size at a time (one
+        short transaction each), then their unreferenced payload blobs.
+        Returns (rows deleted, blobs deleted).
+        """
+        config = current_app.config
+        retention_days = retention_days if retention_days is not None else config.get('INTEGRATION_LOG_RETENTION_DAYS', 400)
+        batch_size = batch_size or config.get('INTEGRATION_LOG_PRUNE_BATCH', 5000)
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+        rows_deleted = blobs_deleted = 0
+        while True:
+            # Walks ix_integration_logs_created_id: oldest rows first, and the
+            # scan stops at the batch size
+            batch = (
+                db.session.query(IntegrationLog.id, IntegrationLog.payload_hash)
+                .filter(IntegrationLog.created_at < cutoff)
+                .order_by(IntegrationLog.created_at, IntegrationLog.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                return rows_deleted, blobs_deleted
+
+            hashes = {digest for _, digest in batch if digest}
+            IntegrationLog.query.filter(IntegrationLog.id.in_([row_id for row_id, _ in batch])).delete(synchronize_session=False)
+            db.session.commit()
+            rows_deleted += len(batch)
+
+            if hashes:
+                blobs_deleted += IntegrationLogService._remove_unused_blobs(hashes)
+
+    @staticmethod
+    def _used(hashes):
+        return {digest for (digest,) in
+                db.session.query(IntegrationLog.payload_hash)
+                .filter(IntegrationLog.payload_hash.in_(hashes)).distinct()}
+
+    @staticmethod
+    def _remove_unused_blobs(hashes):
+        """
+        Removes the blobs of hashes no row refers to. A blob is first moved
+        aside, then the references are checked again, so a row committed
+        meanwhile gets its blob back; blobs written within
+        PAYLOAD_GRACE_SECONDS are left alone, their row may still be pending.
+        """
+        fresh_after = time.time() - PAYLOAD_GRACE_SECONDS
+        moved = {}
+        for digest in hashes - IntegrationLogService._used(hashes):
+            path = IntegrationLogService.payload_path(digest)
+            aside = f"{path}.{uuid.uuid4().hex}.pruned"
+            try:
+                if os.stat(path).st_mtime >= fresh_after:
+                    continue
+                os.rename(path, aside)
+            except FileNotFoundError:
+                continue
+            moved[digest] = (path, aside)
+        if not moved:
+            return 0
+
+        db.session.rollback()  # fresh snapshot for the second check
+        used = IntegrationLogService._used(set(moved))
+        for digest, (path, aside) in moved.items():
+            if digest in used:
+                os.replace(aside, path)
+            else:
+                os.remove(aside)
+        return len(moved) - len(used)
+
+
+@click.command('prune-integration-logs')
+@click.option('--days', type=int, default=None, help='Retention in days (default INTEGRATION_LOG_RETENTION_DAYS).')
+@with_appcontext
+def prune_integration_logs_command(days):
+    """Delete old integration log rows and their stored payloads."""
+    rows, blobs = IntegrationLogService.prune(retention_days=days)
+    click.echo(f"Deleted {rows} log rows and {blobs} payloads.")
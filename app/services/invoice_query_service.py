@@ -0,0 +1,207 @@
+import base64
+from datetime import datetime
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
+from app.extensions import db
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.customer import Customer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SIDEBAR_WINDOW = 15
+
+
+class InvoiceQueryService:
+    """
+    Read-side helpers for invoice listings.
+    Pages are keyset-based (created_at DESC, id DESC) so the cost of a page
+    does not depend on how deep into the list the user is.
+    """
+
+    @staticmethod
+    def encode_cursor(created_at, invoice_id):
+        raw = f"{created_at.isoformat() if created_at else ''}|{invoice_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Returns (created_at, id) or None if the cursor is missing/invalid."""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            ts, inv_id = raw.split('|', 1)
+            return datetime.fromisoformat(ts), int(inv_id)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def filtered_query(company_id=None, status=None, doc_type=None):
+        query = Invoice.query
+        if company_id:
+            query = query.filter(Invoice.company_id == company_id)
+
+        if status and status in InvoiceStatus.__members__:
+            query = query.filter(Invoice.status == InvoiceStatus[status])
+
+        if doc_type == 'CREDIT_NOTE':
+            query = query.filter(Invoice.fr_document_type == 'CREDIT_NOTE')
+        elif doc_type == 'INVOICE':
+            # Legacy rows were saved without a document type
+            query = query.filter(or_(Invoice.fr_document_type == 'INVOICE', Invoice.fr_document_type == None))
+
+        return query
+
+    @staticmethod
+    def report_query(company_id, params):
+        """
+        Invoices matching the report/export filters (a request form or args):
+        filter_type 'period' (start_date/end_date) or 'customer' (customer_id),
+        plus an optional status. Without filter_type every given filter applies.
+        """
+        filter_type = params.get('filter_type')
+        query = InvoiceQueryService.filtered_query(company_id, status=params.get('status'))
+
+        if filter_type in (None, '', 'period'):
+            if params.get('start_date'):
+                query = query.filter(Invoice.invoice_date >= params.get('start_date'))
+            if params.get('end_date'):
+                query = query.filter(Invoice.invoice_date <= params.get('end_date'))
+        if filter_type in (None, '', 'customer'):
+            if params.get('customer_id'):
+                query = query.filter(Invoice.customer_id == params.get('customer_id'))
+
+        return query
+
+    @staticmethod
+    def list_page(company_id=None, status=None, doc_type=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns (invoices, next_cursor). Customer names are joined in the same
+        query so rendering a page never lazy-loads per row.
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+        query = InvoiceQueryService.filtered_query(company_id, status, doc_type).options(
+            joinedload(Invoice.customer).load_only(Customer.id, Customer.name)
+        )
+
+        position = InvoiceQueryService.decode_cursor(cursor)
+        if position:
+            created_at, inv_id = position
+            query = query.filter(or_(
+                Invoice.created_at < created_at,
+                and_(Invoice.created_at == created_at, Invoice.id < inv_id)
+            ))
+
+        # Fetch one extra row to know whether another page exists
+        rows = query.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = InvoiceQueryService.encode_cursor(last.created_at, last.id)
+
+        return rows, next_cursor
+
+    @staticmethod
+    def serialize_row(inv):
+        return {
+            'id': inv.id,
+            'invoice_number': inv.invoice_number,
+            'fr_document_type': inv.fr_document_type or 'INVOICE',
+            'status': inv.status.value if inv.status else None,
+            'invoice_date': inv.invoice_date.isoformat() if inv.invoice_date else None,
+            'due_date': inv.due_date.isoformat() if inv.due_date else None,
+            'customer_id': inv.customer_id,
+            'customer_name': inv.customer.name if inv.customer else None,
+            'customer_vat': inv.customer_vat,
+            'total_net': float(inv.total_net or 0),
+            'total_tax': float(inv.total_tax or 0),
+            'total_gross': float(inv.total_gross or 0),
+        }
+
+    # ---------- Sidebar (view / print pages) ----------
+
+    @staticmethod
+    def _sidebar_query(company_id=None):
+        # Lightweight projection: no ORM entities, no lazy loads
+        query = db.session.query(
+            Invoice.id,
+            Invoice.invoice_number,
+            Invoice.invoice_date,
+            Invoice.total_gross,
+            Invoice.created_at,
+            Invoice.fr_document_type,
+            Customer.name.label('customer_name')
+        ).outerjoin(Customer, Customer.id == Invoice.customer_id)
+        if company_id:
+            query = query.filter(Invoice.company_id == company_id)
+        return query
+
+    @staticmethod
+    def _older_than(query, created_at, inv_id, limit):
+        return query.filter(or_(
+            Invoice.created_at < created_at,
+            and_(Invoice.created_at == created_at, Invoice.id < inv_id)
+        )).order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def _newer_than(query, created_at, inv_id, limit):
+        rows = query.filter(or_(
+            Invoice.created_at > created_at,
+            and_(Invoice.created_at == created_at, Invoice.id > inv_id)
+        )).order_by(Invoice.created_at.asc(), Invoice.id.asc()).limit(limit).all()
+        rows.reverse()
+        return rows
+
+    @staticmethod
+    def sidebar_window(company_id=None, around_id=None, cursor=None, direction='older', size=SIDEBAR_WINDOW):
+        """
+        A slice of the invoice list (newest first) for the view page sidebar.
+        Either centred on `around_id`, or continuing from `cursor` in `direction`.
+        Returns (rows, newer_cursor, older_cursor); a cursor is None at either end.
+        """
+        size = max(1, min(int(size or SIDEBAR_WINDOW), MAX_PAGE_SIZE))
+        query = InvoiceQueryService._sidebar_query(company_id)
+
+        if around_id:
+            current = query.filter(Invoice.id == around_id).first()
+            if not current:
+                return [], None, None
+            half = size // 2
+            rest = size - half - 1
+            newer = InvoiceQueryService._newer_than(query, current.created_at, current.id, half + 1)
+            older = InvoiceQueryService._older_than(query, current.created_at, current.id, rest + 1)
+            has_newer, has_older = len(newer) > half, len(older) > rest
+            rows = newer[-half:] if half else []
+            rows += [current] + older[:rest]
+        else:
+            position = InvoiceQueryService.decode_cursor(cursor)
+            if not position:
+                position = (datetime.max, 0) if direction == 'older' else (datetime.min, 0)
+            if direction == 'newer':
+                rows = InvoiceQueryService._newer_than(query, position[0], position[1], size + 1)
+                has_newer, has_older = len(rows) > size, cursor is not None
+                rows = rows[-size:]
+            else:
+                rows = InvoiceQueryService._older_than(query, position[0], position[1], size + 1)
+                has_newer, has_older = cursor is not None, len(rows) > size
+                rows = rows[:size]
+
+        if not rows:
+            return [], None, None
+        newer_cursor = InvoiceQueryService.encode_cursor(rows[0].created_at, rows[0].id) if has_newer else None
+        older_cursor = InvoiceQueryService.encode_cursor(rows[-1].created_at, rows[-1].id) if has_older else None
+        return rows, newer_cursor, older_cursor
+
+    @staticmethod
+    def serialize_sidebar_row(row):
+        return {
+            'id': row.id,
+            'invoice_number': row.invoice_number,
+            'fr_document_type': row.fr_document_type or 'INVOICE',
+            'customer_name': row.customer_name,
+            'invoice_date': row.invoice_date.isoformat() if row.invoice_date else None,
+            'total_gross': float(row.total_gross or 0),
+        }
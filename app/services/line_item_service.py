@@ -0,0 +1,139 @@
+import re
+from sqlalchemy import update
+from app.extensions import db
+from app.models.invoice import InvoiceLine
+from app.models.product import Product
+
+# Form fields look like lines[<index>][<field>]
+LINE_KEY = re.compile(r"^lines\[(\d+)\]\[(\w+)\]$")
+
+# Columns compared when diffing submitted lines against stored ones
+DIFF_FIELDS = ('product_id', 'description', 'hsn_sac_code', 'quantity', 'unit_price', 'vat_rate', 'vat_amount', 'line_total')
+
+# Keep IN (...) lists well under the bind-parameter limits of SQLite/PostgreSQL
+IN_CHUNK = 500
+
+
+class LineItemService:
+    """
+    Reads invoice / credit note lines from the submitted form and stores them.
+    There is no cap on the number of lines: the form keys are walked once and
+    the rows are written with a single executemany INSERT.
+    """
+
+    @staticmethod
+    def group_form_lines(form):
+        """{index: {field: value}} for every lines[i][field] key, in index order."""
+        grouped = {}
+        for key, value in form.items():
+            if not key.startswith('lines['):
+                continue
+            m = LINE_KEY.match(key)
+            if m:
+                grouped.setdefault(int(m.group(1)), {})[m.group(2)] = value
+        return [grouped[i] for i in sorted(grouped)]
+
+    @staticmethod
+    def parse_form(form, company_id):
+        """
+        Returns a list of line dicts (InvoiceLine column names) for the
+        non-empty rows of the form. Amounts are left as submitted; run the
+        list through TotalsEngine before storing it.
+        A product_id that is not one of `company_id`'s products is dropped
+        (the line keeps its description).
+        """
+        lines = []
+        for raw in LineItemService.group_form_lines(form):
+            desc = raw.get('desc')
+            prod_id_raw = raw.get('product_id')
+            has_line = (desc and desc.strip()) or prod_id_raw
+            if not has_line:
+                continue
+
+            line = {
+                'product_id': int(prod_id_raw) if (prod_id_raw or '').strip().isdigit() else None,
+                'description': desc or '',
+                'hsn_sac_code': raw.get('hsn', ''),
+                'quantity': raw.get('qty') or '1',
+                'unit_price': raw.get('rate') or '0',
+                'vat_rate': raw.get('tax') or '0',
+            }
+            # Rows rendered from stored lines carry their id (edit forms)
+            line_id = (raw.get('id') or '').strip()
+            if line_id.isdigit():
+                line['id'] = int(line_id)
+            lines.append(line)
+
+        LineItemService._resolve_products(lines, company_id)
+        return lines
+
+    @staticmethod
+    def _resolve_products(lines, company_id):
+        """Set product_id to None on lines whose product is unknown or belongs to another company."""
+        submitted = {line['product_id'] for line in lines if line['product_id'] is not None}
+        if not submitted:
+            return
+        submitted = sorted(submitted)
+        known = set()
+        for i in range(0, len(submitted), IN_CHUNK):
+            known.update(db.session.scalars(
+                db.select(Product.id)
+                .where(Product.company_id == company_id, Product.id.in_(submitted[i:i + IN_CHUNK]))
+            ))
+        for line in lines:
+            if line['product_id'] not in known:
+                line['product_id'] = None
+
+    @staticmethod
+    def bulk_insert(invoice_id, lines):
+        """Insert all lines for `invoice_id` in one executemany round trip."""
+        if not lines:
+            return
+        db.session.execute(
+            db.insert(InvoiceLine),
+            [{**{k: v for k, v in line.items() if k != 'id'}, 'invoice_id': invoice_id} for line in lines]
+        )
+
+    @staticmethod
+    def sync_lines(invoice_id, lines):
+        """
+        Make the stored lines of `invoice_id` match `lines` with the fewest
+        writes: unchanged rows are left alone, changed rows are UPDATEd by id,
+        rows without a (known) id are INSERTed and rows no longer submitted are
+        DELETEd. Each kind of write is a single batched statement.
+        Returns (inserted, updated, deleted) counts.
+        """
+        stored = {
+            row.id: row for row in db.session.query(
+                InvoiceLine.id, *[getattr(InvoiceLine, f) for f in DIFF_FIELDS]
+            ).filter(InvoiceLine.invoice_id == invoice_id)
+        }
+
+        to_insert, to_update, kept = [], [], set()
+        for line in lines:
+            current = stored.get(line.get('id'))
+            if current is None or current.id in kept:
+                to_insert.append(line)
+                continue
+            kept.add(current.id)
+            changes = {
+                f: line[f] for f in DIFF_FIELDS
+                if f in line and (line[f] or '') != (getattr(current, f) or '')
+            }
+            if changes:
+                to_update.append(dict(changes, id=current.id))
+
+        to_delete = [line_id for line_id in stored if line_id not in kept]
+
+        for i in range(0, len(to_delete), IN_CHUNK):
+            db.session.execute(
+                db.delete(InvoiceLine)
+                .where(InvoiceLine.id.in_(to_delete[i:i + IN_CHUNK]))
+                .execution_options(synchronize_session=False)
+            )
+        if to_update:
+            # ORM bulk UPDATE by primary key (executemany)
+            db.session.execute(update(InvoiceLine), to_update)
+        LineItemService.bulk_insert(invoice_id, to_insert)
+
+        return len(to_insert), len(to_update), len(to_delete)
@@ -0,0 +1,150 @@
+import re
+from datetime import date, datetime
+from sqlalchemy import update, case
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.models.invoice_sequence import InvoiceSequence
+
+DEFAULT_START = 1001
+PREFIXES = {'INVOICE': 'INV', 'CREDIT_NOTE': 'CN'}
+
+
+class InvoiceNumberingService:
+    """
+    Allocates document numbers from the invoice_sequences table.
+
+    Each allocation is a single UPDATE ... RETURNING on the scope row, so it
+    costs one round trip no matter how many invoices exist. The UPDATE holds
+    the row lock (PostgreSQL) or the database write lock (SQLite) until the
+    surrounding transaction commits, so two requests can never get the same
+    number and a rolled-back request gives its number back.
+    """
+
+    @staticmethod
+    def prefix_for(company, document_type='INVOICE'):
+        if document_type == 'INVOICE' and company and company.invoice_prefix:
+            return company.invoice_prefix
+        return PREFIXES.get(document_type, 'INV')
+
+    @staticmethod
+    def format_number(prefix, year, value):
+        return f"{prefix}-{year}-{value}"
+
+    @staticmethod
+    def is_auto_number(number, company, document_type='INVOICE'):
+        """True if `number` looks like one we generate (PREFIX-YYYY-N)."""
+        prefix = InvoiceNumberingService.prefix_for(company, document_type)
+        return bool(re.match(rf"^{re.escape(prefix)}-\d{{4}}-\d+$", (number or "").strip()))
+
+    @staticmethod
+    def _floor(company, document_type):
+        # Settings > "Next Number" can only move the invoice sequence forward
+        if document_type == 'INVOICE' and company and company.starting_invoice_number:
+            return company.starting_invoice_number
+        return DEFAULT_START
+
+    @staticmethod
+    def _seed_value(company_id, prefix, year, floor):
+        """
+        First value for a new scope: after any number already issued with the
+        same prefix/year (e.g. invoices created before sequences existed).
+        Runs once per (company, year, type).
+        """
+        pattern = re.compile(rf"^{re.escape(prefix)}-{year}-(\d+)$")
+        issued = db.session.query(Invoice.invoice_number).filter(
+            Invoice.company_id == company_id,
+            Invoice.invoice_number.like(f"{prefix}-{year}-%")
+        )
+        highest = 0
+        for (number,) in issued:
+            m = pattern.match(number or "")
+            if m:
+                highest = max(highest, int(m.group(1)))
+        return max(floor, highest + 1)
+
+    @staticmethod
+    def _bump(company_id, year, document_type, floor):
+        next_value = InvoiceSequence.next_value
+        stmt = (
+            update(InvoiceSequence)
+            .where(
+                InvoiceSequence.company_id == company_id,
+                InvoiceSequence.fiscal_year == year,
+                InvoiceSequence.document_type == document_type
+            )
+            .values(
+                next_value=case((next_value < floor, floor), else_=next_value) + 1,
+                updated_at=datetime.utcnow()
+            )
+            .returning(InvoiceSequence.next_value)
+            .execution_options(synchronize_session=False)
+        )
+        new_next = db.session.execute(stmt).scalar()
+        return None if new_next is None else new_next - 1
+
+    @staticmethod
+    def allocate(company, document_type='INVOICE', on_date=None):
+        """Reserve and return the next number, e.g. 'INV-2026-1042'."""
+        year = (on_date or date.today()).year
+        prefix = InvoiceNumberingService.prefix_for(company, document_type)
+        floor = InvoiceNumberingService._floor(company, document_type)
+        company_id = company.id
+
+        while True:
+            value = InvoiceNumberingService._bump(company_id, year, document_type, floor)
+            if value is None:
+                # First document of this scope: create the row, then retry the bump.
+                # A concurrent creator may win the insert; that's fine either way.
+                seed = InvoiceNumberingService._seed_value(company_id, prefix, year, floor)
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(InvoiceSequence(
+                            company_id=company_id,
+                            fiscal_year=year,
+                            document_type=document_type,
+                            next_value=seed
+                        ))
+                except IntegrityError:
+                    pass
+                continue
+
+            candidate = InvoiceNumberingService.format_number(prefix, year, value)
+            # Only a number typed by hand in MANUAL mode can already hold this value
+            if not Invoice.query.filter_by(invoice_number=candidate).first():
+                return candidate
+
+    @staticmethod
+    def peek(company, document_type='INVOICE', on_date=None):
+        """Preview of the next number for the create forms (nothing is reserved)."""
+        year = (on_date or date.today()).year
+        prefix = InvoiceNumberingService.prefix_for(company, document_type)
+        floor = InvoiceNumberingService._floor(company, document_type)
+        if not company:
+            return InvoiceNumberingService.format_number(prefix, year, floor)
+
+        seq = InvoiceSequence.query.filter_by(
+            company_id=company.id, fiscal_year=year, document_type=document_type
+        ).first()
+        value = max(seq.next_value, floor) if seq else InvoiceNumberingService._seed_value(company.id, prefix, year, floor)
+        return InvoiceNumberingService.format_number(prefix, year, value)
+
+    @staticmethod
+    def free_variant(base, separator='-COPY-', exclude_id=None):
+        """
+        Returns `base` if unused, otherwise the first free `base{separator}N`.
+        All taken variants are read in one query instead of probing N by N.
+        """
+        query = db.session.query(Invoice.invoice_number).filter(
+            (Invoice.invoice_number == base) | Invoice.invoice_number.like(f"{base}{separator}%")
+        )
+        if exclude_id:
+            query = query.filter(Invoice.id != exclude_id)
+        taken = {number for (number,) in query}
+
+        if base not in taken:
+            return base
+        suffix = 1
+        while f"{base}{separator}{suffix}" in taken:
+            suffix += 1
+        return f"{base}{separator}{suffix}"
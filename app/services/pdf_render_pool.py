@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+
+class RenderQueueFull(Exception):
+    """Too many PDF jobs in flight; the caller should retry later."""
+    retry_after = 5
+
+
+class RenderTimeout(Exception):
+    """A PDF job did not finish within PDF_RENDER_TIMEOUT."""
+    retry_after = 10
+
+
+def stylesheet_paths(app):
+    """Stylesheets applied to every PDF, on the pool and inline alike."""
+    return [os.path.join(app.static_folder, 'css', 'invoice.css')]
+
+
+# ---------- Worker process side ----------
+
+_worker_state = {}
+_worker_state_lock = threading.Lock()
+
+
+def _init_worker(stylesheet_paths):
+    """Runs once per worker: import WeasyPrint and parse fonts/CSS up front."""
+    try:
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+        fonts = FontConfiguration()
+        _worker_state['font_config'] = fonts
+        _worker_state['stylesheets'] = [
+            CSS(filename=path, font_config=fonts) for path in stylesheet_paths if os.path.exists(path)
+        ]
+        _worker_state['engine'] = 'weasyprint'
+    except Exception:
+        _worker_state['engine'] = 'pdfkit'
+
+
+def engine_options(stylesheet_paths):
+    """
+    WeasyPrint options (parsed stylesheets, font configuration) for renders
+    outside the pool, loaded once per process like a worker's. Empty without
+    WeasyPrint.
+    """
+    with _worker_state_lock:
+        if not _worker_state:
+            _init_worker(stylesheet_paths)
+    if _worker_state['engine'] != 'weasyprint':
+        return {}
+    return {'stylesheets': _worker_state['stylesheets'], 'font_config': _worker_state['font_config']}
+
+
+def write_pdf(html, base_url=None, facturx=None, **options):
+    """
+    WeasyPrint render. With facturx={'xml', 'profile'} the result is
+    a Factur-X PDF/A-3 with the XML embedded, in the same single pass.
+    """
+    from weasyprint import HTML
+    if facturx:
+        from app.services.facturx_service import embed_facturx
+        options['pdf_variant'] = 'pdf/a-3b'
+        options['finisher'] = lambda document, pdf: embed_facturx(pdf, **facturx)
+    return HTML(string=html, base_url=base_url).write_pdf(**options)
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("PDF render exceeded its time limit")
+
+
+def _render_job(html, base_url, time_limit, facturx=None):
+    """Returns (pdf bytes or None, seconds spent rendering)."""
+    started = time.perf_counter()
+    use_alarm = time_limit and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        # Frees the worker even if the web request already gave up on this job
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(int(time_limit))
+    try:
+        if _worker_state.get('engine') == 'weasyprint':
+            pdf = write_pdf(
+                html, base_url, facturx,
+                stylesheets=_worker_state['stylesheets'],
+                font_config=_worker_state['font_config']
+            )
+        elif facturx:
+            pdf = None  # pdfkit cannot produce PDF/A-3 attachments
+        else:
+            import pdfkit
+            pdf = pdfkit.from_string(html, False)
+    except TimeoutError:
+        raise
+    except Exception:
+        pdf = None
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+    return pdf, time.perf_counter() - started
+
+
+# ---------- Web process side ----------
+
+class PdfRenderPool:
+    """
+    A pool of warm worker processes for HTML -> PDF.
+
+    At most `workers + queue_limit` jobs are accepted at once; beyond that
+    submit() raises RenderQueueFull so the route can answer 503 instead of
+    piling requests onto the web workers.
+    """
+
+    def __init__(self, workers=2, queue_limit=16, timeout=30, stylesheets=()):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._stylesheets = list(stylesheets)
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {
+            'in_flight': 0,
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'render_seconds_total': 0.0,
+            'render_seconds_max': 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self._stylesheets,)
+                )
+            return self._executor
+
+    def _release(self, future):
+        self._slots.release()
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._stats['failed'] += 1
+                return
+            pdf, seconds = future.result()
+            self._stats['completed' if pdf else 'failed'] += 1
+            self._stats['render_seconds_total'] += seconds
+            self._stats['render_seconds_max'] = max(self._stats['render_seconds_max'], seconds)
+
+    def submit(self, html, base_url=None, facturx=None):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise RenderQueueFull()
+
+        try:
+            try:
+                future = self._get_executor().submit(_render_job, html, base_url, self.timeout, facturx)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer): start a fresh pool
+                with self._lock:
+                    self._executor = None
+                future = self._get_executor().submit(_render_job, html, base_url, self.timeout, facturx)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['in_flight'] += 1
+            self._stats['submitted'] += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def result(self, future, timeout=None):
+        """Wait for a submitted job. Returns PDF bytes, or None if the engine failed."""
+        try:
+            pdf, _ = future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise RenderTimeout()
+        except TimeoutError:
+            # Raised inside the worker by its own alarm
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise RenderTimeout()
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            return None
+        return pdf
+
+    def render(self, html, base_url=None, timeout=None, facturx=None):
+        """Render and wait. Returns PDF bytes, or None if the engine failed."""
+        return self.result(self.submit(html, base_url, facturx), timeout)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['queue_limit'] = self.queue_limit
+        stats['queue_depth'] = max(0, stats['in_flight'] - self.workers)
+        done = stats['completed'] + stats['failed']
+        stats['render_seconds_avg'] = stats['render_seconds_total'] / done if done else 0.0
+        return stats
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool(app):
+    """One pool per web process, created on first use (i.e. after any fork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PdfRenderPool(
+                workers=app.config.get('PDF_RENDER_WORKERS') or os.cpu_count() or 2,
+                queue_limit=app.config.get('PDF_RENDER_QUEUE_LIMIT', 16),
+                timeout=app.config.get('PDF_RENDER_TIMEOUT', 30),
+                stylesheets=stylesheet_paths(app)
+            )
+        return _pool
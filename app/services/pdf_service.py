@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from flask import current_app, render_template, request, has_request_context
+from app.models.invoice import InvoiceStatus
+from app.services.pdf_render_pool import (
+    get_render_pool, write_pdf, engine_options, stylesheet_paths, RenderQueueFull
+)
+
+PDF_TEMPLATE = 'invoices/partials/invoice_render.html'
+CACHE_DIRNAME = 'pdf_cache'
+# Company bookkeeping, not document content: stats_version moves on every invoice save
+COMPANY_UNHASHED = ('stats_version', 'created_at', 'updated_at')
+
+
+def _row_snapshot(obj, exclude=()):
+    """Column values of a model instance, JSON-ready."""
+    data = {}
+    for col in obj.__table__.columns:
+        if col.key in exclude:
+            continue
+        value = getattr(obj, col.key, None)
+        if hasattr(value, 'value'):  # Enum
+            value = value.value
+        data[col.key] = value if value is None or isinstance(value, (int, float, str, bool)) else str(value)
+    return data
+
+
+class PdfService:
+    """
+    Renders invoice PDFs and keeps them in a content-addressed store:
+        <UPLOAD_FOLDER>/pdf_cache/<invoice_id>/<sha256>.pdf
+    The hash covers the invoice, its lines, the company (less its bookkeeping
+    columns) and the template, so any change to the document produces a new
+    key and a stale file is never served. An invoice's directory is removed
+    by invalidate() on every write to it.
+    """
+
+    _template_digest = None
+
+    # ---------- Keys ----------
+
+    @staticmethod
+    def _template_hash():
+        if PdfService._template_digest is None:
+            source, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, PDF_TEMPLATE)
+            PdfService._template_digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        return PdfService._template_digest
+
+    @staticmethod
+    def fingerprint(invoice, company):
+        snapshot = {
+            'invoice': _row_snapshot(invoice),
+            'lines': sorted((_row_snapshot(l) for l in invoice.lines), key=lambda l: l['id'] or 0),
+            'company': _row_snapshot(company, COMPANY_UNHASHED) if company else None,
+            'template': PdfService._template_hash(),
+        }
+        payload = json.dumps(snapshot, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _invoice_dir(invoice_id, dirname=CACHE_DIRNAME):
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], dirname, str(invoice_id))
+
+    @staticmethod
+    def cache_path(invoice_id, digest, dirname=CACHE_DIRNAME):
+        return os.path.join(PdfService._invoice_dir(invoice_id, dirname), f"{digest}.pdf")
+
+    # ---------- Rendering ----------
+
+    @staticmethod
+    def render_html(invoice, company):
+        return render_template(PDF_TEMPLATE, invoice=invoice, company=company, pdf_mode=True)
+
+    @staticmethod
+    def html_to_pdf(html, facturx=None):
+        """
+        Renders on the worker pool (see pdf_render_pool) unless PDF_RENDER_POOL
+        is off. May raise RenderQueueFull / RenderTimeout; returns None if no
+        PDF engine is available. `facturx` embeds an XML (see FacturXService).
+        """
+        app = current_app._get_current_object()
+        if app.config.get('PDF_RENDER_POOL'):
+            base_url = request.url_root if has_request_context() else None
+            return get_render_pool(app).render(html, base_url=base_url, facturx=facturx)
+        return PdfService.html_to_pdf_inline(html, facturx)
+
+    @staticmethod
+    def html_to_pdf_inline(html, facturx=None):
+        """
+        WeasyPrint with the pool's stylesheets and base URL, falling back to
+        pdfkit. Returns None if neither works.
+        """
+        base_url = request.url_root if has_request_context() else None
+        try:
+            options = engine_options(stylesheet_paths(current_app))
+            return write_pdf(html, base_url, facturx, **options)
+        except Exception:
+            if facturx:
+                return None
+            try:
+                import pdfkit
+                return pdfkit.from_string(html, False)
+            except Exception:
+                return None
+
+    # ---------- Store ----------
+
+    @staticmethod
+    def get_cached(invoice_id, digest, dirname=CACHE_DIRNAME):
+        path = PdfService.cache_path(invoice_id, digest, dirname)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def store(invoice_id, digest, pdf_bytes, dirname=CACHE_DIRNAME):
+        # Older renders are left alone: another request may be serving one right
+        # now. invalidate() clears them when the invoice is written.
+        os.makedirs(PdfService._invoice_dir(invoice_id, dirname), exist_ok=True)
+        path = PdfService.cache_path(invoice_id, digest, dirname)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp, path)
+        return path
+
+    @staticmethod
+    def get_or_render(invoice, company, digest=None):
+        """Returns (path to the cached PDF or None, digest)."""
+        digest = digest or PdfService.fingerprint(invoice, company)
+        path = PdfService.get_cached(invoice.id, digest)
+        if path:
+            return path, digest
+
+        pdf_bytes = PdfService.html_to_pdf(PdfService.render_html(invoice, company))
+        if not pdf_bytes:
+            return None, digest
+        return PdfService.store(invoice.id, digest, pdf_bytes), digest
+
+    @staticmethod
+    def invalidate(invoice_id):
+        from app.services.facturx_service import CACHE_DIRNAME as FACTURX_DIRNAME
+        for dirname in (CACHE_DIRNAME, FACTURX_DIRNAME):
+            shutil.rmtree(PdfService._invoice_dir(invoice_id, dirname), ignore_errors=True)
+
+    # ---------- Pre-warming ----------
+
+    @staticmethod
+    def prewarm(invoice_id):
+        """Render a finalised invoice in the background so the first download is a cache hit."""
+        app = current_app._get_current_object()
+
+        def _run():
+            from app.extensions import db
+            from app.models.invoice import Invoice
+            from app.models.company import Company
+            with app.app_context():
+                try:
+                    invoice = db.session.get(Invoice, invoice_id)
+                    if invoice and invoice.status != InvoiceStatus.DRAFT:
+                        with app.test_request_context():
+                            PdfService.get_or_render(invoice, Company.query.first())
+                except RenderQueueFull:
+                    pass  # Busy: the first download will render it instead
+                except Exception:
+                    app.logger.exception("PDF pre-warm failed for invoice %s", invoice_id)
+                finally:
+                    db.session.remove()
+
+        threading.Thread(target=_run, daemon=True).start()
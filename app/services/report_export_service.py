@@ -0,0 +1,171 @@
+import csv
+import enum
+import io
+import tempfile
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import select, or_, and_
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.models.customer import Customer, CustomerAddress
+from app.services.invoice_query_service import InvoiceQueryService
+
+FETCH_BATCH = 2000          # rows per query
+CSV_FLUSH_ROWS = 1000       # rows per chunk of the CSV response
+XLSX_MAX_ROWS = 1_048_575   # Excel's sheet limit, less the header row
+VIEW_LIMIT = 500            # rows shown on the report page
+
+DEFAULT_COLUMNS = ['invoice_number', 'invoice_date', 'total_gross']
+
+
+def _buyer_country():
+    # Billing country of the customer (first billing address), as a scalar subquery
+    return (
+        select(CustomerAddress.country)
+        .where(CustomerAddress.customer_id == Invoice.customer_id, CustomerAddress.type == 'BILLING')
+        .order_by(CustomerAddress.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+# Report field -> SQL expression (Invoice joined to Customer)
+COLUMNS = {
+    'invoice_number': lambda: Invoice.invoice_number,
+    'invoice_date': lambda: Invoice.invoice_date,
+    'due_date': lambda: Invoice.due_date,
+    'status': lambda: Invoice.status,
+    'purchase_order_number': lambda: Invoice.purchase_order_number,
+    'customer_name': lambda: Customer.name,
+    'buyer_vat': lambda: db.func.coalesce(Invoice.customer_vat, Customer.vat_number),
+    'buyer_siren': lambda: Customer.siren,
+    'buyer_country': _buyer_country,
+    'total_net': lambda: Invoice.total_net,
+    'total_tax': lambda: Invoice.total_tax,
+    'total_gross': lambda: Invoice.total_gross,
+    'currency': lambda: Customer.currency,
+    'fr_document_type': lambda: Invoice.fr_document_type,
+    'fr_transaction_category': lambda: Invoice.fr_transaction_category,
+    'fr_operation_nature': lambda: Invoice.fr_operation_nature,
+    'fr_payment_means': lambda: Invoice.fr_payment_means,
+    'tax_point_date': lambda: Invoice.tax_point_date,
+}
+
+
+def _cell(value):
+    """Value as written to the spreadsheet: numbers stay numbers, dates ISO."""
+    if value is None:
+        return ''
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class InvoiceReportService:
+    """
+    The invoice report as one projected query: only the selected fields,
+    with the customer joined in, read in FETCH_BATCH pages as plain tuples
+    (no ORM objects, no per-row lazy loads). Exports write those
+    tuples straight to CSV chunks or a write-only openpyxl workbook backed
+    by temp files, so memory stays flat whatever the number of rows.
+    """
+
+    @staticmethod
+    def columns(selected):
+        """Known fields among `selected`, in order; the defaults if none."""
+        return [c for c in selected if c in COLUMNS] or list(DEFAULT_COLUMNS)
+
+    @staticmethod
+    def label(column):
+        return column.replace('_', ' ').title()
+
+    @staticmethod
+    def query(company_id, params, columns, *extra):
+        return (
+            InvoiceQueryService.report_query(company_id, params)
+            .outerjoin(Customer, Customer.id == Invoice.customer_id)
+            .with_entities(*[COLUMNS[c]().label(c) for c in columns], *extra)
+            .order_by(Invoice.invoice_date, Invoice.id)
+        )
+
+    @staticmethod
+    def iter_rows(company_id, params, columns, progress=None):
+        """
+        Formatted rows (lists), FETCH_BATCH per query. Pages are read by
+        keyset on (invoice_date, id), so no cursor stays open between them
+        and the caller may commit while iterating. `progress`, if given, is
+        called with the number of rows read after each page.
+        """
+        query = InvoiceReportService.query(company_id, params, columns, Invoice.invoice_date, Invoice.id)
+        done, position = 0, None
+        while True:
+            page = query
+            if position:
+                last_date, last_id = position
+                page = page.filter(or_(
+                    Invoice.invoice_date > last_date,
+                    and_(Invoice.invoice_date == last_date, Invoice.id > last_id)
+                ))
+            rows = page.limit(FETCH_BATCH).all()
+            for row in rows:
+                yield [_cell(value) for value in row[:-2]]
+            done += len(rows)
+            if progress:
+                progress(done)
+            if len(rows) < FETCH_BATCH:
+                return
+            position = tuple(rows[-1][-2:])
+
+    @staticmethod
+    def preview(company_id, params, columns, limit=VIEW_LIMIT):
+        """(first `limit` rows as dicts, total count) for the report page."""
+        query = InvoiceReportService.query(company_id, params, columns)
+        rows = [dict(zip(columns, (_cell(v) for v in row))) for row in query.limit(limit)]
+        total = len(rows) if len(rows) < limit else query.order_by(None).count()
+        return rows, total
+
+    @staticmethod
+    def iter_csv(company_id, params, columns, progress=None):
+        """UTF-8 CSV (with BOM, for Excel) in chunks of CSV_FLUSH_ROWS rows."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow([InvoiceReportService.label(c) for c in columns])
+        for n, row in enumerate(InvoiceReportService.iter_rows(company_id, params, columns, progress), start=1):
+            writer.writerow(row)
+            if n % CSV_FLUSH_ROWS == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def write_xlsx(company_id, params, columns, fp=None, progress=None):
+        """
+        Writes the workbook to `fp` (a temp file by default) and returns it,
+        rewound. A new sheet is started every XLSX_MAX_ROWS rows.
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        header = [InvoiceReportService.label(c) for c in columns]
+        sheet, sheet_rows, sheets = None, XLSX_MAX_ROWS, 0
+        for row in InvoiceReportService.iter_rows(company_id, params, columns, progress):
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheets += 1
+                sheet = workbook.create_sheet('Invoices' if sheets == 1 else f"Invoices {sheets}")
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet('Invoices').append(header)
+
+        fp = fp or tempfile.TemporaryFile()
+        workbook.save(fp)
+        fp.seek(0)
+        return fp
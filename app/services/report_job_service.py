@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.report_job import ReportJob
+from app.services.report_export_service import InvoiceReportService
+from app.services.submission_queue import InProcessQueue, RQSubmissionQueue, _in_worker_app
+
+REPORT_QUEUE_NAME = 'reports'
+RESULT_DIRNAME = 'reports'
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+FINISHED = 'FINISHED'
+FAILED = 'FAILED'
+
+# Report filters that change the result (see InvoiceQueryService.report_query)
+FILTER_KEYS = ('filter_type', 'start_date', 'end_date', 'customer_id', 'status')
+
+FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def get_report_queue(app):
+    """One queue object per app, chosen by REPORT_QUEUE ('rq' or 'inprocess')."""
+    queue = app.extensions.get('report_queue')
+    if queue is None:
+        if app.config.get('REPORT_QUEUE') == 'inprocess':
+            queue = InProcessQueue(name=REPORT_QUEUE_NAME)
+        else:
+            queue = RQSubmissionQueue(app.config['REDIS_URL'], name=REPORT_QUEUE_NAME,
+                                      job_timeout=app.config.get('REPORT_JOB_TIMEOUT', 3600))
+        app.extensions['report_queue'] = queue
+    return queue
+
+
+def run_report_job(job_id):
+    return _in_worker_app(ReportJobService.run, job_id)
+
+
+class ReportJobService:
+    """
+    Invoice report exports built by a background worker.
+
+    A request is identified by its company, format, columns and filters;
+    identical requests share one ReportJob row (unique request_key). While
+    the job is queued or running, an identical request joins it instead of
+    starting a second computation. The result file is stored under
+        <UPLOAD_FOLDER>/reports/<job_id>/invoice_report.<format>
+    and stays downloadable from the job page for REPORT_RESULT_TTL seconds.
+    A new identical request after that point rebuilds it: invoices may have
+    been created or edited since. So does a request for a failed job, or for
+    one whose worker stopped reporting progress for REPORT_JOB_TIMEOUT seconds.
+    """
+
+    @staticmethod
+    def request_params(form):
+        """(columns, filters) of a report form, normalised for the request key."""
+        columns = InvoiceReportService.columns(form.getlist('columns'))
+        filters = {name: form.get(name) for name in FILTER_KEYS if form.get(name)}
+        return columns, filters
+
+    @staticmethod
+    def request_key(company_id, fmt, columns, filters):
+        data = json.dumps({'company_id': company_id, 'format': fmt, 'columns': columns, 'filters': filters}, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def result_path(job):
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], job.file_path) if job.file_path else None
+
+    @staticmethod
+    def is_live(job, now=None):
+        """True while the job is running or its result can still be downloaded."""
+        now = now or datetime.utcnow()
+        if job.status in (QUEUED, RUNNING):
+            timeout = current_app.config.get('REPORT_JOB_TIMEOUT', 3600)
+            return job.updated_at is not None and job.updated_at > now - timedelta(seconds=timeout)
+        if job.status == FINISHED:
+            path = ReportJobService.result_path(job)
+            return job.expires_at > now and path is not None and os.path.exists(path)
+        return False
+
+    # ---------- Web side ----------
+
+    @staticmethod
+    def submit(company_id, fmt, form):
+        """The job for this request: an existing live one, or a newly queued one."""
+        columns, filters = ReportJobService.request_params(form)
+        key = ReportJobService.request_key(company_id, fmt, columns, filters)
+        now = datetime.utcnow()
+
+        job = ReportJob.query.filter_by(request_key=key).first()
+        # Only a job still being built is shared: a finished file may be missing later changes
+        if job is not None and job.status in (QUEUED, RUNNING) and ReportJobService.is_live(job, now):
+            return job
+
+        if job is None:
+            try:
+                with db.session.begin_nested():
+                    job = ReportJob(
+                        request_key=key,
+                        company_id=company_id,
+                        format=fmt,
+                        params=json.dumps({'columns': columns, 'filters': filters}),
+                        status=QUEUED,
+                        rows_done=0
+                    )
+                    db.session.add(job)
+                db.session.commit()
+            except IntegrityError:
+                # An identical request was submitted at the same moment
+                return ReportJob.query.filter_by(request_key=key).one()
+        else:
+            # Restart it, unless a concurrent request already did
+            old_status, old_updated_at = job.status, job.updated_at
+            stmt = (
+                update(ReportJob)
+                .where(ReportJob.id == job.id, ReportJob.status == old_status, ReportJob.updated_at == old_updated_at)
+                .values(status=QUEUED, rows_done=0, rows_total=None, error=None,
+                        finished_at=None, expires_at=None, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            restarted = db.session.execute(stmt).rowcount == 1
+            db.session.commit()
+            db.session.refresh(job)
+            if not restarted:
+                return job
+
+        try:
+            get_report_queue(current_app._get_current_object()).enqueue(run_report_job, job.id)
+        except Exception as e:
+            job.status = FAILED
+            job.error = f"Could not be queued: {type(e).__name__}"[:255]
+            db.session.commit()
+            raise
+        # The in-process queue has already run it
+        db.session.refresh(job)
+        return job
+
+    @staticmethod
+    def status(job):
+        """Polling payload of a job."""
+        live = ReportJobService.is_live(job)
+        status = job.status
+        if job.status == FINISHED and not live:
+            status = 'EXPIRED'
+        elif job.status in (QUEUED, RUNNING) and not live:
+            status = FAILED
+        percent = None
+        if job.rows_total:
+            percent = min(100, round(job.rows_done * 100 / job.rows_total))
+        elif job.status == FINISHED:
+            percent = 100
+        return {
+            'id': job.id,
+            'status': status,
+            'format': job.format,
+            'rows_done': job.rows_done,
+            'rows_total': job.rows_total,
+            'percent': percent,
+            'error': job.error,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+            'ready': status == FINISHED,
+        }
+
+    # ---------- Worker side ----------
+
+    @staticmethod
+    def run(job_id):
+        """Builds the result file. Only one worker runs a given queued job."""
+        claim = (
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.status == QUEUED)
+            .values(status=RUNNING, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        claimed = db.session.execute(claim).rowcount == 1
+        db.session.commit()
+        if not claimed:
+            return None
+
+        job = db.session.get(ReportJob, job_id)
+        params = json.loads(job.params)
+        columns, filters = params['columns'], params['filters']
+
+        relative_path = os.path.join(RESULT_DIRNAME, str(job.id), f"invoice_report.{job.format}")
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        def progress(done):
+            # Also the heartbeat is_live() watches
+            job.rows_done = done
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+
+        try:
+            job.rows_total = InvoiceReportService.query(job.company_id, filters, columns).order_by(None).count()
+            db.session.commit()
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                if job.format == 'csv':
+                    for chunk in InvoiceReportService.iter_csv(job.company_id, filters, columns, progress):
+                        f.write(chunk)
+                else:
+                    InvoiceReportService.write_xlsx(job.company_id, filters, columns, fp=f, progress=progress)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            db.session.rollback()
+            job.status = FAILED
+            job.error = f"{type(e).__name__}: {e}"[:255]
+            db.session.commit()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = datetime.utcnow()
+        job.status = FINISHED
+        job.file_path = relative_path
+        job.finished_at = now
+        job.expires_at = now + timedelta(seconds=current_app.config.get('REPORT_RESULT_TTL', 24 * 3600))
+        db.session.commit()
+        return {'job_id': job.id, 'rows': job.rows_done}
+
+    # ---------- Expiry ----------
+
+    @staticmethod
+    def prune():
+        """Deletes expired results and failed jobs older than the result TTL. Returns the number of jobs."""
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=current_app.config.get('REPORT_RESULT_TTL', 24 * 3600))
+        jobs = ReportJob.query.filter(or_(
+            ReportJob.expires_at < now,
+            and_(ReportJob.status == FAILED, ReportJob.updated_at < now - ttl)
+        )).all()
+        for job in jobs:
+            shutil.rmtree(os.path.join(current_app.config['UPLOAD_FOLDER'], RESULT_DIRNAME, str(job.id)), ignore_errors=True)
+            db.session.delete(job)
+        db.session.commit()
+        return len(jobs)
+
+
+@click.command('prune-report-jobs')
+@with_appcontext
+def prune_report_jobs_command():
+    """Delete expired report exports and their files."""
+    click.echo(f"Deleted {ReportJobService.prune()} report jobs.")
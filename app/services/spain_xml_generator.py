@@ -1,35 +1,275 @@
-from xml.etree.ElementTree import Element, SubElement, tostring
-from app.models.invoice import Invoice
+from app.services.totals_engine import to_decimal
+from app.services.xml_core import XmlDocumentGenerator, InvoiceDataError, Slot, start_tag
 
-class SpainXMLGenerator:
-    """Generates FacturaE style XML for Spain"""
+SCHEMA_VERSION = "3.2.2"
+NAMESPACES = {
+    'xmlns:fe': 'http://www.facturae.gob.es/formato/Versiones/Facturae/3_2_2.xml',
+    'xmlns:ds': 'http://www.w3.org/2000/09/xmldsig#'
+}
+
+# FacturaE uses ISO 3166-1 alpha-3; addresses store alpha-2
+COUNTRY_ALPHA3 = {
+    'ES': 'ESP', 'FR': 'FRA', 'PT': 'PRT', 'DE': 'DEU', 'IT': 'ITA', 'BE': 'BEL', 'NL': 'NLD', 'LU': 'LUX',
+    'IE': 'IRL', 'AT': 'AUT', 'DK': 'DNK', 'SE': 'SWE', 'FI': 'FIN', 'PL': 'POL', 'CZ': 'CZE', 'SK': 'SVK',
+    'SI': 'SVN', 'HU': 'HUN', 'RO': 'ROU', 'BG': 'BGR', 'HR': 'HRV', 'GR': 'GRC', 'CY': 'CYP', 'MT': 'MLT',
+    'EE': 'EST', 'LV': 'LVA', 'LT': 'LTU', 'GB': 'GBR', 'CH': 'CHE', 'NO': 'NOR', 'US': 'USA', 'MA': 'MAR',
+    'AD': 'AND', 'MC': 'MCO', 'IN': 'IND', 'CN': 'CHN',
+}
+EU_COUNTRIES = {
+    'AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'ES', 'FI', 'FR', 'GR', 'HR', 'HU', 'IE', 'IT', 'LT',
+    'LU', 'LV', 'MT', 'NL', 'PL', 'PT', 'RO', 'SE', 'SI', 'SK',
+}
+# Spanish postcodes start with the INE code of their province
+SPAIN_PROVINCES = {
+    '01': 'Araba/Álava', '02': 'Albacete', '03': 'Alicante/Alacant', '04': 'Almería', '05': 'Ávila',
+    '06': 'Badajoz', '07': 'Illes Balears', '08': 'Barcelona', '09': 'Burgos', '10': 'Cáceres', '11': 'Cádiz',
+    '12': 'Castellón/Castelló', '13': 'Ciudad Real', '14': 'Córdoba', '15': 'A Coruña', '16': 'Cuenca',
+    '17': 'Girona', '18': 'Granada', '19': 'Guadalajara', '20': 'Gipuzkoa', '21': 'Huelva', '22': 'Huesca',
+    '23': 'Jaén', '24': 'León', '25': 'Lleida', '26': 'La Rioja', '27': 'Lugo', '28': 'Madrid', '29': 'Málaga',
+    '30': 'Murcia', '31': 'Navarra', '32': 'Ourense', '33': 'Asturias', '34': 'Palencia', '35': 'Las Palmas',
+    '36': 'Pontevedra', '37': 'Salamanca', '38': 'S.C. de Tenerife', '39': 'Cantabria', '40': 'Segovia',
+    '41': 'Sevilla', '42': 'Soria', '43': 'Tarragona', '44': 'Teruel', '45': 'Toledo', '46': 'Valencia/València',
+    '47': 'Valladolid', '48': 'Bizkaia', '49': 'Zamora', '50': 'Zaragoza', '51': 'Ceuta', '52': 'Melilla',
+}
+
+# 01=Cash, 02=Direct debit, 04=Transfer, 11=Cheque, 19=Card
+PAYMENT_MEANS_CODES = {'TRANSFER': '04', 'DIRECT_DEBIT': '02', 'CARD': '19', 'CASH': '01', 'CHEQUE': '11'}
+TAX_TYPE_IVA = '01'
+
+
+def _amount(value):
+    return f"{to_decimal(value):.2f}"
+
+
+def _line_net(line):
+    # Stored per line: line_total = net + VAT
+    return to_decimal(line.line_total) - to_decimal(line.vat_amount)
+
+
+def _sign(invoice):
+    # Credit notes are stored with positive amounts; FacturaE corrects by differences
+    return -1 if invoice.fr_document_type == "CREDIT_NOTE" else 1
+
+
+def _main_address(party):
+    addresses = getattr(party, 'addresses', None) or []
+    billing = [a for a in addresses if a.type == 'BILLING']
+    return (billing or addresses or [None])[0]
+
+
+def _country(party, address):
+    if address is not None and address.country:
+        return address.country.upper()
+    vat = (getattr(party, 'vat_number', None) or '').upper()
+    return vat[:2] if vat[:2].isalpha() else 'ES'
+
+
+def _spanish_province(who, zip_code):
+    zip_code = (zip_code or '').replace(' ', '')
+    province = SPAIN_PROVINCES.get(zip_code[:2]) if len(zip_code) == 5 and zip_code.isdigit() else None
+    if province is None:
+        raise InvoiceDataError(f"{who}: '{zip_code}' is not a Spanish postcode (FacturaE needs the province)")
+    return province
+
+
+class SpainXMLGenerator(XmlDocumentGenerator):
+    """
+    Generates FacturaE 3.2.2 XML for Spain (one invoice per file, unsigned).
+
+    Uses the same pipeline as the French generator (see XmlDocumentGenerator):
+    compiled fragments and Slots, with build/streaming/batch modes. FacturaE
+    puts the VAT breakdown and totals before the lines, so the head reads the
+    breakdown from the loaded lines or, in streaming mode, from the totals
+    stored at save time (vat_breakdown()) instead of holding the lines.
+    """
+
+    # ---------- Helpers ----------
+
+    @staticmethod
+    def _party(party, name, role):
+        # FacturaE 3.2.2 requires a tax ID and an address for both parties
+        address = _main_address(party)
+        country = _country(party, address)
+        residence = 'R' if country == 'ES' else ('U' if country in EU_COUNTRIES else 'E')
+        tax_id = (getattr(party, 'vat_number', None) or '').replace(' ', '')
+        if residence == 'R' and tax_id.upper().startswith('ES'):
+            tax_id = tax_id[2:]  # Spanish NIF without the country prefix
+        who = f"{role} {name}".strip()
+        if not tax_id:
+            raise InvoiceDataError(f"{who}: a VAT number is required for FacturaE")
+        if address is None:
+            raise InvoiceDataError(f"{who}: an address is required for FacturaE")
+
+        parts = ['<TaxIdentification>', _PERSON_LEGAL, _RESIDENCE(residence), _TAX_ID_NUMBER(tax_id),
+                 '</TaxIdentification><LegalEntity>', _CORPORATE_NAME(name)]
+        street = ', '.join(p for p in (address.address_line1, address.address_line2) if p)
+        if residence == 'R':
+            parts += ['<AddressInSpain>', _ADDRESS(street), _POST_CODE(address.zip_code), _TOWN(address.city),
+                      _PROVINCE(_spanish_province(who, address.zip_code)), _COUNTRY_CODE('ESP'),
+                      '</AddressInSpain>']
+        else:
+            # Foreign addresses store no region; the schema requires a Province,
+            # the town is the closest administrative unit we have
+            post_code_town = ' '.join(p for p in (address.zip_code, address.city) if p)
+            parts += ['<OverseasAddress>', _ADDRESS(street), _POST_CODE_AND_TOWN(post_code_town),
+                      _PROVINCE(address.city), _COUNTRY_CODE(COUNTRY_ALPHA3.get(country, country)),
+                      '</OverseasAddress>']
+        parts.append('</LegalEntity>')
+        return ''.join(parts)
+
+    @staticmethod
+    def _tax(rate, base, amount):
+        return ''.join((_TAX_OPEN, _TAX_RATE(_amount(rate)), _TAXABLE_BASE_OPEN, _TOTAL_AMOUNT(_amount(base)),
+                        _TAX_AMOUNT_OPEN, _TOTAL_AMOUNT(_amount(amount)), _TAX_CLOSE))
+
+    # ---------- Document ----------
 
     @staticmethod
-    def build_invoice_xml(invoice: Invoice) -> str:
-        root = Element('fe:Facturae', {'xmlns:fe': 'http://www.facturae.gob.es/formato/Versiones/Facturae/3_2_1.xml'})
+    def _head(invoice):
+        sign = _sign(invoice)
+        company, customer = invoice.company, invoice.customer
+        currency = (getattr(company, 'currency', None) or 'EUR') if company else 'EUR'
+        net, tax, gross = (sign * to_decimal(v) for v in (invoice.total_net, invoice.total_tax, invoice.total_gross))
+        total = _TOTAL_AMOUNT(_amount(gross))
+        seller_id = (getattr(company, 'vat_number', None) or '') if company else ''
 
-        header = SubElement(root, 'FileHeader')
-        SubElement(header, 'SchemaVersion').text = "3.2.1"
-        SubElement(header, 'Modality').text = "I" # Individual
-        SubElement(header, 'InvoiceIssuerType').text = "EM"
+        parts = [
+            _ROOT_OPEN,
+            '<FileHeader>', _SCHEMA_VERSION, _MODALITY_INDIVIDUAL, _ISSUER_SELLER,
+            '<Batch>', _BATCH_ID(f"{seller_id}{invoice.invoice_number}"), _INVOICES_COUNT_1,
+            '<TotalInvoicesAmount>', total, '</TotalInvoicesAmount>',
+            '<TotalOutstandingAmount>', total, '</TotalOutstandingAmount>',
+            '<TotalExecutableAmount>', total, '</TotalExecutableAmount>',
+            _CURRENCY(currency), '</Batch></FileHeader>',
+            '<Parties><SellerParty>',
+            SpainXMLGenerator._party(company, company.name if company else '', 'Seller'),
+            '</SellerParty><BuyerParty>',
+            SpainXMLGenerator._party(customer, customer.name if customer else '', 'Buyer'),
+            '</BuyerParty></Parties>',
+            '<Invoices><Invoice><InvoiceHeader>', _INVOICE_NUMBER(invoice.invoice_number), _DOCUMENT_TYPE_COMPLETE,
+        ]
+
+        if sign < 0:
+            original = getattr(invoice, 'original_invoice', None)
+            if original is None:
+                raise InvoiceDataError(f"Credit note {invoice.invoice_number}: FacturaE needs the invoice it corrects")
+            period_date = original.invoice_date or invoice.invoice_date
+            parts += [
+                _CLASS_CORRECTIVE, '<Corrective>',
+                _INVOICE_NUMBER(original.invoice_number),
+                _REASON_CODE_BASE, _REASON_DESCRIPTION_BASE,
+                '<TaxPeriod>', _START_DATE(period_date.isoformat()), _END_DATE(period_date.isoformat()), '</TaxPeriod>',
+                _CORRECTION_DIFFERENCES, _CORRECTION_DIFFERENCES_DESCRIPTION, '</Corrective>'
+            ]
+        else:
+            parts.append(_CLASS_ORIGINAL)
+        parts.append('</InvoiceHeader>')
+
+        parts += ['<InvoiceIssueData>', _ISSUE_DATE(invoice.invoice_date.isoformat())]
+        if invoice.tax_point_date:
+            parts.append(_OPERATION_DATE(invoice.tax_point_date.isoformat()))
+        parts += [_INVOICE_CURRENCY(currency), _TAX_CURRENCY(currency), _LANGUAGE_ES, '</InvoiceIssueData>']
+
+        parts.append('<TaxesOutputs>')
+        for bucket in SpainXMLGenerator.vat_breakdown(invoice):
+            parts.append(SpainXMLGenerator._tax(bucket['vat_rate'], sign * bucket['taxable_amount'],
+                                                sign * bucket['tax_amount']))
+        parts.append('</TaxesOutputs>')
+
+        parts += [
+            '<InvoiceTotals>',
+            _TOTAL_GROSS(_amount(net)), _TOTAL_BEFORE_TAXES(_amount(net)), _TOTAL_TAX_OUTPUTS(_amount(tax)),
+            _TOTAL_WITHHELD_ZERO, _INVOICE_TOTAL(_amount(gross)), _TOTAL_OUTSTANDING(_amount(gross)),
+            _TOTAL_EXECUTABLE(_amount(gross)), '</InvoiceTotals>',
+            '<Items>'
+        ]
+        return ''.join(parts)
+
+    @staticmethod
+    def _fill_line(invoice, line):
+        sign = _sign(invoice)
+        net = sign * _line_net(line)
+        return ''.join((
+            '<InvoiceLine>', _ITEM_DESCRIPTION(line.description),
+            _QUANTITY(str(sign * to_decimal(line.quantity))), _UNIT_OF_MEASURE_UNITS,
+            _UNIT_PRICE(str(line.unit_price)), _TOTAL_COST(_amount(net)), _GROSS_AMOUNT(_amount(net)),
+            '<TaxesOutputs>', SpainXMLGenerator._tax(line.vat_rate, net, sign * to_decimal(line.vat_amount)),
+            '</TaxesOutputs>', _ARTICLE_CODE(line.hsn_sac_code) if line.hsn_sac_code else '',
+            '</InvoiceLine>'
+        ))
+
+    @staticmethod
+    def _tail(invoice):
+        parts = ['</Items>']
+        if invoice.due_date:
+            gross = _sign(invoice) * to_decimal(invoice.total_gross)
+            parts += [
+                '<PaymentDetails><Installment>', _DUE_DATE(invoice.due_date.isoformat()),
+                _INSTALLMENT_AMOUNT(_amount(gross)),
+                _PAYMENT_MEANS(PAYMENT_MEANS_CODES.get(invoice.fr_payment_means, '04')),
+                '</Installment></PaymentDetails>'
+            ]
+        parts.append('</Invoice></Invoices></fe:Facturae>')
+        return ''.join(parts)
 
-        parties = SubElement(root, 'Parties')
-        # ... Mapping Seller/Buyer would go here ...
 
-        invoices_node = SubElement(root, 'Invoices')
-        inv = SubElement(invoices_node, 'Invoice')
+# ---------- Compiled once at import ----------
 
-        inv_header = SubElement(inv, 'InvoiceHeader')
-        SubElement(inv_header, 'InvoiceNumber').text = invoice.invoice_number
-        SubElement(inv_header, 'InvoiceDate').text = str(invoice.invoice_date)
+_ROOT_OPEN = start_tag('fe:Facturae', NAMESPACES)
 
-        inv_totals = SubElement(inv, 'InvoiceTotals')
-        SubElement(inv_totals, 'TotalGrossAmount').text = str(invoice.total_gross)
+_BATCH_ID = Slot('BatchIdentifier')
+_CURRENCY = Slot('InvoiceCurrencyCode')
+_TOTAL_AMOUNT = Slot('TotalAmount')
+_RESIDENCE = Slot('ResidenceTypeCode')
+_TAX_ID_NUMBER = Slot('TaxIdentificationNumber')
+_CORPORATE_NAME = Slot('CorporateName')
+_ADDRESS = Slot('Address')
+_POST_CODE = Slot('PostCode')
+_POST_CODE_AND_TOWN = Slot('PostCodeAndTown')
+_TOWN = Slot('Town')
+_PROVINCE = Slot('Province')
+_COUNTRY_CODE = Slot('CountryCode')
+_INVOICE_NUMBER = Slot('InvoiceNumber')
+_START_DATE = Slot('StartDate')
+_END_DATE = Slot('EndDate')
+_ISSUE_DATE = Slot('IssueDate')
+_OPERATION_DATE = Slot('OperationDate')
+_INVOICE_CURRENCY = Slot('InvoiceCurrencyCode')
+_TAX_CURRENCY = Slot('TaxCurrencyCode')
+_TAX_RATE = Slot('TaxRate')
+_TOTAL_GROSS = Slot('TotalGrossAmount')
+_TOTAL_BEFORE_TAXES = Slot('TotalGrossAmountBeforeTaxes')
+_TOTAL_TAX_OUTPUTS = Slot('TotalTaxOutputs')
+_INVOICE_TOTAL = Slot('InvoiceTotal')
+_TOTAL_OUTSTANDING = Slot('TotalOutstandingAmount')
+_TOTAL_EXECUTABLE = Slot('TotalExecutableAmount')
+_ITEM_DESCRIPTION = Slot('ItemDescription')
+_QUANTITY = Slot('Quantity')
+_UNIT_PRICE = Slot('UnitPriceWithoutTax')
+_TOTAL_COST = Slot('TotalCost')
+_GROSS_AMOUNT = Slot('GrossAmount')
+_ARTICLE_CODE = Slot('ArticleCode')
+_DUE_DATE = Slot('InstallmentDueDate')
+_INSTALLMENT_AMOUNT = Slot('InstallmentAmount')
+_PAYMENT_MEANS = Slot('PaymentMeans')
 
-        items = SubElement(inv, 'Items')
-        for line in invoice.lines:
-            item = SubElement(items, 'InvoiceLine')
-            SubElement(item, 'ItemDescription').text = line.description
-            SubElement(item, 'TotalCost').text = str(line.line_gross)
+_SCHEMA_VERSION = Slot('SchemaVersion')(SCHEMA_VERSION)
+_MODALITY_INDIVIDUAL = Slot('Modality')("I")
+_ISSUER_SELLER = Slot('InvoiceIssuerType')("EM")
+_INVOICES_COUNT_1 = Slot('InvoicesCount')("1")
+_PERSON_LEGAL = Slot('PersonTypeCode')("J")
+_DOCUMENT_TYPE_COMPLETE = Slot('InvoiceDocumentType')("FC")
+_CLASS_ORIGINAL = Slot('InvoiceClass')("OO")
+_CLASS_CORRECTIVE = Slot('InvoiceClass')("OR")
+_REASON_CODE_BASE = Slot('ReasonCode')("16")
+_REASON_DESCRIPTION_BASE = Slot('ReasonDescription')("Base imponible")
+_CORRECTION_DIFFERENCES = Slot('CorrectionMethod')("02")
+_CORRECTION_DIFFERENCES_DESCRIPTION = Slot('CorrectionMethodDescription')("Rectificación por diferencias")
+_LANGUAGE_ES = Slot('LanguageName')("es")
+_TOTAL_WITHHELD_ZERO = Slot('TotalTaxesWithheld')("0.00")
+_UNIT_OF_MEASURE_UNITS = Slot('UnitOfMeasure')("01")
 
-        return tostring(root, encoding='unicode')
+_TAX_OPEN = '<Tax>' + Slot('TaxTypeCode')(TAX_TYPE_IVA)
+_TAXABLE_BASE_OPEN = '<TaxableBase>'
+_TAX_AMOUNT_OPEN = '</TaxableBase><TaxAmount>'
+_TAX_CLOSE = '</TaxAmount></Tax>'
@@ -0,0 +1,112 @@
+import hashlib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.submission_ledger import SubmissionLedgerEntry
+
+# claim() decisions
+SEND = 'SEND'       # this worker owns the transmission
+DONE = 'DONE'       # already accepted or rejected: nothing to send
+BUSY = 'BUSY'       # another worker is sending it right now
+
+FINAL_STATUSES = ('ACCEPTED', 'REJECTED')
+
+
+class SubmissionLedgerService:
+    """
+    Idempotency ledger of platform transmissions.
+
+    Each (invoice, document hash, channel) has one row, found through its
+    unique idempotency key in a single indexed lookup before every send:
+      - ACCEPTED / REJECTED: the outcome is known, the send is skipped;
+      - PENDING and claimed less than SUBMISSION_JOB_TIMEOUT ago: another
+        worker is on it;
+      - otherwise the caller claims it (one conditional UPDATE) and sends.
+    A send whose outcome is unknown (timeout, crash) leaves the row PENDING;
+    the retry sends again with the same Idempotency-Key header so the
+    platform can recognise the duplicate. A changed document hashes to a
+    new key and is transmitted as a new version.
+    """
+
+    @staticmethod
+    def document_hash(payload):
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def key(invoice_id, document_hash, channel):
+        return hashlib.sha256(f"{invoice_id}:{document_hash}:{channel}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _take_over(entry_id, now):
+        lease_start = now - timedelta(seconds=current_app.config.get('SUBMISSION_JOB_TIMEOUT', 120))
+        stmt = (
+            update(SubmissionLedgerEntry)
+            .where(
+                SubmissionLedgerEntry.id == entry_id,
+                SubmissionLedgerEntry.status == 'PENDING',
+                or_(SubmissionLedgerEntry.claimed_at.is_(None), SubmissionLedgerEntry.claimed_at < lease_start)
+            )
+            .values(claimed_at=now, attempts=SubmissionLedgerEntry.attempts + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        return db.session.execute(stmt).rowcount == 1
+
+    @staticmethod
+    def claim(invoice_id, payload, channel):
+        """Returns (entry, SEND | DONE | BUSY). Commits the claim."""
+        document_hash = SubmissionLedgerService.document_hash(payload)
+        key = SubmissionLedgerService.key(invoice_id, document_hash, channel)
+        now = datetime.utcnow()
+
+        entry = SubmissionLedgerEntry.query.filter_by(idempotency_key=key).first()
+        if entry is None:
+            try:
+                with db.session.begin_nested():
+                    entry = SubmissionLedgerEntry(
+                        idempotency_key=key,
+                        invoice_id=invoice_id,
+                        document_hash=document_hash,
+                        channel=channel,
+                        status='PENDING',
+                        attempts=1,
+                        claimed_at=now
+                    )
+                    db.session.add(entry)
+                db.session.commit()
+                return entry, SEND
+            except IntegrityError:
+                # A concurrent worker inserted the same key first
+                entry = SubmissionLedgerEntry.query.filter_by(idempotency_key=key).one()
+
+        if entry.status in FINAL_STATUSES:
+            return entry, DONE
+        claimed = SubmissionLedgerService._take_over(entry.id, now)
+        db.session.commit()
+        if not claimed:
+            return entry, BUSY
+        db.session.refresh(entry)
+        return entry, SEND
+
+    # record() and release() are committed with the caller's IntegrationLog row
+
+    @staticmethod
+    def record(entry, result):
+        """Final outcome of a send."""
+        entry.status = 'ACCEPTED' if result.get('success') else 'REJECTED'
+        entry.external_id = result.get('external_id')
+        entry.claimed_at = None
+
+    @staticmethod
+    def release(entry):
+        """Outcome unknown: keep PENDING but let the next retry claim it at once."""
+        entry.claimed_at = None
+
+    @staticmethod
+    def result(entry):
+        """The recorded outcome, in the clients' result format."""
+        if entry.status == 'ACCEPTED':
+            return {'success': True, 'external_id': entry.external_id, 'message': 'Already deposited', 'replayed': True}
+        return {'success': False, 'message': 'Already rejected', 'replayed': True}
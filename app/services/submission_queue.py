@@ -0,0 +1,416 @@
+import itertools
+import traceback
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy.orm import joinedload
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.services.integration_log_service import IntegrationLogService
+from app.services.submission_ledger import SubmissionLedgerService, SEND, DONE, BUSY
+from app.services.integration_clients import FrancePDPClient, SpainFaceB2BClient
+from app.services.spain_xml_generator import SpainXMLGenerator
+from app.services.xml_batch_service import XmlBatchService, generator_for
+from app.services.xml_core import InvoiceDataError
+
+QUEUE_NAME = 'submissions'
+PENDING_KEY = 'submissions:pending'
+
+
+class SubmissionRejected(Exception):
+    """The platform answered and refused the invoice: retrying won't help."""
+
+
+class SubmissionInProgress(Exception):
+    """Another worker is transmitting the same document: retry later."""
+
+
+class SubmissionUnavailable(Exception):
+    """The platform could not take the invoice now (5xx, 429, timeout): retry later."""
+
+
+def backoff_intervals(max_attempts, base_delay, max_delay):
+    """Delays (seconds) before each retry: base, 2*base, 4*base... capped at max_delay."""
+    return [min(base_delay * 2 ** n, max_delay) for n in range(max(0, max_attempts - 1))]
+
+
+def configured_backoff(config):
+    """backoff_intervals() from the SUBMISSION_* settings."""
+    return backoff_intervals(
+        config.get('SUBMISSION_MAX_ATTEMPTS', 5),
+        config.get('SUBMISSION_BACKOFF_BASE', 10),
+        config.get('SUBMISSION_BACKOFF_MAX', 600)
+    )
+
+
+# ---------- In-process queue (tests / local development) ----------
+
+class InProcessJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, func, args, kwargs, retry_intervals):
+        self.id = f"inprocess-{next(self._ids)}"
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.retry_intervals = list(retry_intervals or [])
+        self.status = 'queued'
+        self.attempts = 0
+        self.retry_delays = []   # backoff that rq would have waited before each retry
+        self.delay = None        # enqueue_in() delay
+        self.result = None
+        self.exc_info = None
+
+
+class InProcessQueue:
+    """
+    Stand-in for an rq Queue: same enqueue() call, jobs run in this process.
+    With is_async=False (the default) a job runs as soon as it is enqueued;
+    otherwise it waits for run_pending(). Retries run back to back and the
+    backoff delays are only recorded on the job. Delayed jobs (enqueue_in)
+    always wait for run_pending().
+    """
+
+    def __init__(self, name=QUEUE_NAME, is_async=False):
+        self.name = name
+        self.is_async = is_async
+        self.pending = deque()
+        self.jobs = []
+        self.buffer = deque()
+
+    def enqueue(self, func, *args, retry_intervals=None, **kwargs):
+        job = InProcessJob(func, args, kwargs, retry_intervals)
+        self.jobs.append(job)
+        if self.is_async:
+            self.pending.append(job)
+        else:
+            self._perform(job)
+        return job
+
+    def enqueue_in(self, delay, func, *args, **kwargs):
+        job = InProcessJob(func, args, kwargs, None)
+        job.delay = delay
+        self.jobs.append(job)
+        self.pending.append(job)
+        return job
+
+    def push_pending(self, invoice_id):
+        self.buffer.append(invoice_id)
+        return len(self.buffer)
+
+    def pop_pending(self, count):
+        return [self.buffer.popleft() for _ in range(min(count, len(self.buffer)))]
+
+    def run_pending(self):
+        while self.pending:
+            self._perform(self.pending.popleft())
+
+    def _perform(self, job):
+        while True:
+            job.attempts += 1
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+                job.status = 'finished'
+                return
+            except Exception:
+                job.exc_info = traceback.format_exc()
+                retries_done = job.attempts - 1
+                if retries_done >= len(job.retry_intervals):
+                    job.status = 'failed'
+                    return
+                job.retry_delays.append(job.retry_intervals[retries_done])
+
+    @property
+    def failed(self):
+        return [job for job in self.jobs if job.status == 'failed']
+
+
+# ---------- rq queue ----------
+
+class RQSubmissionQueue:
+    """Thin adapter so both backends share one enqueue() signature."""
+
+    def __init__(self, redis_url, name=QUEUE_NAME, job_timeout=120):
+        from redis import Redis
+        from rq import Queue
+        self.connection = Redis.from_url(redis_url)
+        self.queue = Queue(name, connection=self.connection)
+        self.job_timeout = job_timeout
+
+    def enqueue(self, func, *args, retry_intervals=None, **kwargs):
+        from rq import Retry
+        retry = Retry(max=len(retry_intervals), interval=retry_intervals) if retry_intervals else None
+        return self.queue.enqueue(func, *args, retry=retry, job_timeout=self.job_timeout, **kwargs)
+
+    def enqueue_in(self, delay, func, *args, **kwargs):
+        # Needs a worker started with the scheduler (worker.py does)
+        from datetime import timedelta
+        return self.queue.enqueue_in(timedelta(seconds=delay), func, *args, job_timeout=self.job_timeout, **kwargs)
+
+    # Invoices waiting to be grouped into a batch deposit
+
+    def push_pending(self, invoice_id):
+        return self.connection.rpush(PENDING_KEY, invoice_id)
+
+    def pop_pending(self, count):
+        return [int(i) for i in self.connection.lpop(PENDING_KEY, count) or []]
+
+
+def get_submission_queue(app):
+    """One queue object per app, chosen by SUBMISSION_QUEUE ('rq' or 'inprocess')."""
+    queue = app.extensions.get('submission_queue')
+    if queue is None:
+        if app.config.get('SUBMISSION_QUEUE') == 'inprocess':
+            queue = InProcessQueue()
+        else:
+            queue = RQSubmissionQueue(app.config['REDIS_URL'], job_timeout=app.config.get('SUBMISSION_JOB_TIMEOUT', 120))
+        app.extensions['submission_queue'] = queue
+    return queue
+
+
+# ---------- Job ----------
+
+_worker_app = None
+
+
+def _in_worker_app(func, *args):
+    """rq entry points run here. Worker processes have no app yet: build one on first job."""
+    global _worker_app
+    if has_app_context():
+        return func(*args)
+    if _worker_app is None:
+        from app import create_app
+        _worker_app = create_app()
+    with _worker_app.app_context():
+        try:
+            return func(*args)
+        finally:
+            db.session.remove()
+
+
+def submit_invoice_job(invoice_id):
+    return _in_worker_app(_submit_once, invoice_id)
+
+
+def flush_submissions_job():
+    return _in_worker_app(SubmissionService.flush)
+
+
+def submit_batch_job(invoice_ids, attempt=1):
+    return _in_worker_app(_submit_batch_once, invoice_ids, attempt)
+
+
+def _submit_once(invoice_id):
+    try:
+        return SubmissionService.submit(invoice_id)
+    except (SubmissionRejected, InvoiceDataError) as e:
+        # Final: end the job normally so the queue does not retry it
+        return {'success': False, 'message': str(e)}
+
+
+def _submit_batch_once(invoice_ids, attempt):
+    """Deposits a batch, then re-queues only the invoices that can be retried."""
+    app = current_app._get_current_object()
+    retry_ids = SubmissionService.submit_batch(invoice_ids)
+    intervals = configured_backoff(app.config)
+    if retry_ids and attempt <= len(intervals):
+        get_submission_queue(app).enqueue_in(intervals[attempt - 1], submit_batch_job, retry_ids, attempt + 1)
+    return {'submitted': len(invoice_ids), 'retry': retry_ids, 'attempt': attempt}
+
+
+class SubmissionService:
+    """
+    Delivery of finalised invoices to the e-invoicing platform (PDP / FACeB2B).
+
+    Saving an invoice only enqueues a job; workers (see worker.py) build the
+    XML, call the platform client and record every attempt in IntegrationLog.
+    Transport errors are retried with exponential backoff; a rejection is
+    final. Every send first goes through the idempotency ledger
+    (SubmissionLedgerService), so a retry or replay never deposits a
+    document twice.
+
+    With a platform URL configured (PDP_BASE_URL / FACEB2B_BASE_URL) the
+    clients talk to it through the asyncio clients in integration_clients;
+    otherwise they simulate it.
+
+    With SUBMISSION_MODE='batch', saved invoices are buffered instead and sent
+    together: a batch job is queued once SUBMISSION_BATCH_SIZE invoices are
+    waiting, or SUBMISSION_BATCH_WINDOW seconds after the first one.
+    Factur-X invoices go as multi-invoice PDP deposits; FacturaE invoices,
+    which FACeB2B takes one at a time, are sent PLATFORM_CONCURRENCY at a
+    time on one connection pool (AsyncPlatformClient.send_many). This is the
+    mode for bulk volumes. Each invoice still gets its own log row, and
+    only the retryable failures of a batch are queued again.
+    """
+
+    @staticmethod
+    def client_for(generator):
+        if generator is SpainXMLGenerator:
+            return SpainFaceB2BClient.from_config(current_app.config)
+        return FrancePDPClient.from_config(current_app.config)
+
+    @staticmethod
+    def payload_type(generator):
+        return 'FACTURAE' if generator is SpainXMLGenerator else 'FACTURX'
+
+    @staticmethod
+    def enqueue(invoice_id):
+        """Queue an invoice for submission. Never fails the caller's request."""
+        app = current_app._get_current_object()
+        config = app.config
+        try:
+            if config.get('SUBMISSION_MODE') == 'batch':
+                return SubmissionService._buffer(get_submission_queue(app), invoice_id)
+            return get_submission_queue(app).enqueue(submit_invoice_job, invoice_id,
+                                                     retry_intervals=configured_backoff(config))
+        except Exception:
+            app.logger.exception("Could not queue invoice %s for submission", invoice_id)
+            return None
+
+    @staticmethod
+    def _buffer(queue, invoice_id):
+        config = current_app.config
+        waiting = queue.push_pending(invoice_id)
+        if waiting >= config.get('SUBMISSION_BATCH_SIZE', 500):
+            return queue.enqueue(flush_submissions_job)
+        if waiting == 1:
+            return queue.enqueue_in(config.get('SUBMISSION_BATCH_WINDOW', 30), flush_submissions_job)
+        return None
+
+    @staticmethod
+    def flush():
+        """Turns the buffered invoices into batch jobs. Returns the number of jobs."""
+        queue = get_submission_queue(current_app._get_current_object())
+        batch_size = current_app.config.get('SUBMISSION_BATCH_SIZE', 500)
+        intervals = configured_backoff(current_app.config)
+        jobs = 0
+        while True:
+            invoice_ids = queue.pop_pending(batch_size)
+            if not invoice_ids:
+                return jobs
+            # Same backoff as single jobs if the whole batch job fails
+            queue.enqueue(submit_batch_job, invoice_ids, retry_intervals=intervals)
+            jobs += 1
+
+    @staticmethod
+    def _log(invoice_id, payload_type, xml, status_code, error_code=None, external_id=None):
+        db.session.add(IntegrationLogService.entry(
+            invoice_id, payload_type, xml, status_code, error_code=error_code, external_id=external_id
+        ))
+        db.session.commit()
+
+    @staticmethod
+    def submit(invoice_id):
+        """One delivery attempt. Raises on failure so the queue can retry."""
+        invoice = db.session.get(Invoice, invoice_id)
+        if invoice is None:
+            return None
+
+        generator = generator_for(invoice)
+        payload_type = SubmissionService.payload_type(generator)
+        client = SubmissionService.client_for(generator)
+        xml = entry = None
+        try:
+            xml = generator.build_invoice_xml(invoice)
+            entry, decision = SubmissionLedgerService.claim(invoice_id, xml, client.channel)
+            if decision == DONE:
+                return SubmissionLedgerService.result(entry)
+            if decision == BUSY:
+                raise SubmissionInProgress(f"Invoice {invoice_id} is being sent by another worker")
+            result = client.send_invoice(xml, idempotency_key=entry.idempotency_key)
+        except SubmissionInProgress:
+            raise
+        except Exception as e:
+            db.session.rollback()
+            if entry is not None:
+                SubmissionLedgerService.release(entry)
+            SubmissionService._log(invoice_id, payload_type, xml, 'ERROR', error_code=type(e).__name__[:50])
+            raise
+
+        error_code = str(result.get('error_code') or result.get('message') or '')[:50]
+        if not result.get('success') and result.get('retryable'):
+            SubmissionLedgerService.release(entry)
+            SubmissionService._log(invoice_id, payload_type, xml, 'ERROR', error_code=error_code)
+            raise SubmissionUnavailable(result.get('message'))
+
+        SubmissionLedgerService.record(entry, result)
+        if not result.get('success'):
+            SubmissionService._log(invoice_id, payload_type, xml, 'REJECTED', error_code=error_code)
+            raise SubmissionRejected(result.get('message'))
+
+        SubmissionService._log(invoice_id, payload_type, xml, 'ACCEPTED', external_id=result.get('external_id'))
+        return result
+
+    @staticmethod
+    def submit_batch(invoice_ids):
+        """
+        One batch attempt: Factur-X invoices go out as PDP deposits, FacturaE
+        ones concurrently (SpainFaceB2BClient.send_batch). Returns the ids
+        worth retrying.
+        """
+        invoices = (
+            Invoice.query.options(joinedload(Invoice.company))
+            .filter(Invoice.id.in_(invoice_ids)).all()
+        )
+        groups = {}
+        for invoice in invoices:
+            groups.setdefault(generator_for(invoice), []).append(invoice.id)
+        retry_ids = []
+        for generator, ids in groups.items():
+            retry_ids += SubmissionService._submit_group(generator, ids)
+        return retry_ids
+
+    @staticmethod
+    def _submit_group(generator, invoice_ids):
+        client = SubmissionService.client_for(generator)
+        payload_type = SubmissionService.payload_type(generator)
+        documents, entries, retry_ids = [], {}, []
+        # At most SUBMISSION_BATCH_SIZE invoices: loaded in one go
+        for snapshot in XmlBatchService.load_snapshots(invoice_ids):
+            # One invoice that fails to render or claim must not sink the batch
+            xml = None
+            try:
+                xml = generator.build_invoice_xml(snapshot).encode('utf-8')
+                entry, decision = SubmissionLedgerService.claim(snapshot.id, xml, client.channel)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.exception("Could not prepare invoice %s for its batch", snapshot.id)
+                SubmissionService._log(snapshot.id, payload_type, xml, 'ERROR', error_code=type(e).__name__[:50])
+                if not isinstance(e, InvoiceDataError):
+                    retry_ids.append(snapshot.id)
+                continue
+            if decision == SEND:
+                documents.append((snapshot.id, xml))
+                entries[snapshot.id] = entry
+            elif decision == BUSY:
+                retry_ids.append(snapshot.id)
+        if not documents:
+            return retry_ids
+
+        try:
+            results = client.send_batch(documents, idempotency_keys={
+                invoice_id: entry.idempotency_key for invoice_id, entry in entries.items()
+            })
+        except Exception as e:
+            db.session.rollback()
+            results = {invoice_id: {'success': False, 'retryable': True, 'error_code': type(e).__name__}
+                       for invoice_id, _ in documents}
+
+        for invoice_id, xml in documents:
+            result = results[invoice_id]
+            if result.get('success'):
+                status_code = 'ACCEPTED'
+                SubmissionLedgerService.record(entries[invoice_id], result)
+            elif result.get('retryable'):
+                status_code = 'ERROR'
+                SubmissionLedgerService.release(entries[invoice_id])
+                retry_ids.append(invoice_id)
+            else:
+                status_code = 'REJECTED'
+                SubmissionLedgerService.record(entries[invoice_id], result)
+            db.session.add(IntegrationLogService.entry(
+                invoice_id, payload_type, xml, status_code,
+                error_code=None if result.get('success') else str(result.get('error_code') or result.get('message') or '')[:50],
+                external_id=result.get('external_id')
+            ))
+        db.session.commit()
+        return retry_ids
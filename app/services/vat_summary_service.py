@@ -0,0 +1,262 @@
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import update, delete, insert, select, func, case
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.invoice import Invoice, InvoiceLine, InvoiceStatus
+from app.models.vat_summary import InvoiceVatTotal, VatPeriodSummary
+from app.services.totals_engine import TotalsEngine
+
+REBUILD_BATCH = 1000    # invoices per rebuild query
+
+
+def period_of(invoice):
+    """VAT period (YYYY-MM) of an invoice: month of the tax point, else of the invoice date."""
+    return (invoice.tax_point_date or invoice.invoice_date).strftime('%Y-%m')
+
+
+def _line_net_sum():
+    return func.sum(func.coalesce(InvoiceLine.line_total, 0) - func.coalesce(InvoiceLine.vat_amount, 0))
+
+
+class VatSummaryService:
+    """
+    Precomputed VAT figures, at two levels:
+      - InvoiceVatTotal: the per-rate breakdown of each invoice, as computed
+        by TotalsEngine when its lines are saved; the XML generators read
+        it instead of grouping the lines;
+      - VatPeriodSummary: taxable base, VAT and invoice count per (company,
+        month, rate, document type) over finalised invoices, for VAT returns.
+
+    record() runs in the caller's transaction on every write of an invoice's
+    lines or status: it takes the invoice's previous breakdown out of the
+    summary rows it was added to, stores the new one and adds it back, with
+    UPDATE ... SET x = x + delta so concurrent writers never lose an update.
+    rebuild() recomputes both tables from the lines in bulk.
+    """
+
+    # ---------- Write path ----------
+
+    @staticmethod
+    def _add(company_id, period, vat_rate, document_type, taxable, tax, count):
+        scope = (
+            VatPeriodSummary.company_id == company_id,
+            VatPeriodSummary.period == period,
+            VatPeriodSummary.vat_rate == vat_rate,
+            VatPeriodSummary.document_type == document_type
+        )
+        stmt = (
+            update(VatPeriodSummary)
+            .where(*scope)
+            .values(
+                taxable_amount=VatPeriodSummary.taxable_amount + taxable,
+                tax_amount=VatPeriodSummary.tax_amount + tax,
+                invoice_count=VatPeriodSummary.invoice_count + count,
+                updated_at=datetime.utcnow()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if count < 0:
+            db.session.execute(stmt)
+            # A bucket no invoice contributes to any more goes, as rebuild() would leave it
+            db.session.execute(
+                delete(VatPeriodSummary)
+                .where(*scope, VatPeriodSummary.invoice_count <= 0)
+                .execution_options(synchronize_session=False)
+            )
+            return
+        if db.session.execute(stmt).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(VatPeriodSummary(
+                    company_id=company_id,
+                    period=period,
+                    vat_rate=vat_rate,
+                    document_type=document_type,
+                    taxable_amount=taxable,
+                    tax_amount=tax,
+                    invoice_count=count
+                ))
+        except IntegrityError:
+            # Another transaction created the row first
+            db.session.execute(stmt)
+
+    @staticmethod
+    def record(invoice, breakdown=None):
+        """
+        Stores `breakdown` (TotalsEngine's vat_breakdown) as the invoice's VAT
+        totals and updates the period summary. Without a breakdown the stored
+        one is kept and only re-filed (status, date or document type changed).
+        Does not commit.
+        """
+        previous = list(invoice.vat_totals)
+        for row in previous:
+            if row.period:
+                VatSummaryService._add(row.company_id, row.period, row.vat_rate, row.document_type,
+                                       -row.taxable_amount, -row.tax_amount, -1)
+        if breakdown is None:
+            breakdown = [{'vat_rate': row.vat_rate, 'taxable_amount': row.taxable_amount, 'tax_amount': row.tax_amount}
+                         for row in previous]
+
+        finalised = invoice.status not in (None, InvoiceStatus.DRAFT)
+        period = period_of(invoice) if finalised else None
+        document_type = invoice.fr_document_type or 'INVOICE'
+        invoice.vat_totals = [InvoiceVatTotal(
+            company_id=invoice.company_id,
+            period=period,
+            document_type=document_type,
+            vat_rate=bucket['vat_rate'],
+            taxable_amount=bucket['taxable_amount'],
+            tax_amount=bucket['tax_amount']
+        ) for bucket in breakdown]
+
+        if finalised:
+            for bucket in breakdown:
+                VatSummaryService._add(invoice.company_id, period, bucket['vat_rate'], document_type,
+                                       bucket['taxable_amount'], bucket['tax_amount'], 1)
+
+    # ---------- Readers ----------
+
+    @staticmethod
+    def invoice_breakdown(invoice_id):
+        """
+        Stored breakdown of a saved invoice (same shape as TotalsEngine's),
+        or, for invoices saved before these totals existed, one GROUP BY
+        over its lines.
+        """
+        rows = (
+            db.session.query(InvoiceVatTotal.vat_rate, InvoiceVatTotal.taxable_amount, InvoiceVatTotal.tax_amount)
+            .filter(InvoiceVatTotal.invoice_id == invoice_id)
+            .order_by(InvoiceVatTotal.vat_rate)
+            .all()
+        )
+        if rows:
+            return [{'vat_rate': rate, 'taxable_amount': taxable, 'tax_amount': tax} for rate, taxable, tax in rows]
+        return TotalsEngine.breakdown(
+            db.session.query(InvoiceLine.vat_rate, _line_net_sum())
+            .filter(InvoiceLine.invoice_id == invoice_id)
+            .group_by(InvoiceLine.vat_rate)
+            .all()
+        )
+
+    @staticmethod
+    def declaration(company_id, start_period=None, end_period=None):
+        """
+        Taxable base and VAT per (period, rate), credit notes deducted, for
+        periods 'YYYY-MM' in [start_period, end_period]. Reads only summary rows.
+        """
+        sign = case((VatPeriodSummary.document_type == 'CREDIT_NOTE', -1), else_=1)
+        query = db.session.query(
+            VatPeriodSummary.period,
+            VatPeriodSummary.vat_rate,
+            func.sum(sign * VatPeriodSummary.taxable_amount),
+            func.sum(sign * VatPeriodSummary.tax_amount),
+            func.sum(VatPeriodSummary.invoice_count)
+        ).filter(VatPeriodSummary.company_id == company_id)
+        if start_period:
+            query = query.filter(VatPeriodSummary.period >= start_period)
+        if end_period:
+            query = query.filter(VatPeriodSummary.period <= end_period)
+        rows = query.group_by(VatPeriodSummary.period, VatPeriodSummary.vat_rate) \
+            .order_by(VatPeriodSummary.period, VatPeriodSummary.vat_rate).all()
+        return [{
+            'period': period,
+            'vat_rate': rate,
+            'taxable_amount': taxable,
+            'tax_amount': tax,
+            'invoice_count': count,
+        } for period, rate, taxable, tax, count in rows]
+
+    # ---------- Bulk ----------
+
+    @staticmethod
+    def rebuild(company_id=None):
+        """
+        Recomputes every invoice's VAT totals from its lines (one GROUP BY per
+        REBUILD_BATCH invoices, bulk inserts), then the period summary with a
+        single INSERT ... SELECT. The deletes and the re-inserts are one
+        transaction: readers see the old figures until it commits, and a
+        failure leaves them in place. Returns the number of invoices.
+        """
+        try:
+            count = VatSummaryService._rebuild(company_id)
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def _rebuild(company_id):
+        totals_scope = select(Invoice.id)
+        if company_id:
+            totals_scope = totals_scope.where(Invoice.company_id == company_id)
+        db.session.execute(delete(InvoiceVatTotal).where(InvoiceVatTotal.invoice_id.in_(totals_scope)))
+        summary = delete(VatPeriodSummary)
+        if company_id:
+            summary = summary.where(VatPeriodSummary.company_id == company_id)
+        db.session.execute(summary)
+
+        count, last_id = 0, 0
+        while True:
+            invoices = db.session.query(
+                Invoice.id, Invoice.company_id, Invoice.status, Invoice.fr_document_type,
+                Invoice.invoice_date, Invoice.tax_point_date
+            ).filter(Invoice.id > last_id)
+            if company_id:
+                invoices = invoices.filter(Invoice.company_id == company_id)
+            invoices = invoices.order_by(Invoice.id).limit(REBUILD_BATCH).all()
+            if not invoices:
+                break
+            last_id = invoices[-1].id
+            count += len(invoices)
+
+            nets = {}
+            for invoice_id, rate, net in (
+                db.session.query(InvoiceLine.invoice_id, InvoiceLine.vat_rate, _line_net_sum())
+                .filter(InvoiceLine.invoice_id.in_([inv.id for inv in invoices]))
+                .group_by(InvoiceLine.invoice_id, InvoiceLine.vat_rate)
+            ):
+                nets.setdefault(invoice_id, []).append((rate, net))
+
+            rows = []
+            for inv in invoices:
+                finalised = inv.status not in (None, InvoiceStatus.DRAFT)
+                for bucket in TotalsEngine.breakdown(nets.get(inv.id, [])):
+                    rows.append({
+                        'invoice_id': inv.id,
+                        'company_id': inv.company_id,
+                        'period': period_of(inv) if finalised else None,
+                        'document_type': inv.fr_document_type or 'INVOICE',
+                        **bucket
+                    })
+            if rows:
+                db.session.execute(insert(InvoiceVatTotal), rows)
+
+        columns = (InvoiceVatTotal.company_id, InvoiceVatTotal.period, InvoiceVatTotal.vat_rate,
+                   InvoiceVatTotal.document_type)
+        grouped = select(
+            *columns,
+            func.sum(InvoiceVatTotal.taxable_amount),
+            func.sum(InvoiceVatTotal.tax_amount),
+            func.count(),
+            func.now()
+        ).where(InvoiceVatTotal.period.isnot(None))
+        if company_id:
+            grouped = grouped.where(InvoiceVatTotal.company_id == company_id)
+        db.session.execute(insert(VatPeriodSummary).from_select(
+            ['company_id', 'period', 'vat_rate', 'document_type', 'taxable_amount', 'tax_amount',
+             'invoice_count', 'updated_at'],
+            grouped.group_by(*columns)
+        ))
+        return count
+
+
+@click.command('rebuild-vat-summary')
+@click.option('--company', 'company_id', type=int, default=None, help='Only this company (default: all).')
+@with_appcontext
+def rebuild_vat_summary_command(company_id):
+    """Recompute per-invoice VAT totals and the VAT period summary from the invoice lines."""
+    click.echo(f"Rebuilt the VAT totals of {VatSummaryService.rebuild(company_id)} invoices.")
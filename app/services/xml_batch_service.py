@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from sqlalchemy.orm import selectinload, joinedload
+from app.models.invoice import Invoice
+from app.models.company import Company
+from app.models.customer import Customer
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.spain_xml_generator import SpainXMLGenerator
+
+LOAD_BATCH = 500      # invoices per set-based load
+TASK_SIZE = 50        # invoices per worker task
+
+# Company setting "E-invoice format" -> generator (anything else is Factur-X)
+GENERATORS = {'FACTURAE': SpainXMLGenerator}
+
+
+def generator_for_company(company):
+    return GENERATORS.get(company.einvoice_format if company else None, FranceXMLGenerator)
+
+
+def generator_for(invoice):
+    return generator_for_company(invoice.company)
+
+
+def _detach(obj):
+    """Plain, picklable copy of a row's column values."""
+    if obj is None:
+        return None
+    return SimpleNamespace(**{col.key: getattr(obj, col.key) for col in obj.__table__.columns})
+
+
+def _detach_party(obj):
+    snap = _detach(obj)
+    if snap is not None:
+        snap.addresses = [_detach(address) for address in obj.addresses]
+    return snap
+
+
+def _snapshot(invoice):
+    snap = _detach(invoice)
+    snap.company = _detach_party(invoice.company)
+    snap.customer = _detach_party(invoice.customer)
+    snap.original_invoice = _detach(invoice.original_invoice)
+    snap.lines = [_detach(line) for line in invoice.lines]
+    return snap
+
+
+def _render_task(snapshots, generator=None):
+    """Worker side: no database access, only the generators."""
+    return [(snap.id, (generator or generator_for(snap)).build_invoice_xml(snap).encode('utf-8'))
+            for snap in snapshots]
+
+
+class XmlBatchService:
+    """
+    E-invoice XML (Factur-X or FacturaE) for many invoices at once.
+
+    Invoices are loaded LOAD_BATCH at a time with their lines, company,
+    customer (and their addresses) in a handful of queries (one IN query per
+    relationship instead of lazy loads per invoice), copied into plain
+    picklable snapshots and rendered across a process pool. The output of
+    each invoice is the same as build_invoice_xml() on the ORM object.
+    """
+
+    @staticmethod
+    def load_snapshots(invoice_ids):
+        rows = Invoice.query.options(
+            selectinload(Invoice.lines),
+            joinedload(Invoice.company).selectinload(Company.addresses),
+            joinedload(Invoice.customer).selectinload(Customer.addresses),
+            selectinload(Invoice.original_invoice)
+        ).filter(Invoice.id.in_(invoice_ids)).all()
+        by_id = {inv.id: _snapshot(inv) for inv in rows}
+        # Keep the caller's order; unknown ids are skipped
+        return [by_id[i] for i in invoice_ids if i in by_id]
+
+    @staticmethod
+    def _chunks(items, size):
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    @staticmethod
+    def generate(invoice_ids, workers=None, generator=None):
+        """
+        Yields (invoice_id, xml bytes) in the order of `invoice_ids`.
+        generator=None picks each invoice's format from its company settings.
+        workers=None uses one process per CPU; workers<=1 renders in this process.
+        """
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1:
+            for ids in XmlBatchService._chunks(invoice_ids, LOAD_BATCH):
+                yield from _render_task(XmlBatchService.load_snapshots(ids), generator)
+            return
+
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        pending = deque()
+        try:
+            for ids in XmlBatchService._chunks(invoice_ids, LOAD_BATCH):
+                snapshots = XmlBatchService.load_snapshots(ids)
+                for task in XmlBatchService._chunks(snapshots, TASK_SIZE):
+                    pending.append(executor.submit(_render_task, task, generator))
+                # Load the next batch while workers render, but don't run ahead unboundedly
+                while len(pending) > workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
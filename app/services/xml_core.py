@@ -0,0 +1,130 @@
+from xml.etree.ElementTree import Element, tostring
+from app.extensions import db
+from app.models.invoice import InvoiceLine
+from app.services.totals_engine import TotalsEngine, to_decimal
+from app.services.vat_summary_service import VatSummaryService
+
+# Lines fetched per round trip in streaming mode
+STREAM_BATCH = 500
+
+
+def escape_text(text):
+    # Same character data escaping as ElementTree
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+class InvoiceDataError(ValueError):
+    """The invoice lacks data its e-invoice format requires: fix the data, do not retry."""
+
+
+class Slot:
+    """
+    A leaf element compiled once: its open/close/empty forms are taken from
+    ElementTree itself, so filling it yields exactly what tostring() would.
+    """
+    __slots__ = ('open', 'close', 'empty')
+
+    def __init__(self, tag, **attrs):
+        element = Element(tag, attrs)
+        self.empty = tostring(element, encoding='unicode')
+        element.text = '\x00'
+        self.open, self.close = tostring(element, encoding='unicode').split('\x00')
+
+    def __call__(self, text):
+        return self.open + escape_text(text) + self.close if text else self.empty
+
+
+def start_tag(tag, attrs=None):
+    """Serialised start tag of an element (e.g. a root with its namespaces)."""
+    element = Element(tag, attrs or {})
+    element.text = '\x00'
+    return tostring(element, encoding='unicode').split('\x00')[0]
+
+
+class XmlDocumentGenerator:
+    """
+    Shared serialisation pipeline of the e-invoice generators.
+
+    A document is a head, one fragment per invoice line and a tail, each built
+    by joining precompiled fragments and filled Slots. Subclasses implement
+    _head(), _fill_line() and _tail(); this class turns them into:
+      - build_invoice_xml(): the whole document as a str
+      - iter_invoice_xml(): the same document as UTF-8 chunks, one per line
+        item, reading lines in batches so memory stays flat
+      - write_invoice_xml(): the streaming mode into a binary file object
+    Options (such as a profile) are passed through to the three hooks.
+    """
+
+    @staticmethod
+    def _head(invoice, **options):
+        raise NotImplementedError
+
+    @staticmethod
+    def _fill_line(invoice, line, **options):
+        raise NotImplementedError
+
+    @staticmethod
+    def _tail(invoice, **options):
+        raise NotImplementedError
+
+    @staticmethod
+    def lines_loaded(invoice):
+        # Unsaved, eager-loaded or plain (snapshot) invoices carry their lines
+        return 'lines' in invoice.__dict__ or invoice.id is None
+
+    @staticmethod
+    def vat_breakdown(invoice):
+        """
+        Per-rate taxable base and VAT of the invoice: from its lines when they
+        are in memory, else the totals stored at save time (one indexed query).
+        """
+        if XmlDocumentGenerator.lines_loaded(invoice):
+            return TotalsEngine.breakdown(
+                (line.vat_rate, to_decimal(line.line_total) - to_decimal(line.vat_amount)) for line in invoice.lines
+            )
+        return VatSummaryService.invoice_breakdown(invoice.id)
+
+    @staticmethod
+    def _iter_lines(invoice):
+        if XmlDocumentGenerator.lines_loaded(invoice):
+            yield from invoice.lines
+            return
+        # Same order as the `lines` relationship, without holding them all
+        query = db.session.query(InvoiceLine).filter(InvoiceLine.invoice_id == invoice.id)
+        yield from query.order_by(InvoiceLine.id).yield_per(STREAM_BATCH)
+
+    @classmethod
+    def build_invoice_xml(cls, invoice, **options) -> str:
+        lines = invoice.lines
+        fill_line = cls._fill_line
+        return ''.join((
+            cls._head(invoice, **options),
+            ''.join([fill_line(invoice, line, **options) for line in lines]),
+            cls._tail(invoice, **options)
+        ))
+
+    @classmethod
+    def iter_invoice_xml(cls, invoice, **options):
+        """
+        Yields the UTF-8 bytes of build_invoice_xml(invoice), one chunk per
+        section and per line item. Suitable as a Flask streaming response body.
+        """
+        yield cls._head(invoice, **options).encode('utf-8')
+        for line in cls._iter_lines(invoice):
+            yield cls._fill_line(invoice, line, **options).encode('utf-8')
+        yield cls._tail(invoice, **options).encode('utf-8')
+
+    @classmethod
+    def write_invoice_xml(cls, invoice, fp, **options):
+        """Streams the XML into a binary file object. Returns the byte count."""
+        size = 0
+        for chunk in cls.iter_invoice_xml(invoice, **options):
+            fp.write(chunk)
+            size += len(chunk)
+        return size
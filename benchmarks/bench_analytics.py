@@ -0,0 +1,63 @@
+"""
+Revenue by customer, VAT rate and month: SQL GROUP BY over the invoice
+tables vs. the Parquet analytics store.
+
+    python -m benchmarks.bench_analytics [invoices]
+
+Default 200,000 invoices x 5 lines (1M lines, a third of them on drafts,
+which the store leaves out). Needs pyarrow.
+"""
+import sys
+from datetime import date
+
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.invoice import Invoice, InvoiceLine, InvoiceStatus
+from app.services.analytics_store import AnalyticsStore
+from benchmarks.common import make_app, seed_company, bulk_invoices, timed
+
+INVOICES = 200_000
+LINES_PER_INVOICE = 5
+INSERT_CHUNK = 20_000
+
+
+def sql_revenue(company_id):
+    month = func.strftime('%Y-%m', Invoice.invoice_date)
+    return (
+        db.session.query(
+            Invoice.customer_id, InvoiceLine.vat_rate, month,
+            func.sum(InvoiceLine.line_total - InvoiceLine.vat_amount), func.sum(InvoiceLine.vat_amount)
+        )
+        .join(Invoice, Invoice.id == InvoiceLine.invoice_id)
+        .filter(Invoice.company_id == company_id, Invoice.status != InvoiceStatus.DRAFT)
+        .group_by(Invoice.customer_id, InvoiceLine.vat_rate, month)
+        .all()
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else INVOICES
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        for start in range(0, count, INSERT_CHUNK):
+            bulk_invoices(company, customer, min(INSERT_CHUNK, count - start), start=start,
+                          lines_per_invoice=LINES_PER_INVOICE)
+
+        rebuild_s, rows = timed(AnalyticsStore.rebuild)
+        print(f"{rows} lines, store rebuilt in {rebuild_s:.1f} s")
+
+        by = ('customer', 'vat_rate', 'month')
+        sql_s, sql_rows = timed(lambda: sql_revenue(company.id), repeat=3)
+        store_s, store_rows = timed(lambda: AnalyticsStore.revenue(company.id, by), repeat=3)
+        march = (date(date.today().year, 3, 1), date(date.today().year, 3, 31))  # bulk_invoices' year
+        month_s, _ = timed(lambda: AnalyticsStore.revenue(company.id, ('month',), *march), repeat=3)
+        print(f"{'':<28} {'seconds':>8} {'groups':>7}")
+        print(f"{'SQL GROUP BY':<28} {sql_s:>8.3f} {len(sql_rows):>7}")
+        print(f"{'store, customer/rate/month':<28} {store_s:>8.3f} {len(store_rows):>7}")
+        print(f"{'store, one month':<28} {month_s:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Factur-X hybrid PDFs for 1k invoices:
+  - two-pass: render the plain PDF, write the XML to a temp file, then
+    render again as PDF/A-3 with the file attached (the naive pipeline);
+  - pipeline: FacturXService.render(), one render with the XML embedded in
+    memory, on the PDF render pool;
+  - cached: FacturXService.get_or_build() a second time (content-hash hits).
+Needs WeasyPrint and its system libraries.
+
+    python -m benchmarks.bench_facturx
+"""
+import os
+import sys
+import tempfile
+
+from app.models.company import Company
+from app.models.invoice import Invoice
+from app.services.facturx_service import FacturXService
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.pdf_render_pool import get_render_pool
+from app.services.pdf_service import PdfService
+from benchmarks.common import make_app, seed_company, bulk_invoices, timed
+
+INVOICES = 1_000
+LINES_PER_INVOICE = 10
+
+
+def main():
+    try:
+        import weasyprint  # noqa: F401
+    except Exception as e:
+        sys.exit(f"WeasyPrint is not usable here ({type(e).__name__}); nothing to measure.")
+
+    app = make_app()
+    app.config['PDF_RENDER_QUEUE_LIMIT'] = INVOICES
+    with app.app_context(), app.test_request_context():
+        company, customer = seed_company()
+        bulk_invoices(company, customer, INVOICES, lines_per_invoice=LINES_PER_INVOICE)
+        company = Company.query.first()
+        invoices = Invoice.query.order_by(Invoice.id).all()
+        pool = get_render_pool(app)
+        print(f"{INVOICES} invoices x {LINES_PER_INVOICE} lines, {pool.workers} render workers")
+
+        def two_pass():
+            out = []
+            for invoice in invoices:
+                html = PdfService.render_html(invoice, company)
+                pool.render(html)
+                with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as f:
+                    FranceXMLGenerator.write_invoice_xml(invoice, f)
+                with open(f.name, 'rb') as f:
+                    xml = f.read()
+                os.remove(f.name)
+                out.append(pool.render(html, facturx={'xml': xml, 'profile': 'EN16931'}))
+            return out
+
+        def pipeline():
+            # Keep every worker busy: submit all, then collect
+            jobs = []
+            for invoice in invoices:
+                xml = FranceXMLGenerator.build_invoice_xml(invoice).encode('utf-8')
+                jobs.append(pool.submit(PdfService.render_html(invoice, company), facturx={'xml': xml, 'profile': 'EN16931'}))
+            return [pool.result(job) for job in jobs]
+
+        def cached():
+            return [FacturXService.get_or_build(invoice, company)[0] for invoice in invoices]
+
+        pool.render('<p>warm up</p>')
+        base, _ = timed(two_pass)
+        print(f"{'two-pass':>10} {base:>8.1f} s  {INVOICES / base:>7.1f} docs/s")
+        seconds, pdfs = timed(pipeline)
+        print(f"{'pipeline':>10} {seconds:>8.1f} s  {INVOICES / seconds:>7.1f} docs/s  x{base / seconds:.1f}  "
+              f"all embedded={all(pdf and b'factur-x.xml' in pdf for pdf in pdfs)}")
+        cached()  # fill the cache
+        seconds, _ = timed(cached)
+        print(f"{'cached':>10} {seconds:>8.2f} s  {INVOICES / seconds:>7.0f} docs/s")
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Line-item ingestion: legacy per-index form lookups + one session.add per line
+vs. LineItemService (single pass over the form + executemany INSERT).
+
+    python -m benchmarks.bench_line_ingest
+
+The legacy loop is run over range(n) instead of range(200) so both sides
+store every line.
+"""
+from datetime import date
+
+from werkzeug.datastructures import MultiDict
+
+from app.extensions import db
+from app.models.invoice import Invoice, InvoiceLine
+from app.services.line_item_service import LineItemService
+from benchmarks.common import make_app, seed_company, timed
+
+SIZES = [10, 1_000, 10_000]
+
+
+def build_form(n):
+    form = MultiDict()
+    for i in range(n):
+        form[f"lines[{i}][product_id]"] = ''
+        form[f"lines[{i}][desc]"] = f"Meter reading {i}"
+        form[f"lines[{i}][hsn]"] = '2716'
+        form[f"lines[{i}][qty]"] = str(1 + i % 7)
+        form[f"lines[{i}][rate]"] = '12.35'
+        form[f"lines[{i}][tax]"] = '20' if i % 2 else '5.5'
+    return form
+
+
+def legacy_ingest(form, invoice_id, n):
+    for i in range(n):
+        desc = form.get(f"lines[{i}][desc]")
+        prod_id_raw = form.get(f"lines[{i}][product_id]")
+        if not ((desc and desc.strip()) or prod_id_raw):
+            continue
+        qty = float(form.get(f"lines[{i}][qty]", 1) or 1)
+        rate = float(form.get(f"lines[{i}][rate]", 0) or 0)
+        tax_pct = float(form.get(f"lines[{i}][tax]", 0) or 0)
+        line_net = qty * rate
+        vat_amount = line_net * (tax_pct / 100)
+        db.session.add(InvoiceLine(
+            invoice_id=invoice_id, description=desc or '',
+            hsn_sac_code=form.get(f"lines[{i}][hsn]", ''),
+            quantity=qty, unit_price=rate, vat_rate=tax_pct,
+            vat_amount=vat_amount, line_total=line_net + vat_amount
+        ))
+    db.session.flush()
+
+
+def new_ingest(form, invoice_id):
+    LineItemService.bulk_insert(invoice_id, LineItemService.parse_form(form))
+    db.session.flush()
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        inv = Invoice(invoice_number='BENCH-1', invoice_date=date.today(),
+                      company_id=company.id, customer_id=customer.id)
+        db.session.add(inv)
+        db.session.commit()
+
+        print(f"{'lines':>8} {'legacy ms':>12} {'batched ms':>12} {'speed-up':>9}")
+        for n in SIZES:
+            form = build_form(n)
+            legacy, _ = timed(lambda: legacy_ingest(form, inv.id, n))
+            db.session.rollback()
+            batched, _ = timed(lambda: new_ingest(form, inv.id))
+            db.session.rollback()
+            print(f"{n:>8} {legacy * 1e3:>12.1f} {batched * 1e3:>12.1f} {legacy / batched:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
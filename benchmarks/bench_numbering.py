@@ -0,0 +1,51 @@
+"""
+Invoice number allocation: legacy count-and-probe vs. the sequence table.
+
+    python -m benchmarks.bench_numbering
+
+Allocation time should stay flat as the invoices table grows.
+"""
+from datetime import date
+
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.services.numbering_service import InvoiceNumberingService
+from benchmarks.common import make_app, seed_company, bulk_invoices, timed
+
+SIZES = [1_000, 10_000, 50_000, 100_000]
+ALLOCATIONS = 200
+
+
+def legacy_allocate():
+    # What _unique_invoice_number did before: count everything, then probe
+    count = Invoice.query.filter_by(fr_document_type='INVOICE').count()
+    num = 1001 + count
+    while True:
+        candidate = f"INV-{date.today().year}-{num}"
+        if not Invoice.query.filter_by(invoice_number=candidate).first():
+            return candidate
+        num += 1
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        inserted = 0
+        print(f"{'invoices':>10} {'legacy us/alloc':>16} {'sequence us/alloc':>18}")
+        for size in SIZES:
+            bulk_invoices(company, customer, size - inserted, start=inserted)
+            inserted = size
+            # Create the sequence row up front; its one-off seed scan is not what we measure
+            InvoiceNumberingService.allocate(company)
+            db.session.commit()
+
+            legacy, _ = timed(lambda: [legacy_allocate() for _ in range(ALLOCATIONS)])
+            seq, _ = timed(lambda: [InvoiceNumberingService.allocate(company) for _ in range(ALLOCATIONS)])
+            db.session.rollback()  # give the numbers back
+
+            print(f"{size:>10} {legacy / ALLOCATIONS * 1e6:>16.1f} {seq / ALLOCATIONS * 1e6:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
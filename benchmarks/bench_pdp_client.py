@@ -0,0 +1,62 @@
+"""
+Platform deposits against the local stand-in (benchmarks.pdp_standin):
+one request at a time, as the synchronous clients do, versus the asyncio
+client with pooled connections at a few concurrency limits, and versus
+multi-invoice deposits. The sequential time is measured on a sample and
+extrapolated.
+
+    python -m benchmarks.bench_pdp_client
+"""
+import asyncio
+import time
+
+from app.services.integration_clients import AsyncFrancePDPClient, FrancePDPClient, pack_deposits
+from benchmarks.pdp_standin import StandInPlatform, start
+
+INVOICES = 10_000
+SEQUENTIAL_SAMPLE = 40
+CONCURRENCY = [32, 128, 256]
+XML = '<rsm:CrossIndustryInvoice>' + 'x' * 4000 + '</rsm:CrossIndustryInvoice>'
+
+
+async def deposit(base_url, count, concurrency):
+    results = {}
+    started = time.perf_counter()
+    async with AsyncFrancePDPClient(base_url, concurrency=concurrency, max_retries=5) as client:
+        async for key, result in client.send_many((n, XML) for n in range(count)):
+            results[key] = result
+    return time.perf_counter() - started, results
+
+
+async def main():
+    platform = StandInPlatform()
+    runner, base_url = await start(platform)
+    try:
+        print(f"stand-in: {platform.latency * 1000:.0f} ms per deposit, {platform.rate_limit} req/s")
+        seconds, _ = await deposit(base_url, SEQUENTIAL_SAMPLE, 1)
+        sequential = seconds / SEQUENTIAL_SAMPLE * INVOICES
+        print(f"{'sequential':>16} {sequential:>9.1f} s  (extrapolated from {SEQUENTIAL_SAMPLE})")
+        for concurrency in CONCURRENCY:
+            platform.throttled = platform.max_concurrent = 0
+            seconds, results = await deposit(base_url, INVOICES, concurrency)
+            ok = sum(1 for r in results.values() if r['success'])
+            print(f"{f'async x{concurrency}':>16} {seconds:>9.1f} s  x{sequential / seconds:.0f}  "
+                  f"ok={ok}/{INVOICES}  429s={platform.throttled}  peak in flight={platform.max_concurrent}")
+
+        documents = [(n, XML.encode('utf-8')) for n in range(INVOICES)]
+        deposits = list(pack_deposits(documents, FrancePDPClient.MAX_DEPOSIT_BYTES, FrancePDPClient.MAX_DEPOSIT_DOCUMENTS))
+        started = time.perf_counter()
+        async with AsyncFrancePDPClient(base_url, concurrency=4) as client:
+            acks = {}
+            for result in await asyncio.gather(*(client.send_deposit(d) for d in deposits)):
+                acks.update(result)
+        seconds = time.perf_counter() - started
+        ok = sum(1 for r in acks.values() if r['success'])
+        print(f"{'deposits':>16} {seconds:>9.1f} s  x{sequential / seconds:.0f}  "
+              f"ok={ok}/{INVOICES}  round trips={len(deposits)}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Invoice report export: time and peak Python memory of the streamed CSV and
+write-only Excel exports as the number of exported invoices grows.
+
+    python -m benchmarks.bench_report_export [max_invoices]
+
+Peak memory should stay flat from 10k to 1M rows.
+"""
+import sys
+import time
+import tracemalloc
+
+import openpyxl  # noqa: F401  (imported up front so its import is not counted)
+
+from benchmarks.common import make_app, seed_company, bulk_invoices
+from app.services.report_export_service import InvoiceReportService
+
+SIZES = [10_000, 100_000, 1_000_000]
+INSERT_CHUNK = 50_000
+COLUMNS = ['invoice_number', 'invoice_date', 'status', 'customer_name', 'buyer_country',
+           'total_net', 'total_tax', 'total_gross', 'currency']
+
+
+def measure(fn):
+    """Returns (seconds, peak MiB allocated during the call)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def export_csv(company_id):
+    size = 0
+    for chunk in InvoiceReportService.iter_csv(company_id, {}, COLUMNS):
+        size += len(chunk)
+    return size
+
+
+def export_xlsx(company_id):
+    InvoiceReportService.write_xlsx(company_id, {}, COLUMNS).close()
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        inserted = 0
+        print(f"{'invoices':>10} {'csv s':>8} {'csv MiB':>8} {'xlsx s':>8} {'xlsx MiB':>9}")
+        for size in [s for s in SIZES if s <= limit]:
+            while inserted < size:
+                chunk = min(INSERT_CHUNK, size - inserted)
+                bulk_invoices(company, customer, chunk, start=inserted)
+                inserted += chunk
+
+            csv_s, csv_mib = measure(lambda: export_csv(company.id))
+            xlsx_s, xlsx_mib = measure(lambda: export_xlsx(company.id))
+            print(f"{size:>10} {csv_s:>8.1f} {csv_mib:>8.1f} {xlsx_s:>8.1f} {xlsx_mib:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
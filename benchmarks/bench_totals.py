@@ -0,0 +1,33 @@
+"""
+TotalsEngine throughput: full recompute of an invoice's lines and VAT buckets,
+and the cost of materialising per-line Decimals for storage (fill_lines).
+
+    python -m benchmarks.bench_totals
+"""
+from app.services.totals_engine import TotalsEngine
+from benchmarks.common import timed
+
+SIZES = [10, 1_000, 10_000, 100_000]
+RATES = ['20', '10', '5.5', '2.1', '0']
+
+
+def build_lines(n):
+    return [{
+        'quantity': str(1 + i % 9),
+        'unit_price': f"{(i % 5000) / 70:.2f}",
+        'vat_rate': RATES[i % len(RATES)],
+    } for i in range(n)]
+
+
+def main():
+    print(f"{'lines':>8} {'compute ms':>11} {'+fill ms':>9} {'us/line':>8}")
+    for n in SIZES:
+        lines = build_lines(n)
+        best, totals = timed(lambda: TotalsEngine.compute(lines), repeat=5)
+        filled, _ = timed(lambda: TotalsEngine.fill_lines([dict(l) for l in lines], totals), repeat=3)
+        print(f"{n:>8} {best * 1e3:>11.2f} {filled * 1e3:>9.2f} {best / n * 1e6:>8.2f}"
+              f"   gross={totals['total_gross']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Factur-X XML generation: tree mode (tostring of build_invoice_tree) versus
+streaming mode (write_invoice_xml into a sink), by number of lines. Peak memory is measured
+with tracemalloc and covers everything allocated while generating, including
+the ORM line objects.
+
+    python -m benchmarks.bench_xml
+"""
+import gc
+import tracemalloc
+from xml.etree.ElementTree import tostring
+
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.services.france_xml_generator import FranceXMLGenerator
+from benchmarks.common import make_app, seed_company, bulk_invoices, timed
+
+SIZES = [10, 1_000, 10_000, 50_000]
+
+
+class NullSink:
+    def write(self, data):
+        return len(data)
+
+
+def measure(fn):
+    """Returns (seconds, peak MiB) for one fresh call of fn()."""
+    db.session.expire_all()
+    gc.collect()
+    tracemalloc.start()
+    seconds, _ = timed(fn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / (1024 * 1024)
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        print(f"{'lines':>8} {'tree ms':>9} {'tree MiB':>9} {'stream ms':>10} {'stream MiB':>11} {'identical':>10}")
+        for i, n in enumerate(SIZES):
+            bulk_invoices(company, customer, 1, start=i, lines_per_invoice=n)
+            invoice_id = db.session.query(Invoice.id).order_by(Invoice.id.desc()).limit(1).scalar()
+
+            def tree():
+                return tostring(FranceXMLGenerator.build_invoice_tree(db.session.get(Invoice, invoice_id)), encoding='unicode')
+
+            def stream():
+                return FranceXMLGenerator.write_invoice_xml(db.session.get(Invoice, invoice_id), NullSink())
+
+            tree_s, tree_mb = measure(tree)
+            stream_s, stream_mb = measure(stream)
+            db.session.expire_all()
+            invoice = db.session.get(Invoice, invoice_id)
+            same = b''.join(FranceXMLGenerator.iter_invoice_xml(invoice)) == \
+                tostring(FranceXMLGenerator.build_invoice_tree(invoice), encoding='unicode').encode('utf-8')
+            print(f"{n:>8} {tree_s * 1e3:>9.1f} {tree_mb:>9.1f} {stream_s * 1e3:>10.1f} {stream_mb:>11.1f} {str(same):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Factur-X XML for many invoices: one build_invoice_xml() call per invoice
+(lazy loads per invoice) versus XmlBatchService, in-process and on a
+process pool. Also checks the outputs are identical.
+
+    python -m benchmarks.bench_xml_batch
+"""
+import os
+
+from app.extensions import db
+from app.models.invoice import Invoice
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.xml_batch_service import XmlBatchService
+from benchmarks.common import make_app, seed_company, bulk_invoices, timed
+
+INVOICES = 2_000
+LINES_PER_INVOICE = 20
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        company, customer = seed_company()
+        bulk_invoices(company, customer, INVOICES, lines_per_invoice=LINES_PER_INVOICE)
+        ids = [i for (i,) in db.session.query(Invoice.id).order_by(Invoice.id)]
+
+        def one_by_one():
+            db.session.expire_all()
+            return [(i, FranceXMLGenerator.build_invoice_xml(db.session.get(Invoice, i)).encode('utf-8')) for i in ids]
+
+        def batch(workers):
+            db.session.expire_all()
+            return list(XmlBatchService.generate(ids, workers=workers))
+
+        print(f"{INVOICES} invoices x {LINES_PER_INVOICE} lines")
+        base, expected = timed(one_by_one)
+        print(f"{'one by one':>18} {base:>8.2f} s")
+        for workers in (1, max(2, os.cpu_count() or 1)):
+            seconds, result = timed(lambda: batch(workers))
+            print(f"{f'batch, {workers} proc':>18} {seconds:>8.2f} s  x{base / seconds:.1f}  identical={result == expected}")
+
+
+if __name__ == '__main__':
+    main()
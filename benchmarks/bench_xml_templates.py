@@ -0,0 +1,63 @@
+"""
+Factur-X XML for many small invoices: ElementTree (build_invoice_tree +
+tostring) versus the precompiled skeleton (build_invoice_xml), on in-memory
+invoices so only XML generation is measured. Every output is compared.
+
+    python -m benchmarks.bench_xml_templates
+"""
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from xml.etree.ElementTree import tostring
+
+from app.services.france_xml_generator import FranceXMLGenerator, PROFILES
+from benchmarks.common import timed
+
+INVOICES = 100_000
+LINES_PER_INVOICE = 3
+
+COMPANY = SimpleNamespace(name="Bench SAS", legal_form="SAS", share_capital="10000", rcs_city="Paris",
+                          siret="12345678900011", siren="123456789", vat_number="FR00123456789")
+
+
+def build_invoices(n):
+    invoices = []
+    for i in range(n):
+        lines = [SimpleNamespace(id=i * 10 + j, hsn_sac_code="9983" if j % 2 else None,
+                                 description=f"Service {j} & support <{i}>", unit_price=Decimal('25.00'),
+                                 quantity=Decimal('2.00'), vat_rate=Decimal('20.00'),
+                                 vat_amount=Decimal('10.00'), line_total=Decimal('60.00'))
+                 for j in range(LINES_PER_INVOICE)]
+        invoices.append(SimpleNamespace(
+            id=i, invoice_number=f"INV-2026-{1001 + i}",
+            fr_document_type="CREDIT_NOTE" if i % 10 == 0 else "INVOICE",
+            invoice_date=date(2026, 1 + i % 12, 1 + i % 28), tax_point_date=None,
+            company=COMPANY if i % 50 else None, purchase_order_number=f"PO-{i}" if i % 3 == 0 else None,
+            customer_vat="FR99887766554" if i % 2 else None,
+            fr_payment_means=("TRANSFER", "CARD", None)[i % 3],
+            total_net=Decimal('150.00'), total_tax=Decimal('30.00'), total_gross=Decimal('180.00'),
+            lines=lines
+        ))
+    return invoices
+
+
+def main():
+    invoices = build_invoices(INVOICES)
+    tree_s, expected = timed(lambda: [
+        tostring(FranceXMLGenerator.build_invoice_tree(inv), encoding='unicode') for inv in invoices])
+    fast_s, result = timed(lambda: [FranceXMLGenerator.build_invoice_xml(inv) for inv in invoices])
+
+    print(f"{INVOICES} invoices x {LINES_PER_INVOICE} lines")
+    print(f"{'ElementTree':>12} {tree_s:>7.2f} s  {tree_s / INVOICES * 1e6:>6.1f} us/invoice")
+    print(f"{'compiled':>12} {fast_s:>7.2f} s  {fast_s / INVOICES * 1e6:>6.1f} us/invoice  x{tree_s / fast_s:.1f}")
+    print(f"identical: {result == expected}")
+
+    for profile in PROFILES:
+        same = all(FranceXMLGenerator.build_invoice_xml(inv, profile=profile) ==
+                   tostring(FranceXMLGenerator.build_invoice_tree(inv, profile), encoding='unicode')
+                   for inv in invoices[:1000])
+        print(f"  {profile:<9} identical: {same}")
+
+
+if __name__ == '__main__':
+    main()
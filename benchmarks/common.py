@@ -0,0 +1,85 @@
+"""
+Shared setup for the benchmark scripts.
+Each script runs against a throwaway SQLite database so it can be pointed at
+any checkout:  python -m benchmarks.bench_numbering
+"""
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+
+class BenchConfig(Config):
+    TESTING = True
+    LOGIN_DISABLED = True
+
+
+def make_app(db_path=None):
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+    BenchConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+    BenchConfig.UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'bench_storage')
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def seed_company():
+    from app.models.company import Company
+    from app.models.customer import Customer
+
+    company = Company(name="Bench SAS", merchant_id="BENCH", vat_number="FR00123456789", siren="123456789")
+    db.session.add(company)
+    db.session.flush()
+    customer = Customer(name="Bench Client", customer_ref_id="100001", company_id=company.id)
+    db.session.add(customer)
+    db.session.commit()
+    return company, customer
+
+
+def bulk_invoices(company, customer, count, start=0, prefix="INV", year=None, lines_per_invoice=0):
+    """Insert `count` invoices (and optional lines) with Core inserts for speed."""
+    from app.models.invoice import Invoice, InvoiceLine, InvoiceStatus
+
+    year = year or date.today().year
+    base = datetime(year, 1, 1)
+    rows = [{
+        'invoice_number': f"{prefix}-{year}-{1001 + start + i}",
+        'invoice_date': date(year, 1, 1) + timedelta(days=(start + i) % 360),
+        'status': InvoiceStatus.SENT if i % 3 else InvoiceStatus.DRAFT,
+        'company_id': company.id,
+        'customer_id': customer.id,
+        'fr_document_type': 'INVOICE',
+        'total_net': 100, 'total_tax': 20, 'total_gross': 120,
+        'created_at': base + timedelta(seconds=start + i),
+    } for i in range(count)]
+    db.session.execute(db.insert(Invoice), rows)
+
+    if lines_per_invoice:
+        ids = [i for (i,) in db.session.query(Invoice.id).order_by(Invoice.id.desc()).limit(count)]
+        line_rows = [{
+            'invoice_id': inv_id,
+            'description': f"Item {n}",
+            'quantity': 2, 'unit_price': 25, 'vat_rate': 20 if n % 2 else 5.5,
+            'vat_amount': 10, 'line_total': 60,
+        } for inv_id in ids for n in range(lines_per_invoice)]
+        db.session.execute(db.insert(InvoiceLine), line_rows)
+    db.session.commit()
+
+
+def timed(fn, repeat=1):
+    """Returns (best seconds per call, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,165 @@
+"""
+Local stand-in for a PDP / FACeB2B deposit API, for exercising the asyncio
+platform clients without a real platform.
+
+POST /invoices accepts an XML body, waits LATENCY seconds and answers
+201 {"id": ...}. A fixed-window limiter allows RATE_LIMIT requests per
+second and answers 429 with Retry-After beyond that; every response carries
+RateLimit-Remaining / RateLimit-Reset. A body containing "REJECT" gets a 422.
+
+POST /deposits accepts a ZIP of <reference>.xml documents (one rate-limit
+unit, LATENCY per deposit) and acknowledges each one: REJECTED if it
+contains "REJECT", UNAVAILABLE (retryable) the first time a reference is
+seen when defer_every=N picks it, ACCEPTED otherwise.
+
+Both endpoints honour an Idempotency-Key header: a repeated key gets the
+first answer back (200) without a second deposit.
+
+    python -m benchmarks.pdp_standin --port 8089
+    PDP_BASE_URL=http://127.0.0.1:8089 flask run
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import math
+import time
+import zipfile
+
+from aiohttp import web
+
+LATENCY = 0.25
+RATE_LIMIT = 400
+
+
+class StandInPlatform:
+    def __init__(self, latency=LATENCY, rate_limit=RATE_LIMIT, defer_every=0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.defer_every = defer_every
+        self.seen = set()
+        self.deposits = 0
+        self.replies = {}       # Idempotency-Key -> first successful answer
+        self.replayed = 0
+        self.ids = itertools.count(1)
+        self.window = 0
+        self.used = 0
+        self.accepted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self.connections = set()    # client (host, port) pairs: one per TCP connection
+
+    def _headers(self):
+        reset = max(1, math.ceil(self.window + 1 - time.time()))
+        return {'RateLimit-Remaining': str(max(0, self.rate_limit - self.used)), 'RateLimit-Reset': str(reset)}
+
+    def _throttle(self):
+        """Counts one request against the window; returns a 429 when over it."""
+        now = int(time.time())
+        if now != self.window:
+            self.window, self.used = now, 0
+        if self.used >= self.rate_limit:
+            self.throttled += 1
+            headers = self._headers()
+            headers['Retry-After'] = headers['RateLimit-Reset']
+            return web.json_response({'code': 'RATE_LIMITED', 'message': 'Too many requests'}, status=429, headers=headers)
+        self.used += 1
+        return None
+
+    def _replay(self, request):
+        reply = self.replies.get(request.headers.get('Idempotency-Key'))
+        if reply is None:
+            return None
+        self.replayed += 1
+        return web.json_response(reply, status=200, headers=self._headers())
+
+    def _remember(self, request, reply):
+        key = request.headers.get('Idempotency-Key')
+        if key:
+            self.replies[key] = reply
+
+    def _acknowledge(self, reference, xml):
+        if b'REJECT' in xml:
+            self.rejected += 1
+            return {'reference': reference, 'status': 'REJECTED', 'code': 'SCHEMA', 'message': 'Invalid invoice'}
+        first_time = reference not in self.seen
+        self.seen.add(reference)
+        if first_time and self.defer_every and zipfile.crc32(reference.encode()) % self.defer_every == 0:
+            return {'reference': reference, 'status': 'UNAVAILABLE', 'code': 'TRY_LATER'}
+        self.accepted += 1
+        return {'reference': reference, 'status': 'ACCEPTED', 'id': f"STANDIN-{next(self.ids):08d}"}
+
+    async def deposit_many(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        throttled = self._throttle() or self._replay(request)
+        if throttled is not None:
+            return throttled
+        headers = self._headers()
+        self.deposits += 1
+        body = await request.read()
+        await asyncio.sleep(self.latency)
+        try:
+            with zipfile.ZipFile(io.BytesIO(body)) as archive:
+                acks = [self._acknowledge(name.rsplit('.', 1)[0], archive.read(name)) for name in archive.namelist()]
+        except zipfile.BadZipFile:
+            return web.json_response({'code': 'BAD_ARCHIVE', 'message': 'Not a ZIP deposit'}, status=400, headers=headers)
+        reply = {'deposit_id': f"DEP-{self.deposits:06d}", 'acknowledgements': acks}
+        self._remember(request, reply)
+        return web.json_response(reply, status=201, headers=headers)
+
+    async def deposit(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        throttled = self._throttle() or self._replay(request)
+        if throttled is not None:
+            return throttled
+        headers = self._headers()
+
+        self._concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self._concurrent)
+        try:
+            body = await request.read()
+            await asyncio.sleep(self.latency)
+        finally:
+            self._concurrent -= 1
+
+        if b'REJECT' in body:
+            self.rejected += 1
+            return web.json_response({'code': 'SCHEMA', 'message': 'Invalid invoice'}, status=422, headers=headers)
+        self.accepted += 1
+        reply = {'id': f"STANDIN-{next(self.ids):08d}", 'message': 'Deposited'}
+        self._remember(request, reply)
+        return web.json_response(reply, status=201, headers=headers)
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post('/invoices', self.deposit)
+        app.router.add_post('/deposits', self.deposit_many)
+        return app
+
+
+async def start(platform, host='127.0.0.1', port=0):
+    """Starts the stand-in on the running loop. Returns (runner, base_url)."""
+    runner = web.AppRunner(platform.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=LATENCY)
+    parser.add_argument('--rate-limit', type=int, default=RATE_LIMIT)
+    parser.add_argument('--defer-every', type=int, default=0)
+    args = parser.parse_args()
+    platform = StandInPlatform(args.latency, args.rate_limit, args.defer_every)
+    web.run_app(platform.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
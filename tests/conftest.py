@@ -0,0 +1,153 @@
+from datetime import date
+
+import pytest
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+from app.models import Company, Customer, Invoice, InvoiceLine
+from app.models.company import CompanyAddress
+from app.models.customer import CustomerAddress
+from app.models.invoice import InvoiceStatus
+from app.services.integration_clients import FrancePDPClient, SpainFaceB2BClient
+from app.services.pdf_service import PdfService
+
+
+class TestConfig(Config):
+    TESTING = True
+    LOGIN_DISABLED = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SUBMISSION_QUEUE = 'inprocess'
+    SUBMISSION_MODE = 'single'
+    REPORT_QUEUE = 'inprocess'
+    SUBMISSION_BACKOFF_BASE = 1     # retries 1, 2, 4, 8 seconds apart
+    PDF_RENDER_POOL = False
+    ANALYTICS_STORE = False
+    PDP_BASE_URL = None
+    FACEB2B_BASE_URL = None
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(TestConfig)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def company(app):
+    company = Company(name='Acme', merchant_id='1', vat_number='FR40123456789', siren='123456789',
+                      siret='12345678900011')
+    db.session.add(company)
+    db.session.flush()
+    db.session.add(CompanyAddress(company_id=company.id, type='BILLING', address_line1='1 rue de la Paix',
+                                  city='Paris', zip_code='75001', country='FR'))
+    db.session.commit()
+    return company
+
+
+@pytest.fixture
+def customer(company):
+    customer = Customer(name='Bob SARL', customer_ref_id='100001', company_id=company.id)
+    db.session.add(customer)
+    db.session.commit()
+    return customer
+
+
+@pytest.fixture
+def facturae(company, customer):
+    """Spanish seller, French buyer, both complete."""
+    company.einvoice_format = 'FACTURAE'
+    company.vat_number = 'ESB12345678'
+    CompanyAddress.query.delete()
+    db.session.add(CompanyAddress(company_id=company.id, type='BILLING', address_line1='Calle Mayor 1',
+                                  city='Sant Cugat del Vallès', zip_code='08172', country='ES'))
+    customer.vat_number = 'FR40123456789'
+    db.session.add(CustomerAddress(customer_id=customer.id, address_line1='1 rue de la Paix', city='Lyon',
+                                   zip_code='69001', country='FR'))
+    db.session.commit()
+    return company
+
+
+@pytest.fixture
+def make_invoice(company, customer):
+    """Finalised invoice with `lines` lines of 2 x 25.00 at 20% VAT."""
+    def make(number='INV-1', lines=2, status=InvoiceStatus.SENT):
+        invoice = Invoice(invoice_number=number, invoice_date=date(2026, 1, 5), status=status,
+                          company_id=company.id, customer_id=customer.id, fr_document_type='INVOICE',
+                          total_net=50 * lines, total_tax=10 * lines, total_gross=60 * lines)
+        for n in range(lines):
+            invoice.lines.append(InvoiceLine(description=f'item {n}', quantity=2, unit_price=25, vat_rate=20,
+                                             vat_amount=10, line_total=60))
+        db.session.add(invoice)
+        db.session.commit()
+        return invoice
+    return make
+
+
+class FakePlatform:
+    """Stands in for the clients' send_invoice: plays back `responses`, then accepts."""
+
+    def __init__(self):
+        self.responses = []
+        self.calls = []
+
+    def send_invoice(self, client, xml, idempotency_key=None):
+        self.calls.append(idempotency_key)
+        response = self.responses.pop(0) if self.responses else {
+            'success': True, 'external_id': f'FR-PDP-{len(self.calls)}', 'message': 'Deposited successfully'
+        }
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture(autouse=True)
+def platform(monkeypatch):
+    fake = FakePlatform()
+    for client_class in (FrancePDPClient, SpainFaceB2BClient):
+        monkeypatch.setattr(client_class, 'send_invoice',
+                            lambda client, xml, idempotency_key=None: fake.send_invoice(client, xml, idempotency_key))
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def no_prewarm(monkeypatch):
+    # Pre-warming renders on a thread; tests render on demand instead
+    monkeypatch.setattr(PdfService, 'prewarm', staticmethod(lambda invoice_id: None))
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    """Replaces the PDF engine: each render returns distinct bytes and is counted."""
+    renders = []
+
+    def html_to_pdf(html, facturx=None):
+        renders.append(html)
+        return f'%PDF-1.7 render {len(renders)}'.encode()
+
+    monkeypatch.setattr(PdfService, 'html_to_pdf', staticmethod(html_to_pdf))
+    return renders
+
+
+@pytest.fixture
+def invoice_form(customer):
+    """Form data of the invoice editor: two lines, 20% and 5.5% VAT."""
+    def form(save_type='send', **fields):
+        data = {
+            'customer_id': str(customer.id), 'invoice_date': '2026-03-10', 'save_type': save_type,
+            'lines[0][desc]': 'Consulting', 'lines[0][qty]': '2', 'lines[0][rate]': '50', 'lines[0][tax]': '20',
+            'lines[1][desc]': 'Books', 'lines[1][qty]': '1', 'lines[1][rate]': '33.33', 'lines[1][tax]': '5.5',
+        }
+        data.update(fields)
+        return data
+    return form
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from app.services import analytics_store
+from app.services.analytics_store import AnalyticsStore
+
+
+@pytest.fixture(autouse=True)
+def store(app):
+    pytest.importorskip('pyarrow')
+    app.config['ANALYTICS_STORE'] = True
+
+
+def _months(company_id):
+    return {row['month']: (row['lines'], row['net'], row['tax']) for row in AnalyticsStore.revenue(company_id)}
+
+
+def _parts(company_id):
+    directory = AnalyticsStore.company_dir(company_id)
+    return sorted(os.path.relpath(path, directory) for path in AnalyticsStore._parts(directory))
+
+
+def test_only_finalised_invoices_are_stored(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form('draft'))
+    assert _months(company.id) == {}
+
+    client.post('/invoices/edit/1', data=invoice_form())
+    assert _months(company.id) == {'2026-03': (2, 133.33, 21.83)}
+
+
+def test_editing_a_sent_invoice_replaces_its_rows(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/create', data=invoice_form())
+
+    client.post('/invoices/edit/1', data=invoice_form(**{'lines[0][qty]': '3'}))
+    client.post('/invoices/edit/2', data=invoice_form(invoice_date='2026-04-02'))
+
+    assert _months(company.id) == {'2026-03': (2, 183.33, 31.83), '2026-04': (2, 133.33, 21.83)}
+
+
+def test_credit_notes_count_negative(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/credit-note/create', data=invoice_form(invoice_number='Auto or Manual'))
+
+    by_type = {row['document_type']: row['net'] for row in AnalyticsStore.revenue(company.id, by=['document_type'])}
+
+    assert by_type == {'CREDIT_NOTE': -133.33, 'INVOICE': 133.33}
+    assert _months(company.id) == {'2026-03': (4, 0.0, 0.0)}
+
+
+def test_rebuild_matches_the_incremental_store(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/create', data=invoice_form(invoice_date='2026-01-15'))
+    client.post('/invoices/edit/2', data=invoice_form(invoice_date='2026-01-15', **{'lines[1][qty]': '5'}))
+    incremental = AnalyticsStore.revenue(company.id, by=['month', 'vat_rate', 'customer'])
+
+    assert AnalyticsStore.rebuild() == 4
+    assert AnalyticsStore.revenue(company.id, by=['month', 'vat_rate', 'customer']) == incremental
+    assert [part.split(os.sep)[0] for part in _parts(company.id)] == ['month=2026-01', 'month=2026-03']
+
+
+def test_month_partitions_are_compacted(client, company, invoice_form, monkeypatch):
+    monkeypatch.setattr(analytics_store, 'COMPACT_PARTS', 2)
+    for _ in range(3):
+        client.post('/invoices/create', data=invoice_form())
+
+    assert len(_parts(company.id)) == 1
+    assert _months(company.id) == {'2026-03': (6, 399.99, 65.49)}
+
+
+def test_date_range_and_api(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form(invoice_date='2026-03-01'))
+    client.post('/invoices/create', data=invoice_form(invoice_date='2026-03-20'))
+
+    rows = AnalyticsStore.revenue(company.id, by=['vat_rate'], start='2026-03-10', end='2026-03-31')
+    assert [(row['vat_rate'], row['lines'], row['gross']) for row in rows] == [(5.5, 1, 35.16), (20.0, 1, 120.0)]
+
+    body = client.get('/invoices/api/analytics/revenue?by=customer').get_json()
+    assert body['rows'] == [{'customer_id': 1, 'customer_name': 'Bob SARL', 'lines': 4,
+                             'net': 266.66, 'tax': 43.66, 'gross': 310.32}]
+    assert client.get('/invoices/api/analytics/revenue?by=colour').status_code == 400
@@ -0,0 +1,47 @@
+import io
+import zipfile
+
+import pytest
+
+from app.services.pdf_service import PdfService
+
+
+@pytest.fixture
+def inline_renders(monkeypatch):
+    renders = []
+
+    def html_to_pdf_inline(html, facturx=None):
+        renders.append(html)
+        return f'%PDF-1.7 inline {len(renders)}'.encode()
+
+    monkeypatch.setattr(PdfService, 'html_to_pdf_inline', staticmethod(html_to_pdf_inline))
+    return renders
+
+
+def _export(client):
+    response = client.get('/invoices/export/pdfs')
+    assert response.status_code == 200
+    return zipfile.ZipFile(io.BytesIO(response.data))
+
+
+def test_invoices_whose_numbers_sanitise_alike_get_their_own_entries(client, make_invoice, inline_renders):
+    make_invoice('INV/1')
+    make_invoice('INV 1')
+    make_invoice('../')
+
+    archive = _export(client)
+
+    assert archive.namelist() == ['INV_1-1.pdf', 'INV_1-2.pdf', 'invoice-3.pdf']
+    assert len({archive.read(name) for name in archive.namelist()}) == 3
+
+
+def test_export_copies_cached_pdfs_and_renders_the_rest_once(client, make_invoice, inline_renders):
+    make_invoice('INV-1')
+    make_invoice('INV-2')
+
+    first = _export(client)
+    second = _export(client)
+
+    assert len(inline_renders) == 2
+    for name in first.namelist():
+        assert second.read(name) == first.read(name)
@@ -0,0 +1,62 @@
+import pytest
+
+from app.extensions import db
+from app.models import Company
+from app.services import dashboard_stats
+from app.services.dashboard_stats import DashboardStatsService
+
+
+@pytest.fixture(autouse=True)
+def computes(monkeypatch):
+    """Fresh per-process cache (ids and versions repeat across test databases); counts compute() calls."""
+    monkeypatch.setattr(dashboard_stats, '_cache', {})
+    calls = []
+    compute = DashboardStatsService.compute
+
+    def counted(company_id):
+        calls.append(company_id)
+        return compute(company_id)
+
+    monkeypatch.setattr(DashboardStatsService, 'compute', staticmethod(counted))
+    return calls
+
+
+def test_summary_counts_and_nets_credit_notes(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form('draft'))
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/credit-note/create', data=invoice_form(invoice_number='Auto or Manual'))
+
+    summary = DashboardStatsService.get_summary(company.id)
+
+    assert (summary['total'], summary['drafts'], summary['sent']) == (3, 1, 2)
+    assert summary['by_type']['CREDIT_NOTE']['count'] == 1
+    gross = summary['by_type']['INVOICE']['total_gross'] / 2
+    assert summary['net_revenue'] == pytest.approx(gross)
+
+
+def test_summary_is_cached_until_an_invoice_is_written(client, company, invoice_form, computes):
+    client.post('/invoices/create', data=invoice_form('draft'))
+    client.post('/invoices/create', data=invoice_form('draft'))
+    client.get('/invoices/')
+    client.get('/invoices/')
+    assert len(computes) == 1
+
+    client.post('/invoices/edit/2', data=invoice_form())
+    assert DashboardStatsService.get_summary(company.id)['sent'] == 1
+    assert len(computes) == 2
+
+    client.get('/invoices/delete/1')
+    assert DashboardStatsService.get_summary(company.id)['total'] == 1
+    assert len(computes) == 3
+
+
+def test_a_write_in_another_process_is_seen(client, company, invoice_form, computes):
+    client.post('/invoices/create', data=invoice_form())
+    assert DashboardStatsService.get_summary(company.id)['sent'] == 1
+
+    # What another worker's invalidate() leaves behind: only the version in the database moves
+    db.session.execute(db.update(Company).values(stats_version=Company.stats_version + 1))
+    db.session.commit()
+
+    DashboardStatsService.get_summary(company.id)
+    assert len(computes) == 2
@@ -0,0 +1,90 @@
+import io
+
+import pydyf
+
+from app.extensions import db
+from app.services.facturx_service import embed_facturx
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.pdf_service import PdfService
+
+XML = b'<?xml version="1.0" encoding="UTF-8"?><rsm:CrossIndustryInvoice/>'
+XMP = (b'<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+       b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+       b'<rdf:Description rdf:about="" xmlns:pdfaid="http://www.aiim.org/pdfa/ns/id/">'
+       b'<pdfaid:part>3</pdfaid:part><pdfaid:conformance>B</pdfaid:conformance></rdf:Description>'
+       b'</rdf:RDF></x:xmpmeta><?xpacket end="r"?>')
+
+
+def _pdf_a3():
+    # What WeasyPrint hands the finisher for a pdf/a-3b render: a pydyf
+    # document whose catalog points at an XMP metadata stream
+    pdf = pydyf.PDF()
+    metadata = pydyf.Stream([XMP], extra={'Type': '/Metadata', 'Subtype': '/XML'})
+    pdf.add_object(metadata)
+    pdf.catalog['Metadata'] = metadata.reference
+    return pdf, metadata
+
+
+def test_xml_is_attached_as_the_associated_file():
+    pdf, _ = _pdf_a3()
+
+    embed_facturx(pdf, XML)
+
+    filespec = pdf.objects[int(pdf.catalog['AF'][0].split()[0])]
+    assert filespec['AFRelationship'] == '/Data'
+    embedded = pdf.objects[int(filespec['EF']['F'].split()[0])]
+    assert b''.join(embedded.stream) == XML
+    assert embedded.extra['Params']['Size'] == len(XML)
+    names = pdf.catalog['Names']['EmbeddedFiles']['Names']
+    assert names[1] == filespec.reference
+
+    out = io.BytesIO()
+    pdf.write(out)
+    assert b'(factur-x.xml)' in out.getvalue()
+    assert XML in out.getvalue()
+
+
+def test_xmp_gets_the_factur_x_properties():
+    pdf, metadata = _pdf_a3()
+
+    embed_facturx(pdf, XML, profile='EN16931')
+
+    packet = b''.join(metadata.stream)
+    assert b'<fx:DocumentFileName>factur-x.xml</fx:DocumentFileName>' in packet
+    assert b'<fx:ConformanceLevel>EN 16931</fx:ConformanceLevel>' in packet
+    assert b'<pdfaSchema:prefix>fx</pdfaSchema:prefix>' in packet
+    # Added inside rdf:RDF, next to the PDF/A identification
+    assert packet.index(b'<fx:DocumentType>') < packet.index(b'</rdf:RDF>')
+    assert b'<pdfaid:part>3</pdfaid:part>' in packet
+
+
+def test_index_hides_factur_x_for_facturae_companies(client, company, make_invoice):
+    make_invoice()
+    assert b'Download Factur-X' in client.get('/invoices/').data
+
+    company.einvoice_format = 'FACTURAE'
+    db.session.commit()
+    assert b'Download Factur-X' not in client.get('/invoices/').data
+    assert client.get('/invoices/facturx/1').status_code == 404
+
+
+def test_route_renders_each_profile_once_with_its_xml(client, make_invoice, monkeypatch):
+    renders = []
+
+    def html_to_pdf(html, facturx=None):
+        renders.append(facturx)
+        return f'%PDF-1.7 facturx {len(renders)}'.encode()
+
+    monkeypatch.setattr(PdfService, 'html_to_pdf', staticmethod(html_to_pdf))
+    invoice = make_invoice()
+
+    first = client.get('/invoices/facturx/1')
+    again = client.get('/invoices/facturx/1')
+    basic = client.get('/invoices/facturx/1?profile=BASIC')
+
+    assert first.status_code == again.status_code == basic.status_code == 200
+    assert first.data == again.data == b'%PDF-1.7 facturx 1'
+    assert basic.data == b'%PDF-1.7 facturx 2'
+    assert [r['profile'] for r in renders] == ['EN16931', 'BASIC']
+    assert renders[1]['xml'] == FranceXMLGenerator.build_invoice_xml(invoice, profile='BASIC').encode('utf-8')
+    assert client.get('/invoices/facturx/1?profile=FULL').status_code == 400
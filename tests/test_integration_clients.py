@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.models.integration_log import IntegrationLog
+from app.services import integration_clients
+from app.services.integration_clients import FrancePDPClient, SpainFaceB2BClient
+from app.services.submission_queue import SubmissionService
+from benchmarks.pdp_standin import StandInPlatform, start
+
+# The real methods, before the autouse fake platform replaces them
+SEND_INVOICE = {cls: cls.send_invoice for cls in (FrancePDPClient, SpainFaceB2BClient)}
+
+
+@pytest.fixture
+def standin(app, monkeypatch):
+    """The stand-in platform on its own event loop thread, wired in as PDP_BASE_URL."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    platform = StandInPlatform(latency=0)
+    runner, base_url = asyncio.run_coroutine_threadsafe(start(platform), loop).result()
+    for cls, send_invoice in SEND_INVOICE.items():
+        monkeypatch.setattr(cls, 'send_invoice', send_invoice)
+    app.config.update(PDP_BASE_URL=base_url, FACEB2B_BASE_URL=base_url)
+    yield platform
+    integration_clients.close_shared_clients()
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_single_sends_reuse_one_connection(standin, make_invoice):
+    invoices = [make_invoice(f'INV-{n}') for n in range(3)]
+
+    jobs = [SubmissionService.enqueue(invoice.id) for invoice in invoices]
+
+    assert [job.result['success'] for job in jobs] == [True] * 3
+    assert [log.external_id[:8] for log in IntegrationLog.query] == ['STANDIN-'] * 3
+    assert standin.accepted == 3
+    assert len(standin.connections) == 1
+
+
+def test_clients_with_other_settings_are_not_shared(standin, app):
+    FrancePDPClient.from_config(app.config).send_invoice('<a/>')
+    SpainFaceB2BClient.from_config(app.config).send_invoice('<b/>')
+    FrancePDPClient.from_config(app.config).send_invoice('<c/>')
+
+    assert standin.accepted == 3
+    assert len(integration_clients._shared_clients) == 2
+    assert len(standin.connections) == 2
+
+
+def test_rejection_through_the_shared_client(standin, app):
+    result = FrancePDPClient.from_config(app.config).send_invoice('<REJECT/>')
+
+    assert result['success'] is False
+    assert result['retryable'] is False
+    assert result['error_code'] == 'SCHEMA'
+
+
+def test_closed_clients_are_reopened(standin, app):
+    client = FrancePDPClient.from_config(app.config)
+    client.send_invoice('<a/>')
+    integration_clients.close_shared_clients()
+
+    assert client.send_invoice('<b/>')['success'] is True
+    assert len(standin.connections) == 2
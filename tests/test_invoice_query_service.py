@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from app.extensions import db
+from app.models import Invoice
+from app.models.invoice import InvoiceStatus
+from app.services.invoice_query_service import InvoiceQueryService, MAX_PAGE_SIZE
+
+
+def _invoices(make_invoice, count, created_at=None, status=InvoiceStatus.SENT):
+    first = Invoice.query.count()
+    invoices = [make_invoice(f'INV-{first + n}', lines=0, status=status) for n in range(count)]
+    if created_at:
+        # Same timestamp for all: pages must split the tie on id
+        db.session.execute(db.update(Invoice).where(Invoice.id.in_([inv.id for inv in invoices]))
+                           .values(created_at=created_at))
+        db.session.commit()
+    return [inv.id for inv in invoices]
+
+
+def _walk(client, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, cursor=cursor) if cursor else params
+        body = client.get('/invoices/api/list', query_string=query).get_json()
+        ids += [item['id'] for item in body['items']]
+        pages += 1
+        cursor = body['next_cursor']
+        if not cursor:
+            return ids, pages
+
+
+def test_pages_split_ties_on_created_at_without_gaps(client, make_invoice):
+    ids = _invoices(make_invoice, 7, created_at=datetime(2026, 3, 1, 12))
+
+    walked, pages = _walk(client, limit=3)
+
+    assert walked == sorted(ids, reverse=True)
+    assert pages == 3
+
+
+def test_full_last_page_has_no_next_cursor(client, make_invoice):
+    _invoices(make_invoice, 4, created_at=datetime(2026, 3, 1, 12))
+
+    walked, pages = _walk(client, limit=2)
+
+    assert len(walked) == 4
+    assert pages == 2
+
+
+def test_newest_first_across_timestamps(client, make_invoice):
+    ids = _invoices(make_invoice, 3)
+    for invoice_id, day in zip(ids, (3, 1, 2)):
+        db.session.get(Invoice, invoice_id).created_at = datetime(2026, 3, day)
+    db.session.commit()
+
+    walked, _ = _walk(client, limit=1)
+
+    assert walked == [ids[0], ids[2], ids[1]]
+
+
+def test_filters_apply_on_every_page(client, make_invoice):
+    _invoices(make_invoice, 3, status=InvoiceStatus.DRAFT)
+    sent = _invoices(make_invoice, 3)
+
+    walked, _ = _walk(client, status='SENT', limit=2)
+
+    assert sorted(walked) == sent
+
+
+def test_bad_cursor_and_limits(app, make_invoice):
+    _invoices(make_invoice, 3)
+
+    rows, next_cursor = InvoiceQueryService.list_page(cursor='not-a-cursor', limit=-5)
+    assert len(rows) == 1 and next_cursor
+    rows, next_cursor = InvoiceQueryService.list_page(limit=MAX_PAGE_SIZE * 10)
+    assert len(rows) == 3 and next_cursor is None
@@ -0,0 +1,124 @@
+from decimal import Decimal
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.extensions import db
+from app.models import Company, InvoiceLine
+from app.models.product import Product
+from app.services.line_item_service import LineItemService
+
+
+def _product(company_id, name):
+    product = Product(company_id=company_id, name=name, unit_price=10, vat_rate=20)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+def _form(*product_ids):
+    form = MultiDict()
+    for i, product_id in enumerate(product_ids):
+        form[f'lines[{i}][product_id]'] = product_id
+        form[f'lines[{i}][desc]'] = f'item {i}'
+        form[f'lines[{i}][qty]'] = '1'
+        form[f'lines[{i}][rate]'] = '10'
+    return form
+
+
+def test_only_the_companys_products_are_kept(company):
+    other = Company(name='Other', merchant_id='2')
+    db.session.add(other)
+    db.session.commit()
+    own = _product(company.id, 'Widget')
+    foreign = _product(other.id, 'Gadget')
+
+    lines = LineItemService.parse_form(_form(str(own), str(foreign), '999', 'abc', ''), company.id)
+
+    assert [line['product_id'] for line in lines] == [own, None, None, None, None]
+    assert [line['description'] for line in lines] == ['item 0', 'item 1', 'item 2', 'item 3', 'item 4']
+
+
+def test_products_are_resolved_in_one_query(app, company):
+    company_id = company.id
+    ids = [_product(company_id, f'P{n}') for n in range(5)]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    db.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        lines = LineItemService.parse_form(_form(*map(str, ids + ids)), company_id)
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert [line['product_id'] for line in lines] == ids + ids
+    assert len(statements) == 1
+
+
+def test_saved_invoice_drops_unknown_products(client, company, invoice_form):
+    own = _product(company.id, 'Widget')
+
+    client.post('/invoices/create', data=invoice_form(**{'lines[0][product_id]': str(own),
+                                                         'lines[1][product_id]': '424242'}))
+
+    assert [line.product_id for line in InvoiceLine.query.order_by(InvoiceLine.id)] == [own, None]
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    """(inserted, updated, deleted) of every sync_lines call."""
+    counts = []
+    sync_lines = LineItemService.sync_lines
+
+    def counted(invoice_id, lines):
+        counts.append(sync_lines(invoice_id, lines))
+        return counts[-1]
+
+    monkeypatch.setattr(LineItemService, 'sync_lines', staticmethod(counted))
+    return counts
+
+
+def _stored(invoice_id=1):
+    db.session.expire_all()
+    return InvoiceLine.query.filter_by(invoice_id=invoice_id).order_by(InvoiceLine.id).all()
+
+
+def test_edit_writes_only_the_changed_lines(client, invoice_form, syncs):
+    client.post('/invoices/create', data=invoice_form('draft', **{
+        'lines[2][desc]': 'Travel', 'lines[2][qty]': '1', 'lines[2][rate]': '80', 'lines[2][tax]': '20'}))
+    consulting, books, _ = _stored()
+
+    # Books gets a new quantity, Travel is removed, Hosting is added
+    client.post('/invoices/edit/1', data=invoice_form('draft', **{
+        'lines[0][id]': str(consulting.id),
+        'lines[1][id]': str(books.id), 'lines[1][qty]': '4',
+        'lines[2][desc]': 'Hosting', 'lines[2][qty]': '1', 'lines[2][rate]': '10', 'lines[2][tax]': '20'}))
+
+    assert syncs == [(1, 1, 1)]
+    lines = _stored()
+    assert [line.description for line in lines] == ['Consulting', 'Books', 'Hosting']
+    assert [line.id for line in lines[:2]] == [consulting.id, books.id]
+    assert lines[1].quantity == Decimal('4')
+
+
+def test_resaving_unchanged_lines_writes_nothing(client, invoice_form, syncs):
+    client.post('/invoices/create', data=invoice_form('draft'))
+    ids = {f'lines[{i}][id]': str(line.id) for i, line in enumerate(_stored())}
+
+    client.post('/invoices/edit/1', data=invoice_form('draft', **ids))
+
+    assert syncs == [(0, 0, 0)]
+
+
+def test_ids_of_another_invoice_are_inserted_not_moved(client, invoice_form, syncs):
+    client.post('/invoices/create', data=invoice_form('draft'))
+    client.post('/invoices/create', data=invoice_form('draft'))
+    foreign = _stored(2)
+
+    client.post('/invoices/edit/1', data=invoice_form('draft', **{
+        f'lines[{i}][id]': str(line.id) for i, line in enumerate(foreign)}))
+
+    assert syncs == [(2, 0, 2)]
+    assert [line.id for line in _stored(2)] == [line.id for line in foreign]
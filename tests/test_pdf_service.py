@@ -0,0 +1,95 @@
+import os
+
+from app.extensions import db
+from app.models import Company, Invoice
+from app.services import pdf_render_pool, pdf_service
+from app.services.pdf_service import PdfService
+
+
+def _fingerprint(invoice_id):
+    db.session.expire_all()
+    return PdfService.fingerprint(db.session.get(Invoice, invoice_id), Company.query.first())
+
+
+def test_saving_one_invoice_keeps_the_others_fingerprint(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/create', data=invoice_form())
+    before = _fingerprint(1)
+    stats_version = company.stats_version
+
+    client.post('/invoices/edit/2', data=invoice_form(**{'lines[0][qty]': '3'}))
+
+    db.session.refresh(company)
+    assert company.stats_version > stats_version
+    assert _fingerprint(1) == before
+
+
+def test_company_details_change_the_fingerprint(client, company, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    before = _fingerprint(1)
+
+    company.vat_number = 'FR99999999999'
+    db.session.commit()
+
+    assert _fingerprint(1) != before
+
+
+def test_pdf_is_rendered_once_then_served_from_the_cache(client, invoice_form, renderer):
+    client.post('/invoices/create', data=invoice_form())
+
+    first = client.get('/invoices/pdf/1')
+    second = client.get('/invoices/pdf/1')
+
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data == b'%PDF-1.7 render 1'
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert len(renderer) == 1
+
+
+def test_matching_etag_is_not_modified(client, invoice_form, renderer):
+    client.post('/invoices/create', data=invoice_form())
+    etag = client.get('/invoices/pdf/1').headers['ETag']
+
+    response = client.get('/invoices/pdf/1', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert len(renderer) == 1
+
+
+def test_editing_the_invoice_renders_a_new_pdf(client, invoice_form, renderer):
+    client.post('/invoices/create', data=invoice_form())
+    first = client.get('/invoices/pdf/1')
+
+    client.post('/invoices/edit/1', data=invoice_form(**{'lines[0][qty]': '3'}))
+    second = client.get('/invoices/pdf/1')
+
+    assert second.data == b'%PDF-1.7 render 2'
+    assert second.headers['ETag'] != first.headers['ETag']
+    # The old render went with invalidate(); only the current one is kept
+    digest = second.headers['ETag'].strip('"')
+    assert os.listdir(os.path.dirname(PdfService.cache_path(1, digest))) == [f'{digest}.pdf']
+
+
+def test_inline_render_uses_the_pools_stylesheets(app, monkeypatch):
+    loads, writes = [], []
+
+    def init_worker(paths):
+        loads.append(paths)
+        pdf_render_pool._worker_state.update(engine='weasyprint', stylesheets=['parsed css'], font_config='fonts')
+
+    def write_pdf(html, base_url=None, facturx=None, **options):
+        writes.append((base_url, options))
+        return b'%PDF-1.7 inline'
+
+    monkeypatch.setattr(pdf_render_pool, '_worker_state', {})
+    monkeypatch.setattr(pdf_render_pool, '_init_worker', init_worker)
+    monkeypatch.setattr(pdf_service, 'write_pdf', write_pdf)
+
+    with app.test_request_context('/invoices/pdf/1', base_url='http://invoices.example'):
+        assert PdfService.html_to_pdf_inline('<p>1</p>') == b'%PDF-1.7 inline'
+        assert PdfService.html_to_pdf_inline('<p>2</p>') == b'%PDF-1.7 inline'
+
+    # Parsed once per process, with the stylesheet list the pool workers get
+    assert loads == [pdf_render_pool.stylesheet_paths(app)]
+    assert loads[0][0].endswith(os.path.join('static', 'css', 'invoice.css')) and os.path.exists(loads[0][0])
+    assert writes == [('http://invoices.example/', {'stylesheets': ['parsed css'], 'font_config': 'fonts'})] * 2
@@ -0,0 +1,79 @@
+import csv
+import io
+from datetime import date
+
+from openpyxl import load_workbook
+
+from app.extensions import db
+from app.services import report_export_service
+from app.services.report_export_service import InvoiceReportService
+
+COLUMNS = ['invoice_number', 'invoice_date', 'customer_name', 'status', 'total_gross']
+
+
+def _invoices(make_invoice):
+    # Created out of date order: the report sorts by (invoice_date, id)
+    for number, day in (('INV-3', 20), ('INV-1', 5), ('INV-2', 5), ('INV-4', 28)):
+        make_invoice(number).invoice_date = date(2026, 1, day)
+    db.session.commit()
+
+
+def _export(client, action, **fields):
+    data = {'action': action, 'columns': COLUMNS, **fields}
+    return client.post('/invoices/report', data=data)
+
+
+def test_csv_has_a_bom_and_every_row_once_across_pages(client, company, make_invoice, monkeypatch):
+    monkeypatch.setattr(report_export_service, 'FETCH_BATCH', 2)
+    monkeypatch.setattr(report_export_service, 'CSV_FLUSH_ROWS', 3)
+    _invoices(make_invoice)
+
+    body = _export(client, 'export_csv').data.decode('utf-8')
+
+    assert body.startswith('\ufeff')
+    rows = list(csv.reader(io.StringIO(body[1:])))
+    assert rows[0] == ['Invoice Number', 'Invoice Date', 'Customer Name', 'Status', 'Total Gross']
+    assert rows[1] == ['INV-1', '2026-01-05', 'Bob SARL', 'SENT', '120.0']
+    assert [row[0] for row in rows[1:]] == ['INV-1', 'INV-2', 'INV-3', 'INV-4']
+
+
+def test_csv_applies_the_period_filter(client, company, make_invoice):
+    _invoices(make_invoice)
+
+    body = _export(client, 'export_csv', filter_type='period', start_date='2026-01-06',
+                   end_date='2026-01-20').data.decode('utf-8')
+
+    assert [row[0] for row in csv.reader(io.StringIO(body[1:]))][1:] == ['INV-3']
+
+
+def test_xlsx_starts_a_new_sheet_at_the_row_limit(client, company, make_invoice, monkeypatch):
+    monkeypatch.setattr(report_export_service, 'XLSX_MAX_ROWS', 3)
+    _invoices(make_invoice)
+
+    workbook = load_workbook(io.BytesIO(_export(client, 'export').data), read_only=True)
+
+    assert workbook.sheetnames == ['Invoices', 'Invoices 2']
+    first, second = ([list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook.worksheets)
+    assert first[0] == second[0] == ['Invoice Number', 'Invoice Date', 'Customer Name', 'Status', 'Total Gross']
+    assert [row[0] for row in first[1:] + second[1:]] == ['INV-1', 'INV-2', 'INV-3', 'INV-4']
+    assert first[1][4] == 120
+
+
+def test_empty_xlsx_still_has_the_header(app, company):
+    workbook = load_workbook(InvoiceReportService.write_xlsx(company.id, {}, ['invoice_number']), read_only=True)
+
+    assert [list(row) for row in workbook.active.iter_rows(values_only=True)] == [['Invoice Number']]
+
+
+def test_preview_counts_rows_beyond_the_limit(app, company, make_invoice):
+    _invoices(make_invoice)
+
+    rows, total = InvoiceReportService.preview(company.id, {}, ['invoice_number'], limit=2)
+
+    assert rows == [{'invoice_number': 'INV-1'}, {'invoice_number': 'INV-2'}]
+    assert total == 4
+
+
+def test_unknown_columns_are_ignored():
+    assert InvoiceReportService.columns(['total_net', 'password', 'invoice_number']) == ['total_net', 'invoice_number']
+    assert InvoiceReportService.columns(['password']) == ['invoice_number', 'invoice_date', 'total_gross']
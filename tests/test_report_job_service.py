@@ -0,0 +1,119 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.extensions import db
+from app.models.report_job import ReportJob
+from app.services import report_job_service
+from app.services.report_export_service import InvoiceReportService
+from app.services.report_job_service import ReportJobService
+from app.services.submission_queue import InProcessQueue
+
+
+@pytest.fixture
+def queue(app):
+    """Jobs wait for run_pending(), like on a busy rq worker."""
+    queue = InProcessQueue(name=report_job_service.REPORT_QUEUE_NAME, is_async=True)
+    app.extensions['report_queue'] = queue
+    return queue
+
+
+def _form(**filters):
+    return MultiDict([('columns', 'invoice_number'), ('columns', 'total_gross'), *filters.items()])
+
+
+def _reload(job):
+    db.session.expire_all()
+    return db.session.get(ReportJob, job.id)
+
+
+def test_identical_requests_share_one_job(company, make_invoice, queue):
+    make_invoice()
+    first = ReportJobService.submit(company.id, 'csv', _form(start_date='2026-01-01', customer_id=''))
+    second = ReportJobService.submit(company.id, 'csv', _form(start_date='2026-01-01'))
+    other_month = ReportJobService.submit(company.id, 'csv', _form(start_date='2026-02-01'))
+    other_format = ReportJobService.submit(company.id, 'xlsx', _form(start_date='2026-01-01'))
+
+    assert second.id == first.id
+    assert len({first.id, other_month.id, other_format.id}) == 3
+    assert len(queue.pending) == 3
+
+    queue.run_pending()
+    # The same job enqueued twice is claimed once
+    assert ReportJobService.run(first.id) is None
+    state = ReportJobService.status(_reload(first))
+    assert state['status'] == 'FINISHED' and state['ready'] and state['percent'] == 100
+    with open(ReportJobService.result_path(_reload(first)), encoding='utf-8-sig') as f:
+        assert f.read().splitlines() == ['Invoice Number,Total Gross', 'INV-1,120.0']
+
+
+def test_finished_request_is_rebuilt_for_the_next_identical_request(company, make_invoice, queue):
+    make_invoice('INV-1')
+    job = ReportJobService.submit(company.id, 'csv', _form())
+    queue.run_pending()
+    make_invoice('INV-2')
+
+    again = ReportJobService.submit(company.id, 'csv', _form())
+    assert again.id == job.id and again.status == report_job_service.QUEUED
+    queue.run_pending()
+
+    assert _reload(job).rows_done == 2
+
+
+def test_expired_result_is_gone_and_pruned(client, company, make_invoice, queue):
+    make_invoice()
+    job = ReportJobService.submit(company.id, 'csv', _form())
+    queue.run_pending()
+    assert client.get(f'/invoices/report/jobs/{job.id}/download').status_code == 200
+    path = ReportJobService.result_path(_reload(job))
+
+    _reload(job).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert client.get(f'/invoices/report/jobs/{job.id}/status').get_json()['status'] == 'EXPIRED'
+    assert client.get(f'/invoices/report/jobs/{job.id}/download').status_code == 410
+    assert ReportJobService.prune() == 1
+    assert not os.path.exists(path)
+    assert db.session.get(ReportJob, job.id) is None
+
+
+def test_stalled_job_is_reported_failed_and_restarted(app, company, queue):
+    job = ReportJobService.submit(company.id, 'csv', _form())
+    timeout = app.config.get('REPORT_JOB_TIMEOUT', 3600)
+    _reload(job).updated_at = datetime.utcnow() - timedelta(seconds=timeout + 1)
+    db.session.commit()
+
+    assert ReportJobService.status(_reload(job))['status'] == report_job_service.FAILED
+    ReportJobService.submit(company.id, 'csv', _form())
+    assert len(queue.pending) == 2
+    assert ReportJobService.status(_reload(job))['status'] == report_job_service.QUEUED
+
+
+def test_failed_build_records_the_error_and_leaves_no_file(app, company, queue, monkeypatch):
+    def iter_csv(*args, **kwargs):
+        yield b'partial'
+        raise OSError('disk full')
+
+    monkeypatch.setattr(InvoiceReportService, 'iter_csv', staticmethod(iter_csv))
+    job = ReportJobService.submit(company.id, 'csv', _form())
+    queue.run_pending()
+
+    state = ReportJobService.status(_reload(job))
+    assert state['status'] == report_job_service.FAILED
+    assert state['error'] == 'OSError: disk full'
+    assert os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], report_job_service.RESULT_DIRNAME, str(job.id))) == []
+
+
+def test_background_export_redirects_to_the_job_page(client, company, make_invoice):
+    make_invoice()
+
+    response = client.post('/invoices/report', data={'action': 'export_csv', 'background': '1',
+                                                     'columns': ['invoice_number']})
+
+    assert response.status_code == 302
+    job_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    assert client.get(f'/invoices/report/jobs/{job_id}').status_code == 200
+    assert client.get(f'/invoices/report/jobs/{job_id}/download').data.decode('utf-8-sig') == \
+        'Invoice Number\r\nINV-1\r\n'
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from app.extensions import db
+from app.models import Invoice
+from app.models.customer import CustomerAddress
+from app.services.spain_xml_generator import SpainXMLGenerator
+from app.services.xml_core import InvoiceDataError
+
+
+def _xml(invoice_id):
+    db.session.expire_all()
+    return SpainXMLGenerator.build_invoice_xml(db.session.get(Invoice, invoice_id))
+
+
+def _credit_note_form(invoice_form, **fields):
+    form = invoice_form(invoice_number='Auto or Manual', **fields)
+    for key in ('lines[1][desc]', 'lines[1][qty]', 'lines[1][rate]', 'lines[1][tax]'):
+        form.pop(key)
+    return form
+
+
+def test_province_comes_from_the_spanish_postcode(client, facturae, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+
+    provinces = re.findall('<Province>([^<]*)</Province>', _xml(1))
+
+    # Seller in Spain: from 08xxx; foreign buyer: no region stored, the town
+    assert provinces == ['Barcelona', 'Lyon']
+
+
+def test_party_without_vat_number_or_address_is_refused(client, facturae, customer, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    customer.vat_number = None
+    db.session.commit()
+    with pytest.raises(InvoiceDataError, match='Buyer Bob SARL: a VAT number is required'):
+        _xml(1)
+
+    customer.vat_number = 'FR40123456789'
+    CustomerAddress.query.delete()
+    db.session.commit()
+    with pytest.raises(InvoiceDataError, match='Buyer Bob SARL: an address is required'):
+        _xml(1)
+
+
+def test_unknown_spanish_postcode_is_refused(client, facturae, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    facturae.addresses[0].zip_code = '99001'
+    db.session.commit()
+
+    with pytest.raises(InvoiceDataError, match="'99001' is not a Spanish postcode"):
+        _xml(1)
+
+
+def test_credit_note_references_the_invoice_it_corrects(client, facturae, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/credit-note/create',
+                data=_credit_note_form(invoice_form, cn_mode='invoice', source_invoice_id='1'))
+
+    credit_note = db.session.get(Invoice, 2)
+    assert credit_note.original_invoice_id == 1
+    corrective = re.search('<Corrective>(.*)</Corrective>', _xml(2)).group(1)
+    assert f'<InvoiceNumber>{db.session.get(Invoice, 1).invoice_number}</InvoiceNumber>' in corrective
+
+
+def test_standalone_credit_note_is_refused(client, facturae, invoice_form):
+    client.post('/invoices/create', data=invoice_form())
+    client.post('/invoices/credit-note/create',
+                data=_credit_note_form(invoice_form, cn_mode='other', source_invoice_id='1'))
+
+    assert db.session.get(Invoice, 2).original_invoice_id is None
+    with pytest.raises(InvoiceDataError, match='needs the invoice it corrects'):
+        _xml(2)
+
+    response = client.get('/invoices/xml/2')
+    assert response.status_code == 302
+    assert response.location.endswith('/invoices/view/2')
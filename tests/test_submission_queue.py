@@ -0,0 +1,199 @@
+import pytest
+
+from app.extensions import db
+from app.models.integration_log import IntegrationLog
+from app.models.submission_ledger import SubmissionLedgerEntry
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.integration_clients import FrancePDPClient
+from app.services.submission_queue import SubmissionService, backoff_intervals, get_submission_queue
+
+
+def _log_statuses(invoice_id):
+    return [log.status_code for log in IntegrationLog.query.filter_by(invoice_id=invoice_id).order_by(IntegrationLog.id)]
+
+
+def _ledger(invoice_id):
+    return SubmissionLedgerEntry.query.filter_by(invoice_id=invoice_id).one()
+
+
+def test_backoff_intervals_double_up_to_the_cap():
+    assert backoff_intervals(5, 10, 600) == [10, 20, 40, 80]
+    assert backoff_intervals(6, 100, 300) == [100, 200, 300, 300, 300]
+    assert backoff_intervals(1, 10, 600) == []
+
+
+def test_transport_error_is_retried_with_backoff(make_invoice, platform):
+    invoice = make_invoice()
+    platform.responses = [
+        ConnectionError('connection reset'),
+        {'success': False, 'retryable': True, 'error_code': 'HTTP_503', 'message': 'Service unavailable'},
+    ]
+
+    job = SubmissionService.enqueue(invoice.id)
+
+    assert job.status == 'finished'
+    assert job.attempts == 3
+    assert job.retry_delays == [1, 2]
+    assert job.result['success'] is True
+    assert _log_statuses(invoice.id) == ['ERROR', 'ERROR', 'ACCEPTED']
+    # Every attempt carried the same idempotency key
+    assert len(set(platform.calls)) == 1
+    entry = _ledger(invoice.id)
+    assert entry.status == 'ACCEPTED'
+    assert entry.attempts == 3
+
+
+def test_transport_errors_stop_after_max_attempts(make_invoice, platform):
+    invoice = make_invoice()
+    platform.responses = [TimeoutError('platform timeout')] * 5
+
+    job = SubmissionService.enqueue(invoice.id)
+
+    assert job.status == 'failed'
+    assert job.attempts == 5
+    assert job.retry_delays == [1, 2, 4, 8]
+    assert _log_statuses(invoice.id) == ['ERROR'] * 5
+    # Outcome unknown: the next attempt may claim it at once
+    entry = _ledger(invoice.id)
+    assert entry.status == 'PENDING'
+    assert entry.claimed_at is None
+
+
+def test_rejection_is_final(make_invoice, platform):
+    invoice = make_invoice()
+    platform.responses = [{'success': False, 'error_code': 'SCHEMA', 'message': 'Invalid document'}]
+
+    job = SubmissionService.enqueue(invoice.id)
+
+    assert job.status == 'finished'
+    assert job.attempts == 1
+    assert job.retry_delays == []
+    assert job.result == {'success': False, 'message': 'Invalid document'}
+    assert _log_statuses(invoice.id) == ['REJECTED']
+    assert _ledger(invoice.id).status == 'REJECTED'
+
+    # Queued again, the same document is not sent a second time
+    again = SubmissionService.enqueue(invoice.id)
+    assert again.status == 'finished'
+    assert again.result == {'success': False, 'message': 'Already rejected', 'replayed': True}
+    assert len(platform.calls) == 1
+
+
+def test_ledger_replay_returns_the_recorded_result(make_invoice, platform):
+    invoice = make_invoice()
+    first = SubmissionService.enqueue(invoice.id)
+    assert first.result['success'] is True
+    external_id = first.result['external_id']
+
+    replay = SubmissionService.enqueue(invoice.id)
+
+    assert replay.status == 'finished'
+    assert replay.result == {'success': True, 'external_id': external_id, 'message': 'Already deposited',
+                             'replayed': True}
+    assert len(platform.calls) == 1
+    assert _log_statuses(invoice.id) == ['ACCEPTED']
+
+
+def test_changed_document_is_sent_as_a_new_version(make_invoice, platform):
+    invoice = make_invoice()
+    SubmissionService.enqueue(invoice.id)
+
+    invoice.lines[0].description = 'item 0, corrected'
+    db.session.commit()
+    job = SubmissionService.enqueue(invoice.id)
+
+    assert job.result.get('replayed') is None
+    assert len(platform.calls) == 2
+    assert platform.calls[0] != platform.calls[1]
+    assert SubmissionLedgerEntry.query.filter_by(invoice_id=invoice.id, status='ACCEPTED').count() == 2
+
+
+# ---------- Batch mode ----------
+
+@pytest.fixture
+def batch_queue(app):
+    app.config['SUBMISSION_MODE'] = 'batch'
+    return get_submission_queue(app)
+
+
+def _submit_in_batch(queue, invoices):
+    for invoice in invoices:
+        SubmissionService.enqueue(invoice.id)
+    # The first invoice scheduled a flush at the end of the batch window
+    assert [job.delay for job in queue.pending] == [30]
+    queue.run_pending()
+
+
+def test_batch_sends_buffered_invoices_together(batch_queue, make_invoice, platform):
+    invoices = [make_invoice(f'INV-{n}') for n in range(3)]
+
+    _submit_in_batch(batch_queue, invoices)
+
+    batch_jobs = [job for job in batch_queue.jobs if job.args and isinstance(job.args[0], list)]
+    assert [job.args[0] for job in batch_jobs] == [[invoice.id for invoice in invoices]]
+    assert batch_jobs[0].result == {'submitted': 3, 'retry': [], 'attempt': 1}
+    assert platform.calls == []     # one deposit, not one send per invoice
+    for invoice in invoices:
+        assert _log_statuses(invoice.id) == ['ACCEPTED']
+        assert _ledger(invoice.id).status == 'ACCEPTED'
+
+
+def test_batch_requeues_only_retryable_failures(batch_queue, make_invoice, monkeypatch):
+    invoices = [make_invoice(f'INV-{n}') for n in range(3)]
+    flaky = invoices[1].id
+    sent = []
+
+    def send_batch(client, documents, idempotency_keys=None):
+        sent.append([reference for reference, _ in documents])
+        return {reference: {'success': False, 'retryable': True, 'error_code': 'HTTP_503'}
+                if reference == flaky and len(sent) == 1 else {'success': True, 'external_id': f'FR-{reference}'}
+                for reference, _ in documents}
+
+    monkeypatch.setattr(FrancePDPClient, 'send_batch', send_batch)
+    _submit_in_batch(batch_queue, invoices)
+
+    assert sent == [[invoice.id for invoice in invoices], [flaky]]
+    retry = batch_queue.jobs[-1]
+    assert retry.args == ([flaky], 2)
+    assert retry.delay == 1     # first backoff interval
+    assert _log_statuses(flaky) == ['ERROR', 'ACCEPTED']
+    assert _log_statuses(invoices[0].id) == ['ACCEPTED']
+
+
+def test_batch_retries_an_invoice_that_failed_to_generate(batch_queue, make_invoice, monkeypatch):
+    invoices = [make_invoice(f'INV-{n}') for n in range(2)]
+    build = FranceXMLGenerator.build_invoice_xml.__func__
+    failed = []
+
+    def build_invoice_xml(cls, invoice, **options):
+        if invoice.id == invoices[0].id and not failed:
+            failed.append(invoice.id)
+            raise RuntimeError('template error')
+        return build(cls, invoice, **options)
+
+    monkeypatch.setattr(FranceXMLGenerator, 'build_invoice_xml', classmethod(build_invoice_xml))
+    _submit_in_batch(batch_queue, invoices)
+
+    assert _log_statuses(invoices[0].id) == ['ERROR', 'ACCEPTED']
+    assert _log_statuses(invoices[1].id) == ['ACCEPTED']
+
+
+def test_facturae_batch_is_not_sent_invoice_by_invoice(batch_queue, facturae, make_invoice, platform):
+    invoices = [make_invoice(f'INV-{n}') for n in range(20)]
+
+    _submit_in_batch(batch_queue, invoices)
+
+    assert platform.calls == []
+    assert {log.payload_type for log in IntegrationLog.query} == {'FACTURAE'}
+    assert IntegrationLog.query.filter_by(status_code='ACCEPTED').count() == 20
+
+
+def test_facturae_batch_does_not_retry_incomplete_invoices(batch_queue, facturae, customer, make_invoice):
+    invoice = make_invoice()
+    customer.vat_number = None
+    db.session.commit()
+
+    _submit_in_batch(batch_queue, [invoice])
+
+    assert [(log.status_code, log.error_code) for log in IntegrationLog.query] == [('ERROR', 'InvoiceDataError')]
+    assert batch_queue.jobs[-1].result['retry'] == []
@@ -0,0 +1,133 @@
+from decimal import Decimal
+
+import pytest
+
+from app.models import Invoice
+from app.services.totals_engine import TotalsEngine, to_decimal
+
+
+def _totals(*lines):
+    return TotalsEngine.compute([{'quantity': q, 'unit_price': p, 'vat_rate': r} for q, p, r in lines])
+
+
+def test_to_decimal_rounds_half_up():
+    assert to_decimal('2.345') == Decimal('2.35')
+    assert to_decimal('-2.345') == Decimal('-2.35')
+    assert to_decimal(0.125) == Decimal('0.13')
+    assert to_decimal(None) == Decimal('0.00')
+    assert to_decimal('', default='1') == Decimal('1.00')
+
+
+def test_line_net_is_rounded_half_up():
+    totals = _totals(('1.5', '0.33', '20'))     # 0.495
+    assert totals['total_net'] == Decimal('0.50')
+    assert totals['total_tax'] == Decimal('0.10')
+    assert totals['total_gross'] == Decimal('0.60')
+
+
+def test_vat_is_rounded_per_rate_not_per_line():
+    # Each line's VAT is 0.005 -> 0.01, but the rate's base is 0.10 -> 0.01
+    lines = [{'quantity': '1', 'unit_price': '0.05', 'vat_rate': '10'} for _ in range(2)]
+    totals = TotalsEngine.apply(Invoice(), lines)
+
+    assert totals['vat_breakdown'] == [
+        {'vat_rate': Decimal('10.00'), 'taxable_amount': Decimal('0.10'), 'tax_amount': Decimal('0.01')}
+    ]
+    assert totals['total_tax'] == Decimal('0.01')
+    assert [line['vat_amount'] for line in lines] == [Decimal('0.01'), Decimal('0.01')]
+    assert [line['line_total'] for line in lines] == [Decimal('0.06'), Decimal('0.06')]
+
+
+def test_breakdown_groups_rates_in_ascending_order():
+    totals = _totals(('2', '50', '20'), ('1', '33.33', '5.5'), ('3', '10', '20'))
+    assert [(b['vat_rate'], b['taxable_amount'], b['tax_amount']) for b in totals['vat_breakdown']] == [
+        (Decimal('5.50'), Decimal('33.33'), Decimal('1.83')),
+        (Decimal('20.00'), Decimal('130.00'), Decimal('26.00')),
+    ]
+    assert totals['total_gross'] == Decimal('191.16')
+
+
+def test_more_than_two_decimals_are_rounded_exactly():
+    # 1.005 is 1.00499999... as a float: it must still round to 1.01
+    assert _totals(('1', '1.005', '0'))['total_net'] == Decimal('1.01')
+    assert _totals(('1', '12345678.905', '0'))['total_net'] == Decimal('12345678.91')
+    assert _totals(('1', '0.004999999999999999999', '0'))['total_net'] == Decimal('0.00')
+
+
+def test_largest_column_values_are_exact():
+    totals = _totals(('1', '99999999.99', '0'), ('-1', '99999999.98', '0'))
+    assert totals['total_net'] == Decimal('0.01')
+    assert _totals(('1', '50', '999.99'))['total_tax'] == Decimal('500.00')  # 499.995
+
+
+def test_apply_writes_header_totals():
+    invoice = Invoice()
+    TotalsEngine.apply(invoice, [{'quantity': '2', 'unit_price': '25', 'vat_rate': '20'}])
+    assert (invoice.total_net, invoice.total_tax, invoice.total_gross) == (
+        Decimal('50.00'), Decimal('10.00'), Decimal('60.00'))
+
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'NaN', 'inf', '-Infinity', '1e999999999'])
+def test_invalid_amounts_raise(value):
+    with pytest.raises(ValueError, match='Invalid amount'):
+        _totals(('1', value, '20'))
+
+
+@pytest.mark.parametrize('line', [
+    ('1', '100000000', '20'),
+    ('1', '-1e25', '20'),
+    ('123456789012345.67', '1', '20'),
+    ('1', '10', '1000'),
+])
+def test_inputs_beyond_the_columns_raise(line):
+    with pytest.raises(ValueError, match='out of range'):
+        _totals(line)
+
+
+def test_line_total_beyond_the_column_raises():
+    # Each input fits Numeric(10, 2), their product does not (nor int64)
+    with pytest.raises(ValueError, match=r'Line 2 total .* out of range \(max 99999999.99\)'):
+        _totals(('1', '1', '0'), ('99999999.99', '99999999.99', '20'))
+    with pytest.raises(ValueError, match='Line 1 total 108000000.00 out of range'):
+        _totals(('1', '90000000', '20'))
+
+
+def test_invoice_total_beyond_the_column_raises():
+    with pytest.raises(ValueError, match='Invoice net total 120000000.00 out of range'):
+        _totals(('1', '60000000', '0'), ('1', '60000000', '0'))
+
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'inf'])
+def test_to_decimal_rejects_invalid_input(value):
+    with pytest.raises(ValueError, match='Invalid amount'):
+        to_decimal(value)
+
+
+def test_invalid_line_is_a_form_error(client, customer):
+    form = {
+        'customer_id': str(customer.id), 'invoice_date': '2026-03-10', 'save_type': 'send',
+        'lines[0][desc]': 'Consulting', 'lines[0][qty]': '2', 'lines[0][rate]': 'nan', 'lines[0][tax]': '20',
+    }
+
+    response = client.post('/invoices/create', data=form)
+
+    assert response.status_code == 302
+    assert response.location.endswith('/invoices/create')
+    assert Invoice.query.count() == 0
+    with client.session_transaction() as session:
+        assert session['_flashes'] == [('danger', "Invalid amount: 'nan'. Please correct the line items.")]
+
+
+def test_total_beyond_the_column_is_a_form_error(client, customer):
+    form = {
+        'customer_id': str(customer.id), 'invoice_date': '2026-03-10', 'save_type': 'send',
+        'lines[0][desc]': 'Plant', 'lines[0][qty]': '2', 'lines[0][rate]': '60000000', 'lines[0][tax]': '0',
+    }
+
+    response = client.post('/invoices/create', data=form)
+
+    assert response.status_code == 302
+    assert Invoice.query.count() == 0
+    with client.session_transaction() as session:
+        assert session['_flashes'] == [('danger', 'Line 1 total 120000000.00 out of range (max 99999999.99). '
+                                                  'Please correct the line items.')]
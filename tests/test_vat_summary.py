@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+import pytest
+
+from app.extensions import db
+from app.models import Invoice
+from app.models.vat_summary import InvoiceVatTotal, VatPeriodSummary
+from app.services.totals_engine import TotalsEngine
+from app.services.vat_summary_service import VatSummaryService
+
+
+def _summary():
+    rows = VatPeriodSummary.query.order_by(
+        VatPeriodSummary.company_id, VatPeriodSummary.period, VatPeriodSummary.vat_rate,
+        VatPeriodSummary.document_type
+    )
+    return [(r.company_id, r.period, r.vat_rate, r.document_type, r.taxable_amount, r.tax_amount, r.invoice_count)
+            for r in rows]
+
+
+def _invoice_totals():
+    rows = InvoiceVatTotal.query.order_by(InvoiceVatTotal.invoice_id, InvoiceVatTotal.vat_rate)
+    return [(r.invoice_id, r.period, r.document_type, r.vat_rate, r.taxable_amount, r.tax_amount) for r in rows]
+
+
+def _form(customer, save_type, **fields):
+    form = {
+        'customer_id': str(customer.id), 'invoice_date': '2026-03-10', 'save_type': save_type,
+        'lines[0][desc]': 'Consulting', 'lines[0][qty]': '2', 'lines[0][rate]': '50', 'lines[0][tax]': '20',
+        'lines[1][desc]': 'Books', 'lines[1][qty]': '1', 'lines[1][rate]': '33.33', 'lines[1][tax]': '5.5',
+    }
+    form.update(fields)
+    return form
+
+
+def test_incremental_summary_matches_rebuild(client, customer):
+    post = client.post
+    assert post('/invoices/create', data=_form(customer, 'draft')).status_code == 302
+    post('/invoices/create', data=_form(customer, 'send'))
+    post('/invoices/create', data=_form(customer, 'send', tax_point_date='2026-02-28'))
+    # Finalised invoice back to draft, draft finalised in another month with other lines
+    post('/invoices/edit/2', data=_form(customer, 'draft'))
+    post('/invoices/edit/1', data=_form(customer, 'send', invoice_date='2026-04-02', **{'lines[0][qty]': '3'}))
+    credit_note = _form(customer, 'send', invoice_number='Auto or Manual')
+    for key in ('lines[1][desc]', 'lines[1][qty]', 'lines[1][rate]', 'lines[1][tax]'):
+        credit_note.pop(key)
+    post('/invoices/credit-note/create', data=credit_note)
+    assert Invoice.query.count() == 4
+
+    incremental, totals = _summary(), _invoice_totals()
+    assert VatSummaryService.rebuild() == 4
+    assert _summary() == incremental
+    assert _invoice_totals() == totals
+
+
+
+def test_failed_rebuild_keeps_the_previous_figures(client, customer, monkeypatch):
+    client.post('/invoices/create', data=_form(customer, 'send'))
+    client.post('/invoices/create', data=_form(customer, 'send', tax_point_date='2026-02-28'))
+    summary, totals = _summary(), _invoice_totals()
+
+    def breakdown(nets):
+        raise RuntimeError('lost the connection')
+
+    monkeypatch.setattr(TotalsEngine, 'breakdown', breakdown)
+    with pytest.raises(RuntimeError):
+        VatSummaryService.rebuild()
+
+    db.session.expire_all()
+    assert _summary() == summary
+    assert _invoice_totals() == totals
+
+def test_summary_files_invoices_by_tax_point_and_deducts_credit_notes(client, company, customer):
+    client.post('/invoices/create', data=_form(customer, 'draft'))
+    client.post('/invoices/create', data=_form(customer, 'send'))
+    client.post('/invoices/create', data=_form(customer, 'send', tax_point_date='2026-02-28'))
+    credit_note = _form(customer, 'send', invoice_number='Auto or Manual')
+    for key in ('lines[1][desc]', 'lines[1][qty]', 'lines[1][rate]', 'lines[1][tax]'):
+        credit_note.pop(key)
+    client.post('/invoices/credit-note/create', data=credit_note)
+
+    declaration = {(row['period'], row['vat_rate']): row for row in VatSummaryService.declaration(company.id)}
+
+    # The draft is not declared; the credit note (one 100.00 line at 20%) is deducted
+    assert sorted(declaration) == [('2026-02', Decimal('5.50')), ('2026-02', Decimal('20.00')),
+                                   ('2026-03', Decimal('5.50')), ('2026-03', Decimal('20.00'))]
+    assert declaration[('2026-02', Decimal('20.00'))]['taxable_amount'] == Decimal('100.00')
+    assert declaration[('2026-03', Decimal('20.00'))]['taxable_amount'] == Decimal('0.00')
+    assert declaration[('2026-03', Decimal('20.00'))]['invoice_count'] == 2
+    assert declaration[('2026-03', Decimal('5.50'))]['tax_amount'] == Decimal('1.83')
+
+
+def test_deleting_a_bucket_contribution_removes_the_row(client, customer):
+    client.post('/invoices/create', data=_form(customer, 'send'))
+    assert len(_summary()) == 2
+
+    client.post('/invoices/edit/1', data=_form(customer, 'draft'))
+
+    assert _summary() == []
+    db.session.expire_all()
+    assert {row.period for row in InvoiceVatTotal.query} == {None}
@@ -0,0 +1,53 @@
+from app.extensions import db
+from app.models import Invoice
+from app.services.france_xml_generator import FranceXMLGenerator
+from app.services.spain_xml_generator import SpainXMLGenerator
+from app.services.xml_batch_service import XmlBatchService
+
+
+def _expected(invoice_ids, generator):
+    db.session.expire_all()
+    return [(i, generator.build_invoice_xml(db.session.get(Invoice, i)).encode('utf-8')) for i in invoice_ids]
+
+
+def test_batch_matches_single_invoice_output(app, make_invoice):
+    ids = [make_invoice(f'INV-{n}', lines=n).id for n in range(1, 5)]
+
+    # Caller's order, duplicates once, unknown ids skipped
+    result = list(XmlBatchService.generate([ids[2], ids[0], 999, ids[2], ids[1], ids[3]], workers=1))
+
+    assert result == _expected([ids[2], ids[0], ids[1], ids[3]], FranceXMLGenerator)
+
+
+def test_loading_does_not_grow_with_the_number_of_invoices(app, make_invoice):
+    def statements(ids):
+        seen = []
+
+        def record(conn, cursor, statement, *args):
+            seen.append(statement)
+
+        db.session.expire_all()
+        db.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            XmlBatchService.load_snapshots(ids)
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', record)
+        return len(seen)
+
+    ids = [make_invoice(f'INV-{n}').id for n in range(20)]
+
+    assert statements(ids[:2]) == statements(ids)
+
+
+def test_each_invoice_uses_its_company_format(app, facturae, make_invoice):
+    ids = [make_invoice('INV-1').id, make_invoice('INV-2').id]
+
+    assert list(XmlBatchService.generate(ids, workers=1)) == _expected(ids, SpainXMLGenerator)
+    assert list(XmlBatchService.generate(ids, workers=1, generator=FranceXMLGenerator)) == \
+        _expected(ids, FranceXMLGenerator)
+
+
+def test_process_pool_gives_the_same_output(app, make_invoice):
+    ids = [make_invoice(f'INV-{n}').id for n in range(3)]
+
+    assert list(XmlBatchService.generate(ids, workers=2)) == _expected(ids, FranceXMLGenerator)
@@ -0,0 +1,28 @@
+"""
+Submission workers: deliver queued invoices to the e-invoicing platform, and
+build background report exports (the 'reports' queue, after submissions).
+
+    python worker.py            # SUBMISSION_WORKERS processes (default 4)
+    python worker.py 8
+
+Needs Redis at REDIS_URL. Each worker process handles one job at a time, so
+the pool size is the number of concurrent submissions. Workers also run the
+rq scheduler, which releases delayed jobs (batch windows and batch retries).
+Jobs run in the worker process itself (SimpleWorker, no fork per job), so
+its platform connections stay open from one job to the next.
+"""
+import sys
+from rq import Queue, SimpleWorker
+from rq.worker_pool import WorkerPool
+from app import create_app
+from app.services.submission_queue import QUEUE_NAME, get_submission_queue
+from app.services.report_job_service import REPORT_QUEUE_NAME
+
+app = create_app()
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else app.config['SUBMISSION_WORKERS']
+    connection = get_submission_queue(app).connection
+    queues = [Queue(QUEUE_NAME, connection=connection), Queue(REPORT_QUEUE_NAME, connection=connection)]
+    pool = WorkerPool(queues, connection=connection, num_workers=workers, worker_class=SimpleWorker)
+    pool.start()